@@ -2,7 +2,7 @@ import enum
 import functools
 import os
 from pathlib import Path
-from typing import Dict, Any, Set
+from typing import Dict, Any, Set, Literal
 
 import dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -26,6 +26,87 @@ class _LoadConfig(BaseSettings):
 
     KAFKA_SERVERS: str
 
+    # Обслуживание БД: партиции messages и архивация холодных сессий
+    MAINTENANCE_ENABLED: bool = True
+    MAINTENANCE_INTERVAL_S: int = 3600
+    PARTITION_MONTHS_AHEAD: int = 2
+    ARCHIVE_AFTER_DAYS: int = 90
+    ARCHIVE_BATCH_SIZE: int = 100
+
+    # Кэш ответов LLM (точное совпадение промпта)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+    RESPONSE_CACHE_TTL_S: int = 600
+    RESPONSE_CACHE_MAX_TEMPERATURE: float = 0.0
+
+    # Idempotency-Key: окно хранения результатов и лимит ключей в памяти
+    IDEMPOTENCY_TTL_S: int = 86400
+    IDEMPOTENCY_MAX_KEYS: int = 10000
+
+    # Автоотмена генерации после ухода последнего SSE-подписчика (0 — выключено)
+    STREAM_ABANDON_GRACE_S: float = 15.0
+
+    # Admission control: лимиты незавершённых генераций и очистка StreamHub
+    ADMISSION_MAX_INFLIGHT: int = 64
+    ADMISSION_MAX_INFLIGHT_PER_USER: int = 2
+    ADMISSION_BATCH_SHARE: float = 0.5
+    ADMISSION_RETRY_AFTER_S: int = 2
+    STREAM_STALE_S: float = 300.0
+    STREAM_DONE_TTL_S: float = 300.0
+
+    # Rate limiting на пользователя: запросы и сгенерированные токены (token bucket)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REQUESTS_PER_MIN: float = 60.0
+    RATE_LIMIT_REQUESTS_BURST: float = 20.0
+    RATE_LIMIT_TOKENS_PER_MIN: float = 20000.0
+    RATE_LIMIT_TOKENS_BURST: float = 20000.0
+
+    # Ключ сообщений LLM в Kafka: request — по request_id, session — по chat_session_id (аффинити к воркеру)
+    KAFKA_KEY_STRATEGY: Literal["request", "session"] = "request"
+
+    # Системный промпт по ссылке (id шаблона из llm.prompt.templates) вместо полного текста в каждом запросе
+    PROMPT_BY_REFERENCE: bool = False
+
+    # Дельта-запросы для тёплых сессий: только сообщения с прошлого хода + ссылка на контекст воркера
+    PROMPT_DELTA_ENABLED: bool = False
+    PROMPT_DELTA_TTL_S: int = 600
+
+    # Формат value LLM-сообщений в Kafka (заголовок content-type): json или msgpack; для чанков ещё struct
+    KAFKA_WIRE_FORMAT: Literal["json", "msgpack"] = "json"
+    KAFKA_CHUNK_WIRE_FORMAT: Literal["json", "msgpack", "struct"] = "json"
+
+    # Пакетное чтение Kafka (getmany) в consumer'е стрима: максимум записей и ожидание пакета
+    KAFKA_BATCH_MAX_RECORDS: int = 500
+    KAFKA_BATCH_TIMEOUT_MS: int = 20
+
+    # Ручной коммит offset'ов стрима после обработки (at-least-once) и период пакетного коммита
+    KAFKA_STREAM_MANUAL_COMMIT: bool = True
+    KAFKA_STREAM_COMMIT_INTERVAL_MS: int = 1000
+
+    # DLQ: записи, которые не удалось разобрать/обработать, уходят в dlq_tasks; сколько раз их можно вернуть на повтор
+    KAFKA_DLQ_ENABLED: bool = True
+    KAFKA_DLQ_MAX_RETRIES: int = 3
+
+    # Сколько ждать ответ нестримингового запроса (POST /chat/sessions/{id}/completions), сек
+    COMPLETION_TIMEOUT_S: int = 120
+
+    # Аналитика использования токенов (топик analytics_tasks): пачки событий и агрегатор по часам
+    ANALYTICS_ENABLED: bool = True
+    ANALYTICS_BATCH_SIZE: int = 200
+    ANALYTICS_FLUSH_INTERVAL_MS: int = 1000
+    ANALYTICS_MAX_BUFFERED: int = 10000
+    ANALYTICS_AGGREGATOR_ENABLED: bool = True
+
+    # Эндпоинт /metrics (формат Prometheus)
+    METRICS_ENABLED: bool = True
+
+    # Профилирование медленных запросов (cProfile), по умолчанию выключено; включается и через /admin/profiling
+    PROFILING_ENABLED: bool = False
+    PROFILING_ROUTE: str = ""
+    PROFILING_SLOW_MS: int = 500
+    PROFILING_MAX_CAPTURES: int = 10
+    PROFILING_DIR: str = "profiles"
+
     # AM_IN_DOCKER_COMPOSE: bool = False
 
     EXTRA_PARAMS: Dict[str, Any] = {}  # Словарь для хранения дополнительных параметров
@@ -70,6 +151,70 @@ class Settings:
 
     __KAFKA_SERVERS: str
 
+    __MAINTENANCE_ENABLED: bool
+    __MAINTENANCE_INTERVAL_S: int
+    __PARTITION_MONTHS_AHEAD: int
+    __ARCHIVE_AFTER_DAYS: int
+    __ARCHIVE_BATCH_SIZE: int
+
+    __RESPONSE_CACHE_ENABLED: bool
+    __RESPONSE_CACHE_MAX_ENTRIES: int
+    __RESPONSE_CACHE_TTL_S: int
+    __RESPONSE_CACHE_MAX_TEMPERATURE: float
+
+    __IDEMPOTENCY_TTL_S: int
+    __IDEMPOTENCY_MAX_KEYS: int
+
+    __STREAM_ABANDON_GRACE_S: float
+
+    __ADMISSION_MAX_INFLIGHT: int
+    __ADMISSION_MAX_INFLIGHT_PER_USER: int
+    __ADMISSION_BATCH_SHARE: float
+    __ADMISSION_RETRY_AFTER_S: int
+    __STREAM_STALE_S: float
+    __STREAM_DONE_TTL_S: float
+
+    __RATE_LIMIT_ENABLED: bool
+    __RATE_LIMIT_REQUESTS_PER_MIN: float
+    __RATE_LIMIT_REQUESTS_BURST: float
+    __RATE_LIMIT_TOKENS_PER_MIN: float
+    __RATE_LIMIT_TOKENS_BURST: float
+
+    __KAFKA_KEY_STRATEGY: str
+
+    __PROMPT_BY_REFERENCE: bool
+
+    __PROMPT_DELTA_ENABLED: bool
+    __PROMPT_DELTA_TTL_S: int
+
+    __KAFKA_WIRE_FORMAT: str
+    __KAFKA_CHUNK_WIRE_FORMAT: str
+
+    __KAFKA_BATCH_MAX_RECORDS: int
+    __KAFKA_BATCH_TIMEOUT_MS: int
+
+    __KAFKA_STREAM_MANUAL_COMMIT: bool
+    __KAFKA_STREAM_COMMIT_INTERVAL_MS: int
+
+    __KAFKA_DLQ_ENABLED: bool
+    __KAFKA_DLQ_MAX_RETRIES: int
+
+    __COMPLETION_TIMEOUT_S: int
+
+    __ANALYTICS_ENABLED: bool
+    __ANALYTICS_BATCH_SIZE: int
+    __ANALYTICS_FLUSH_INTERVAL_MS: int
+    __ANALYTICS_MAX_BUFFERED: int
+    __ANALYTICS_AGGREGATOR_ENABLED: bool
+
+    __METRICS_ENABLED: bool
+
+    __PROFILING_ENABLED: bool
+    __PROFILING_ROUTE: str
+    __PROFILING_SLOW_MS: int
+    __PROFILING_MAX_CAPTURES: int
+    __PROFILING_DIR: str
+
     __loaded: bool = False
 
     @classmethod
@@ -84,6 +229,70 @@ class Settings:
 
         cls.__KAFKA_SERVERS = settings.KAFKA_SERVERS
 
+        cls.__MAINTENANCE_ENABLED = settings.MAINTENANCE_ENABLED
+        cls.__MAINTENANCE_INTERVAL_S = settings.MAINTENANCE_INTERVAL_S
+        cls.__PARTITION_MONTHS_AHEAD = settings.PARTITION_MONTHS_AHEAD
+        cls.__ARCHIVE_AFTER_DAYS = settings.ARCHIVE_AFTER_DAYS
+        cls.__ARCHIVE_BATCH_SIZE = settings.ARCHIVE_BATCH_SIZE
+
+        cls.__RESPONSE_CACHE_ENABLED = settings.RESPONSE_CACHE_ENABLED
+        cls.__RESPONSE_CACHE_MAX_ENTRIES = settings.RESPONSE_CACHE_MAX_ENTRIES
+        cls.__RESPONSE_CACHE_TTL_S = settings.RESPONSE_CACHE_TTL_S
+        cls.__RESPONSE_CACHE_MAX_TEMPERATURE = settings.RESPONSE_CACHE_MAX_TEMPERATURE
+
+        cls.__IDEMPOTENCY_TTL_S = settings.IDEMPOTENCY_TTL_S
+        cls.__IDEMPOTENCY_MAX_KEYS = settings.IDEMPOTENCY_MAX_KEYS
+
+        cls.__STREAM_ABANDON_GRACE_S = settings.STREAM_ABANDON_GRACE_S
+
+        cls.__ADMISSION_MAX_INFLIGHT = settings.ADMISSION_MAX_INFLIGHT
+        cls.__ADMISSION_MAX_INFLIGHT_PER_USER = settings.ADMISSION_MAX_INFLIGHT_PER_USER
+        cls.__ADMISSION_BATCH_SHARE = settings.ADMISSION_BATCH_SHARE
+        cls.__ADMISSION_RETRY_AFTER_S = settings.ADMISSION_RETRY_AFTER_S
+        cls.__STREAM_STALE_S = settings.STREAM_STALE_S
+        cls.__STREAM_DONE_TTL_S = settings.STREAM_DONE_TTL_S
+
+        cls.__RATE_LIMIT_ENABLED = settings.RATE_LIMIT_ENABLED
+        cls.__RATE_LIMIT_REQUESTS_PER_MIN = settings.RATE_LIMIT_REQUESTS_PER_MIN
+        cls.__RATE_LIMIT_REQUESTS_BURST = settings.RATE_LIMIT_REQUESTS_BURST
+        cls.__RATE_LIMIT_TOKENS_PER_MIN = settings.RATE_LIMIT_TOKENS_PER_MIN
+        cls.__RATE_LIMIT_TOKENS_BURST = settings.RATE_LIMIT_TOKENS_BURST
+
+        cls.__KAFKA_KEY_STRATEGY = settings.KAFKA_KEY_STRATEGY
+
+        cls.__PROMPT_BY_REFERENCE = settings.PROMPT_BY_REFERENCE
+
+        cls.__PROMPT_DELTA_ENABLED = settings.PROMPT_DELTA_ENABLED
+        cls.__PROMPT_DELTA_TTL_S = settings.PROMPT_DELTA_TTL_S
+
+        cls.__KAFKA_WIRE_FORMAT = settings.KAFKA_WIRE_FORMAT
+        cls.__KAFKA_CHUNK_WIRE_FORMAT = settings.KAFKA_CHUNK_WIRE_FORMAT
+
+        cls.__KAFKA_BATCH_MAX_RECORDS = settings.KAFKA_BATCH_MAX_RECORDS
+        cls.__KAFKA_BATCH_TIMEOUT_MS = settings.KAFKA_BATCH_TIMEOUT_MS
+
+        cls.__KAFKA_STREAM_MANUAL_COMMIT = settings.KAFKA_STREAM_MANUAL_COMMIT
+        cls.__KAFKA_STREAM_COMMIT_INTERVAL_MS = settings.KAFKA_STREAM_COMMIT_INTERVAL_MS
+
+        cls.__KAFKA_DLQ_ENABLED = settings.KAFKA_DLQ_ENABLED
+        cls.__KAFKA_DLQ_MAX_RETRIES = settings.KAFKA_DLQ_MAX_RETRIES
+
+        cls.__COMPLETION_TIMEOUT_S = settings.COMPLETION_TIMEOUT_S
+
+        cls.__ANALYTICS_ENABLED = settings.ANALYTICS_ENABLED
+        cls.__ANALYTICS_BATCH_SIZE = settings.ANALYTICS_BATCH_SIZE
+        cls.__ANALYTICS_FLUSH_INTERVAL_MS = settings.ANALYTICS_FLUSH_INTERVAL_MS
+        cls.__ANALYTICS_MAX_BUFFERED = settings.ANALYTICS_MAX_BUFFERED
+        cls.__ANALYTICS_AGGREGATOR_ENABLED = settings.ANALYTICS_AGGREGATOR_ENABLED
+
+        cls.__METRICS_ENABLED = settings.METRICS_ENABLED
+
+        cls.__PROFILING_ENABLED = settings.PROFILING_ENABLED
+        cls.__PROFILING_ROUTE = settings.PROFILING_ROUTE
+        cls.__PROFILING_SLOW_MS = settings.PROFILING_SLOW_MS
+        cls.__PROFILING_MAX_CAPTURES = settings.PROFILING_MAX_CAPTURES
+        cls.__PROFILING_DIR = settings.PROFILING_DIR
+
         cls.__EXTRA_PARAMS = settings.EXTRA_PARAMS
 
 
@@ -117,6 +326,241 @@ class Settings:
         return cls.__KAFKA_SERVERS
 
 
+    @classmethod
+    @__check_loaded
+    def MAINTENANCE_ENABLED(cls) -> bool:
+        return cls.__MAINTENANCE_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def MAINTENANCE_INTERVAL_S(cls) -> int:
+        return cls.__MAINTENANCE_INTERVAL_S
+
+    @classmethod
+    @__check_loaded
+    def PARTITION_MONTHS_AHEAD(cls) -> int:
+        return cls.__PARTITION_MONTHS_AHEAD
+
+    @classmethod
+    @__check_loaded
+    def ARCHIVE_AFTER_DAYS(cls) -> int:
+        return cls.__ARCHIVE_AFTER_DAYS
+
+    @classmethod
+    @__check_loaded
+    def ARCHIVE_BATCH_SIZE(cls) -> int:
+        return cls.__ARCHIVE_BATCH_SIZE
+
+    @classmethod
+    @__check_loaded
+    def RESPONSE_CACHE_ENABLED(cls) -> bool:
+        return cls.__RESPONSE_CACHE_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def RESPONSE_CACHE_MAX_ENTRIES(cls) -> int:
+        return cls.__RESPONSE_CACHE_MAX_ENTRIES
+
+    @classmethod
+    @__check_loaded
+    def RESPONSE_CACHE_TTL_S(cls) -> int:
+        return cls.__RESPONSE_CACHE_TTL_S
+
+    @classmethod
+    @__check_loaded
+    def RESPONSE_CACHE_MAX_TEMPERATURE(cls) -> float:
+        return cls.__RESPONSE_CACHE_MAX_TEMPERATURE
+
+    @classmethod
+    @__check_loaded
+    def IDEMPOTENCY_TTL_S(cls) -> int:
+        return cls.__IDEMPOTENCY_TTL_S
+
+    @classmethod
+    @__check_loaded
+    def IDEMPOTENCY_MAX_KEYS(cls) -> int:
+        return cls.__IDEMPOTENCY_MAX_KEYS
+
+    @classmethod
+    @__check_loaded
+    def STREAM_ABANDON_GRACE_S(cls) -> float:
+        return cls.__STREAM_ABANDON_GRACE_S
+
+    @classmethod
+    @__check_loaded
+    def ADMISSION_MAX_INFLIGHT(cls) -> int:
+        return cls.__ADMISSION_MAX_INFLIGHT
+
+    @classmethod
+    @__check_loaded
+    def ADMISSION_MAX_INFLIGHT_PER_USER(cls) -> int:
+        return cls.__ADMISSION_MAX_INFLIGHT_PER_USER
+
+    @classmethod
+    @__check_loaded
+    def ADMISSION_BATCH_SHARE(cls) -> float:
+        return cls.__ADMISSION_BATCH_SHARE
+
+    @classmethod
+    @__check_loaded
+    def ADMISSION_RETRY_AFTER_S(cls) -> int:
+        return cls.__ADMISSION_RETRY_AFTER_S
+
+    @classmethod
+    @__check_loaded
+    def STREAM_STALE_S(cls) -> float:
+        return cls.__STREAM_STALE_S
+
+    @classmethod
+    @__check_loaded
+    def STREAM_DONE_TTL_S(cls) -> float:
+        return cls.__STREAM_DONE_TTL_S
+
+    @classmethod
+    @__check_loaded
+    def RATE_LIMIT_ENABLED(cls) -> bool:
+        return cls.__RATE_LIMIT_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def RATE_LIMIT_REQUESTS_PER_MIN(cls) -> float:
+        return cls.__RATE_LIMIT_REQUESTS_PER_MIN
+
+    @classmethod
+    @__check_loaded
+    def RATE_LIMIT_REQUESTS_BURST(cls) -> float:
+        return cls.__RATE_LIMIT_REQUESTS_BURST
+
+    @classmethod
+    @__check_loaded
+    def RATE_LIMIT_TOKENS_PER_MIN(cls) -> float:
+        return cls.__RATE_LIMIT_TOKENS_PER_MIN
+
+    @classmethod
+    @__check_loaded
+    def RATE_LIMIT_TOKENS_BURST(cls) -> float:
+        return cls.__RATE_LIMIT_TOKENS_BURST
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_KEY_STRATEGY(cls) -> str:
+        return cls.__KAFKA_KEY_STRATEGY
+
+    @classmethod
+    @__check_loaded
+    def PROMPT_BY_REFERENCE(cls) -> bool:
+        return cls.__PROMPT_BY_REFERENCE
+
+    @classmethod
+    @__check_loaded
+    def PROMPT_DELTA_ENABLED(cls) -> bool:
+        return cls.__PROMPT_DELTA_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def PROMPT_DELTA_TTL_S(cls) -> int:
+        return cls.__PROMPT_DELTA_TTL_S
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_WIRE_FORMAT(cls) -> str:
+        return cls.__KAFKA_WIRE_FORMAT
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_CHUNK_WIRE_FORMAT(cls) -> str:
+        return cls.__KAFKA_CHUNK_WIRE_FORMAT
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_BATCH_MAX_RECORDS(cls) -> int:
+        return cls.__KAFKA_BATCH_MAX_RECORDS
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_BATCH_TIMEOUT_MS(cls) -> int:
+        return cls.__KAFKA_BATCH_TIMEOUT_MS
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_STREAM_MANUAL_COMMIT(cls) -> bool:
+        return cls.__KAFKA_STREAM_MANUAL_COMMIT
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_STREAM_COMMIT_INTERVAL_MS(cls) -> int:
+        return cls.__KAFKA_STREAM_COMMIT_INTERVAL_MS
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_DLQ_ENABLED(cls) -> bool:
+        return cls.__KAFKA_DLQ_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def KAFKA_DLQ_MAX_RETRIES(cls) -> int:
+        return cls.__KAFKA_DLQ_MAX_RETRIES
+
+    @classmethod
+    @__check_loaded
+    def COMPLETION_TIMEOUT_S(cls) -> int:
+        return cls.__COMPLETION_TIMEOUT_S
+
+    @classmethod
+    @__check_loaded
+    def ANALYTICS_ENABLED(cls) -> bool:
+        return cls.__ANALYTICS_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def ANALYTICS_BATCH_SIZE(cls) -> int:
+        return cls.__ANALYTICS_BATCH_SIZE
+
+    @classmethod
+    @__check_loaded
+    def ANALYTICS_FLUSH_INTERVAL_MS(cls) -> int:
+        return cls.__ANALYTICS_FLUSH_INTERVAL_MS
+
+    @classmethod
+    @__check_loaded
+    def ANALYTICS_MAX_BUFFERED(cls) -> int:
+        return cls.__ANALYTICS_MAX_BUFFERED
+
+    @classmethod
+    @__check_loaded
+    def ANALYTICS_AGGREGATOR_ENABLED(cls) -> bool:
+        return cls.__ANALYTICS_AGGREGATOR_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def METRICS_ENABLED(cls) -> bool:
+        return cls.__METRICS_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def PROFILING_ENABLED(cls) -> bool:
+        return cls.__PROFILING_ENABLED
+
+    @classmethod
+    @__check_loaded
+    def PROFILING_ROUTE(cls) -> str:
+        return cls.__PROFILING_ROUTE
+
+    @classmethod
+    @__check_loaded
+    def PROFILING_SLOW_MS(cls) -> int:
+        return cls.__PROFILING_SLOW_MS
+
+    @classmethod
+    @__check_loaded
+    def PROFILING_MAX_CAPTURES(cls) -> int:
+        return cls.__PROFILING_MAX_CAPTURES
+
+    @classmethod
+    @__check_loaded
+    def PROFILING_DIR(cls) -> str:
+        return cls.__PROFILING_DIR
+
     @classmethod
     @__check_loaded
     def EXTRA_PARAMS(cls) -> dict:
@@ -0,0 +1,73 @@
+import asyncio
+from collections import deque
+from logging import Logger
+from typing import Deque, Optional
+
+from config.settings import Settings
+from core.llm_schemas import UsageEvent, UsageEventBatch
+from core.metrics import counter
+from core.producer import LlmKafkaProducer, SingletonMeta
+
+USAGE_EVENTS = counter("analytics_usage_events_total", "События аналитики: отправленные (sent) и отброшенные (dropped)")
+
+
+class AnalyticsEmitter(metaclass=SingletonMeta):
+    """
+    Отправка UsageEvent в analytics_tasks вне горячего пути.
+
+    emit() синхронный и только кладёт событие в буфер; пачки уходят фоновой задачей run_forever()
+    (одна запись Kafka на ANALYTICS_BATCH_SIZE событий или раз в ANALYTICS_FLUSH_INTERVAL_MS).
+    Пока Kafka недоступна, буфер ограничен ANALYTICS_MAX_BUFFERED — аналитика не должна съесть память.
+    Неотправленная пачка повторяется с тем же batch_id, поэтому агрегатор не учтёт её дважды.
+    """
+
+    def __init__(self):
+        self.enabled = Settings.ANALYTICS_ENABLED()
+        self._batch_size = Settings.ANALYTICS_BATCH_SIZE()
+        self._max_buffered = Settings.ANALYTICS_MAX_BUFFERED()
+        self._buffer: Deque[UsageEvent] = deque()
+        self._unsent: Optional[UsageEventBatch] = None
+        self._batch_ready = asyncio.Event()
+
+    def emit(self, event: UsageEvent) -> None:
+        if not self.enabled:
+            return
+        if len(self._buffer) >= self._max_buffered:
+            USAGE_EVENTS.inc(result="dropped")
+            return
+        self._buffer.append(event)
+        if len(self._buffer) >= self._batch_size:
+            self._batch_ready.set()
+
+    async def flush(self, producer: Optional[LlmKafkaProducer] = None) -> int:
+        """Отправить всё накопленное. Возвращает число отправленных событий; ошибка Kafka пробрасывается."""
+        producer = producer or LlmKafkaProducer()
+        sent = 0
+        while self._unsent is not None or self._buffer:
+            if self._unsent is None:
+                size = min(self._batch_size, len(self._buffer))
+                self._unsent = UsageEventBatch(events=[self._buffer.popleft() for _ in range(size)])
+            await producer.send_usage_batch(self._unsent)
+            sent += len(self._unsent.events)
+            USAGE_EVENTS.inc(len(self._unsent.events), result="sent")
+            self._unsent = None
+        return sent
+
+    async def run_forever(self, logger: Logger, interval_ms: int, producer: Optional[LlmKafkaProducer] = None) -> None:
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=interval_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                self._batch_ready.clear()
+                try:
+                    await self.flush(producer)
+                except Exception as e:
+                    logger.warning("Failed to send usage events (%s), %s buffered", e, len(self._buffer))
+        finally:
+            # остановка приложения: последняя попытка, чтобы не терять хвост буфера
+            try:
+                await self.flush(producer)
+            except Exception:
+                logger.warning("Dropping %s unsent usage events on shutdown", len(self._buffer))
@@ -1,4 +1,5 @@
 import inspect
+import time
 from base64 import b64encode
 from functools import lru_cache
 
@@ -10,12 +11,32 @@ from dal.schema.Entity.BackendSchema import User
 
 from passlib.context import CryptContext
 
+from core.metrics import histogram
+
+# bcrypt синхронный и намеренно медленный — выполняется прямо в event loop
+PASSWORD_HASH_SECONDS = histogram("auth_password_hash_seconds", "Время bcrypt: проверка (verify) и хэширование (hash)")
 
 pwd_context = CryptContext(
     schemes=["bcrypt"],
     deprecated="auto"
 )
 
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    started = time.perf_counter()
+    try:
+        return pwd_context.verify(password, hashed_password)
+    finally:
+        PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, op="verify")
+
+
+def hash_password(password: str) -> str:
+    started = time.perf_counter()
+    try:
+        return pwd_context.hash(password)
+    finally:
+        PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, op="hash")
+
 security = HTTPBasic()
 
 
@@ -43,7 +64,7 @@ class BasicAuth:
         user = await Database.AuthService.get_user(login=login)
 
         try:
-            if pwd_context.verify(password, user.hashed_password):
+            if verify_password(password, user.hashed_password):
                 return user
             raise
         except:
@@ -1,36 +1,91 @@
 import asyncio
+import random
+import time
 from logging import Logger
-from typing import Union, Callable
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple, Union
 
-from aiokafka import AIOKafkaConsumer
-from aiokafka.errors import KafkaError
+from aiokafka import AIOKafkaConsumer, ConsumerRebalanceListener, ConsumerRecord, TopicPartition
+from aiokafka.errors import ConsumerStoppedError, KafkaConnectionError, KafkaError
+from pydantic import BaseModel
 
+from core.dlq import DEAD_LETTERS, DLQ_TOPIC, dead_letter_headers, message_dead_letter_headers, raw_value
 from core.logger import setup_logger
+from core.metrics import counter, gauge
+from core.producer import ProducerBase
+from core.wire_format import WireFormat, encode
+
+CONSUMER_ERRORS = counter("kafka_consumer_errors_total", "Ошибки чтения Kafka по группе и классу (retriable/fatal)")
+CONSUMER_STALL_SECONDS = counter(
+    "kafka_consumer_stall_seconds_total", "Суммарное время, когда consumer не получал записи из-за ошибок"
+)
+CONSUMER_LAST_STALL_SECONDS = gauge(
+    "kafka_consumer_last_stall_seconds", "Длительность последнего простоя consumer'а из-за ошибок"
+)
+CONSUMER_REBALANCES = counter("kafka_consumer_rebalances_total", "Отзывы/назначения партиций consumer'у")
+CONSUMER_RECORDS = counter("kafka_consumer_records_total", "Прочитанные записи по группе и топику")
+CONSUMER_LAG = gauge("kafka_consumer_lag", "Отставание от конца партиции (highwater - следующий offset) на момент чтения")
+
+
+class _RebalanceHook(ConsumerRebalanceListener):
+    """Пробрасывает события ребаланса в методы consumer'а (их переопределяют наследники)."""
+
+    def __init__(self, consumer: "ConsumerBase"):
+        self._consumer = consumer
+
+    async def on_partitions_revoked(self, revoked):
+        await self._consumer.on_partitions_revoked(set(revoked))
+
+    async def on_partitions_assigned(self, assigned):
+        await self._consumer.on_partitions_assigned(set(assigned))
 
 
 class ConsumerBase(AIOKafkaConsumer):
     """
     Базовый класс для чтения сообщений из Kafka.
+    value_deserializer=None — value остаётся bytes (например, формат зависит от заголовков записи).
+
+    Десериализация выполняется здесь, а не внутри aiokafka: исключение в deserializer'е aiokafka
+    всплывает из getmany()/__anext__ и обрывает чтение, а так битая запись просто уходит в DLQ
+    (dead_letter) и чтение продолжается.
+
+    Ошибки чтения:
+      • retriable (сеть, недоступный брокер/координатор, таймауты, ребаланс) — ждём с экспоненциальной
+        задержкой и jitter'ом и читаем дальше: aiokafka переподключается сам, членство в группе
+        и назначенные партиции сохраняются, лишнего ребаланса нет
+      • прочие KafkaError — то же ожидание, но ошибка логируется как error и считается fatal в метрике
     """
 
+    # задержка повторов: RETRY_BASE_DELAY_S * 2^попытка, не больше RETRY_MAX_DELAY_S, с jitter'ом
+    RETRY_BASE_DELAY_S = 0.1
+    RETRY_MAX_DELAY_S = 10.0
+
     def __init__(self, bootstrap_servers: str, topic: Union[str, list], group_id: str,
                  logger: Logger,
-                 value_deserializer:Callable[[str], object], **kwargs):
+                 value_deserializer: Optional[Callable[[str], object]],
+                 dlq_producer: Optional[ProducerBase] = None,
+                 **kwargs):
         topics: tuple[str, ...] = (
             (topic,) if isinstance(topic, str) else tuple(topic)
         )
         super().__init__(
-            *topics,
             bootstrap_servers=bootstrap_servers,
             group_id=group_id,
-            value_deserializer=lambda x: value_deserializer(x.decode('utf-8')) if x else None,
-            key_deserializer=lambda x: x.decode('utf-8') if x else None,
+            # внутри aiokafka — только то, что не может упасть
+            key_deserializer=lambda x: x.decode('utf-8', errors='replace') if x else None,
 
             **kwargs
         )
+        # подписка с listener'ом — чтобы наследники могли реагировать на перенос партиций
+        self.subscribe(topics=list(topics), listener=_RebalanceHook(self))
         self._logger = logger
+        self._group_id = group_id
+        self._value_deserializer = value_deserializer
+        self._dlq_producer = dlq_producer
         self._is_running = False
 
+        self._retry_attempt = 0
+        self._stall_started_at: Optional[float] = None
+
     async def start(self):
         if not self._is_running:
             await super().start()
@@ -42,18 +97,196 @@ class ConsumerBase(AIOKafkaConsumer):
             await super().stop()
             self._is_running = False
 
+    async def on_partitions_revoked(self, revoked: Set[TopicPartition]) -> None:
+        """Перед ребалансом: партиции уходят. Здесь коммитят обработанное и сбрасывают состояние по ним."""
+        if revoked:
+            CONSUMER_REBALANCES.inc(group=self._group_id, event="revoked")
+            self._logger.info("Partitions revoked: %s", sorted(f"{tp.topic}:{tp.partition}" for tp in revoked))
+
+    async def on_partitions_assigned(self, assigned: Set[TopicPartition]) -> None:
+        """После ребаланса: партиции, которые теперь читает этот consumer."""
+        CONSUMER_REBALANCES.inc(group=self._group_id, event="assigned")
+        self._logger.info("Partitions assigned: %s", sorted(f"{tp.topic}:{tp.partition}" for tp in assigned))
+
+    async def dead_letter(self, record: ConsumerRecord, error: BaseException) -> None:
+        """
+        Отправить запись, которую не удалось обработать, в DLQ с заголовками об ошибке.
+        Никогда не бросает: одна битая запись не должна останавливать чтение партиции.
+        """
+        DEAD_LETTERS.inc(topic=record.topic, error=type(error).__name__)
+        if self._dlq_producer is None:
+            self._logger.error(
+                "Dropping %s:%s@%s (%s: %s), DLQ is disabled",
+                record.topic, record.partition, record.offset, type(error).__name__, error,
+            )
+            return
+        try:
+            await self._dlq_producer.send_raw(
+                DLQ_TOPIC,
+                value=raw_value(record),
+                key=record.key.encode("utf-8") if record.key is not None else None,
+                headers=dead_letter_headers(record, error, self._group_id),
+            )
+            self._logger.warning(
+                "Record %s:%s@%s sent to DLQ (%s: %s)",
+                record.topic, record.partition, record.offset, type(error).__name__, error,
+            )
+        except Exception:
+            self._logger.exception("Failed to send %s:%s@%s to DLQ", record.topic, record.partition, record.offset)
+
+    async def dead_letter_message(self, topic: str, message: BaseModel, error: BaseException) -> None:
+        """
+        Отправить в DLQ сообщение, собранное самим consumer'ом вместо исходной записи
+        (например, готовый ответ, который не удалось сохранить): dlq_replay вернёт его в topic.
+        Никогда не бросает.
+        """
+        DEAD_LETTERS.inc(topic=topic, error=type(error).__name__)
+        if self._dlq_producer is None:
+            self._logger.error(
+                "Dropping %s for %s (%s: %s), DLQ is disabled", type(message).__name__, topic, type(error).__name__, error,
+            )
+            return
+        try:
+            value, headers = encode(message, WireFormat.JSON)
+            await self._dlq_producer.send_raw(
+                DLQ_TOPIC,
+                value=value,
+                headers=message_dead_letter_headers(headers, topic, error, self._group_id),
+            )
+            self._logger.warning(
+                "%s for %s sent to DLQ (%s: %s)", type(message).__name__, topic, type(error).__name__, error,
+            )
+        except Exception:
+            self._logger.exception("Failed to send %s for %s to DLQ", type(message).__name__, topic)
+
+    async def _deserialize(self, record: ConsumerRecord) -> bool:
+        """Десериализовать value на месте. False — запись битая и уже отправлена в DLQ."""
+        if self._value_deserializer is None or not record.value:
+            if self._value_deserializer is not None:
+                record.value = None
+            return True
+        try:
+            record.value = self._value_deserializer(record.value.decode('utf-8'))
+            return True
+        except Exception as e:
+            await self.dead_letter(record, e)
+            return False
+
+    @staticmethod
+    def is_retriable(error: BaseException) -> bool:
+        if isinstance(error, (KafkaConnectionError, ConnectionError, asyncio.TimeoutError)):
+            return True
+        return isinstance(error, KafkaError) and bool(getattr(error, "retriable", False))
+
+    def _backoff_delay(self) -> float:
+        cap = min(self.RETRY_MAX_DELAY_S, self.RETRY_BASE_DELAY_S * 2 ** self._retry_attempt)
+        self._retry_attempt += 1
+        # «equal jitter»: не меньше половины задержки, чтобы инстансы не ломились к брокеру одновременно
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def _track(self, tp: TopicPartition, count: int, next_offset: int) -> None:
+        """Метрики чтения партиции: число записей и lag по highwater, который пришёл с fetch'ем."""
+        CONSUMER_RECORDS.inc(count, group=self._group_id, topic=tp.topic)
+        highwater = self.highwater(tp)
+        if highwater is not None:
+            CONSUMER_LAG.set(
+                max(0, highwater - next_offset),
+                group=self._group_id, topic=tp.topic, partition=str(tp.partition),
+            )
+
+    def _fetched(self) -> None:
+        """Успешное чтение: сбрасываем счётчик попыток и закрываем интервал простоя."""
+        if self._stall_started_at is None:
+            return
+        stall_s = time.monotonic() - self._stall_started_at
+        self._stall_started_at = None
+        self._retry_attempt = 0
+        CONSUMER_STALL_SECONDS.inc(stall_s, group=self._group_id)
+        CONSUMER_LAST_STALL_SECONDS.set(stall_s, group=self._group_id)
+        self._logger.info("Kafka consumer recovered after %.2f s", stall_s)
+
+    async def _handle_error(self, error: Exception) -> None:
+        if self._stall_started_at is None:
+            self._stall_started_at = time.monotonic()
+        delay = self._backoff_delay()
+
+        if self.is_retriable(error):
+            CONSUMER_ERRORS.inc(group=self._group_id, kind="retriable")
+            self._logger.warning("Retriable Kafka error (%s). Retry in %.2f s", error, delay)
+            await asyncio.sleep(delay)
+            return
+
+        # stop()/start() тут не помогает: остановленный AIOKafkaConsumer повторно не стартует
+        # (start() упирается в assert на fetcher), а выход из группы стоил бы ребаланса всем.
+        # Ждём с той же задержкой (до RETRY_MAX_DELAY_S) и пробуем снова — метрика и лог покажут проблему.
+        CONSUMER_ERRORS.inc(group=self._group_id, kind="fatal")
+        self._logger.error("Kafka error (%s). Retry in %.2f s", error, delay)
+        await asyncio.sleep(delay)
+
+    async def _poll(self, max_records: int, timeout_ms: int) -> Optional[Dict[TopicPartition, List[ConsumerRecord]]]:
+        """
+        Один getmany() с обработкой ошибок чтения. {} — записей нет (или ошибка уже отработана
+        ожиданием), None — чтение пора прекращать.
+        """
+        try:
+            batch = await self.getmany(timeout_ms=timeout_ms, max_records=max_records)
+        except asyncio.CancelledError:
+            self._logger.info("Consumer cancelled – stopping")
+            return None
+        except ConsumerStoppedError:
+            self._logger.warning("Underlying consumer stopped – breaking loop")
+            return None
+        except (KafkaError, ConnectionError) as e:
+            await self._handle_error(e)
+            return {}
+        except Exception:
+            self._logger.exception("Unexpected consumer error – abort")
+            return None
+
+        self._fetched()
+        return batch
+
+    async def _accept(self, tp: TopicPartition, records: List[ConsumerRecord]) -> List[ConsumerRecord]:
+        """Записи партиции, взятые в обработку: метрики и десериализация (битые уходят в DLQ)."""
+        self._track(tp, len(records), records[-1].offset + 1)
+        if self._value_deserializer is not None:
+            records = [record for record in records if await self._deserialize(record)]
+        return records
+
+    async def batches(
+        self,
+        max_records: int = 500,
+        timeout_ms: int = 100,
+    ) -> AsyncIterator[Tuple[TopicPartition, List[ConsumerRecord]]]:
+        """
+        Пакетное чтение через getmany(): (партиция, её записи по порядку offset'ов).
+        Накладные расходы python (await, try/except) — на пакет, а не на каждую запись.
+        """
+        if not self._is_running:
+            await self.start()
+
+        while self._is_running:
+            batch = await self._poll(max_records, timeout_ms)
+            if batch is None:
+                break
+            for tp, records in batch.items():
+                records = await self._accept(tp, records)
+                if records:
+                    yield tp, records
+
+        try:
+            await self.stop()
+        finally:
+            self._is_running = False
+
     async def __aiter__(self):
         if not self._is_running:  # защита от двойного start()
             await self.start()
 
-        RETRY_DELAY = 5  # секунд
-
         while self._is_running:
             try:
                 # обычный быстрый путь – «тонкий» async-итератор AIOKafkaConsumer
                 msg = await super().__anext__()
-                yield msg
-
             # ---------- штатные выхода ----------
             except asyncio.CancelledError:
                 self._logger.info("Consumer cancelled – stopping")
@@ -64,19 +297,7 @@ class ConsumerBase(AIOKafkaConsumer):
 
             # ---------- ошибки Kafka / сеть ----------
             except (KafkaError, ConnectionError) as e:
-                self._logger.error("Kafka error (%s). Restart consumer in %s s", e, RETRY_DELAY)
-                try:
-                    await self.stop()
-                except Exception:
-                    self._logger.exception("Error on consumer.stop()")
-
-                await asyncio.sleep(RETRY_DELAY)
-
-                try:
-                    await self.start()
-                except Exception as ee:
-                    self._logger.exception("Error on consumer.start(): %s", ee)
-                    # подождём ещё круг, попытка перезапуска снова пойдёт из верхнего while
+                await self._handle_error(e)
                 continue
 
             # ---------- всё прочее ----------
@@ -84,6 +305,11 @@ class ConsumerBase(AIOKafkaConsumer):
                 self._logger.exception("Unexpected consumer error – abort")
                 break
 
+            self._fetched()
+            self._track(TopicPartition(msg.topic, msg.partition), 1, msg.offset + 1)
+            if await self._deserialize(msg):
+                yield msg
+
         # --- graceful shutdown ---
         try:
             await self.stop()
@@ -0,0 +1,89 @@
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from aiokafka import ConsumerRecord
+from pydantic import BaseModel
+
+from config.settings import KafkaTopics
+from core.metrics import counter
+
+DLQ_TOPIC = KafkaTopics.DLQ_TASKS.value
+
+# заголовки, которые добавляются к записи при отправке в DLQ (исходные заголовки сохраняются)
+DLQ_ORIGINAL_TOPIC = "dlq-original-topic"
+DLQ_ORIGINAL_PARTITION = "dlq-original-partition"
+DLQ_ORIGINAL_OFFSET = "dlq-original-offset"
+DLQ_CONSUMER_GROUP = "dlq-consumer-group"
+DLQ_ERROR_TYPE = "dlq-error-type"
+DLQ_ERROR = "dlq-error"
+DLQ_FAILED_AT = "dlq-failed-at"
+# сколько раз запись уже возвращалась из DLQ в исходный топик (tools/dlq_replay.py)
+DLQ_RETRY_COUNT = "dlq-retry-count"
+
+DEAD_LETTERS = counter("kafka_dead_letters_total", "Записи, отправленные в DLQ, по исходному топику и типу ошибки")
+
+# длинные трассы в заголовок не кладём — хватит начала сообщения об ошибке
+_MAX_ERROR_LEN = 1000
+
+
+def header_value(headers: Optional[Sequence[Tuple[str, bytes]]], name: str) -> Optional[str]:
+    for key, value in headers or ():
+        if key == name:
+            return value.decode("utf-8", errors="replace")
+    return None
+
+
+def retry_count(headers: Optional[Sequence[Tuple[str, bytes]]]) -> int:
+    try:
+        return int(header_value(headers, DLQ_RETRY_COUNT) or 0)
+    except ValueError:
+        return 0
+
+
+def raw_value(record: ConsumerRecord) -> bytes:
+    """value записи в исходном виде (если consumer уже десериализовал его — сериализуем обратно)."""
+    value = record.value
+    if value is None:
+        return b""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, BaseModel):
+        return value.model_dump_json().encode("utf-8")
+    return str(value).encode("utf-8")
+
+
+def _failure_headers(
+    headers: Optional[Sequence[Tuple[str, bytes]]],
+    topic: str,
+    error: BaseException,
+    group_id: str,
+    position: Sequence[Tuple[str, bytes]] = (),
+) -> List[Tuple[str, bytes]]:
+    # исходные заголовки (content-type и т.п.) нужны для повторной обработки; старые dlq-* заменяем
+    kept = [
+        (key, value) for key, value in (headers or ())
+        if not key.startswith("dlq-") or key == DLQ_RETRY_COUNT
+    ]
+    return kept + [(DLQ_ORIGINAL_TOPIC, topic.encode("utf-8")), *position] + [
+        (DLQ_CONSUMER_GROUP, group_id.encode("utf-8")),
+        (DLQ_ERROR_TYPE, type(error).__name__.encode("utf-8")),
+        (DLQ_ERROR, str(error)[:_MAX_ERROR_LEN].encode("utf-8", errors="replace")),
+        (DLQ_FAILED_AT, str(int(time.time() * 1000)).encode("ascii")),
+    ]
+
+
+def dead_letter_headers(record: ConsumerRecord, error: BaseException, group_id: str) -> List[Tuple[str, bytes]]:
+    return _failure_headers(record.headers, record.topic, error, group_id, position=(
+        (DLQ_ORIGINAL_PARTITION, str(record.partition).encode("ascii")),
+        (DLQ_ORIGINAL_OFFSET, str(record.offset).encode("ascii")),
+    ))
+
+
+def message_dead_letter_headers(
+    headers: Sequence[Tuple[str, bytes]],
+    topic: str,
+    error: BaseException,
+    group_id: str,
+) -> List[Tuple[str, bytes]]:
+    """Для сообщения, которое consumer собрал сам: исходной записи (partition/offset) у него нет."""
+    return _failure_headers(headers, topic, error, group_id)
@@ -1,7 +1,7 @@
 import json
 from typing import Union
 
-from core.kafka.llm_schemas import LlmChatResponse, LlmStreamChunk
+from core.llm_schemas import LlmChatResponse, LlmStreamChunk
 
 LlmApiEvent = Union[LlmChatResponse, LlmStreamChunk]
 
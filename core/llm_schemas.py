@@ -8,6 +8,9 @@ from typing import Union
 
 RoleType = Literal["system", "user", "assistant", "tool"]
 
+# interactive — живой чат пользователя, batch — фоновые задачи (суммаризация, экспорт и т.п.)
+PriorityType = Literal["interactive", "batch"]
+
 
 class LlmMessage(BaseModel):
     role: RoleType
@@ -31,6 +34,31 @@ class LlmError(BaseModel):
     details: Optional[Dict[str, Any]] = None
 
 
+class LlmPromptTemplate(BaseModel):
+    """
+    Версия системного промпта (compacted-топик llm.prompt.templates, ключ — template_id).
+    template_id = "<name>@<sha256(text)[:16]>": меняется текст — меняется id, старые версии не перезаписываются.
+    """
+    template_id: str
+    name: str
+    text: str
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class LlmContextRef(BaseModel):
+    """
+    Ссылка на контекст, который воркер держит после хода prev_request_id
+    (его промпт + его ответ). messages запроса с context — только сообщения после этого контекста.
+
+    prefix_messages / prefix_digest описывают этот контекст: воркер сверяет их со своими данными;
+    если контекста нет или он не совпадает — отвечает ошибкой context_miss, и следующий ход уйдёт полным.
+    """
+    prev_request_id: UUID
+    prefix_messages: int
+    prefix_digest: str
+
+
 class LlmChatRequest(BaseModel):
     request_id: UUID = Field(default_factory=uuid4)
 
@@ -38,6 +66,10 @@ class LlmChatRequest(BaseModel):
     user_id: Optional[int] = None
 
     messages: List[LlmMessage]
+    # системный промпт по ссылке на LlmPromptTemplate — тогда в messages его нет
+    system_prompt_id: Optional[str] = None
+    # дельта-запрос: messages продолжают контекст воркера (None — messages содержат весь контекст)
+    context: Optional[LlmContextRef] = None
 
     model: str = "gemma-2b-it"
     max_tokens: int = 1024
@@ -45,11 +77,12 @@ class LlmChatRequest(BaseModel):
     top_p: float = 1.0
 
     stream: bool = True
+    priority: PriorityType = "interactive"
     metadata: Dict[str, Any] = Field(default_factory=dict)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
-FinishReason = Literal["stop", "length", "content_filter", "tool_calls", "error"]
+FinishReason = Literal["stop", "length", "content_filter", "tool_calls", "error", "cancelled"]
 
 
 class LlmChatResponse(BaseModel):
@@ -74,8 +107,52 @@ class LlmStreamChunk(BaseModel):
     index: int
     delta: str
     is_final: bool = False
+    # расход токенов на генерацию — воркер присылает его в финальном чанке
+    token_usage: Optional[TokenUsage] = None
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+ControlAction = Literal["cancel"]
+
+
+class LlmControlEvent(BaseModel):
+    """
+    Управляющее событие для воркеров (топик llm.chat.control).
+    cancel — прекратить генерацию request_id: чанки после отмены бэкенд всё равно выбросит.
+    """
+    request_id: UUID
+    chat_session_id: int
+    action: ControlAction = "cancel"
+    reason: Optional[str] = None
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class UsageEvent(BaseModel):
+    """Итог одной генерации для аналитики (что и сколько потрачено)."""
+    request_id: UUID
+    user_id: int
+    chat_session_id: int
+    model: str
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: Optional[int] = None
+    finish_reason: Optional[str] = None
+    # ответ отдан из ResponseCache — воркер не вызывался
+    cached: bool = False
 
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class UsageEventBatch(BaseModel):
+    """
+    Пачка UsageEvent — одна запись топика analytics_tasks.
+    batch_id нужен агрегатору для идемпотентности: повторная доставка пачки не учитывается дважды.
+    """
+    batch_id: UUID = Field(default_factory=uuid4)
+    events: List[UsageEvent]
+
+
 LlmApiEvent = Union["LlmChatResponse", "LlmStreamChunk"]
\ No newline at end of file
@@ -1,6 +1,24 @@
 from enum import Enum
 
 class LlmKafkaTopic(str, Enum):
+    # приоритетные полосы запросов: interactive — основной топик, batch — отдельный
     CHAT_REQUEST = "llm.chat.request"
+    CHAT_REQUEST_BATCH = "llm.chat.request.batch"
     CHAT_RESPONSE = "llm.chat.response"
-    CHAT_TOKEN = "llm.chat.token"
\ No newline at end of file
+    CHAT_TOKEN = "llm.chat.token"
+    CHAT_CONTROL = "llm.chat.control"
+    # compacted (cleanup.policy=compact): последняя запись по каждому template_id хранится бессрочно
+    PROMPT_TEMPLATES = "llm.prompt.templates"
+
+
+# priority (LlmChatRequest.priority) -> топик запросов
+CHAT_REQUEST_LANES = {
+    "interactive": LlmKafkaTopic.CHAT_REQUEST,
+    "batch": LlmKafkaTopic.CHAT_REQUEST_BATCH,
+}
+
+# веса полос для воркеров (WeightedPriorityConsumer): на 4 interactive-запроса — 1 batch
+CHAT_REQUEST_LANE_WEIGHTS = {
+    LlmKafkaTopic.CHAT_REQUEST.value: 4,
+    LlmKafkaTopic.CHAT_REQUEST_BATCH.value: 1,
+}
\ No newline at end of file
@@ -0,0 +1,162 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """
+    Простой in-process счётчик с метками.
+    Без блокировок: всё приложение живёт в одном event loop.
+    """
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> Dict[LabelKey, float]:
+        return dict(self._values)
+
+
+class Gauge(Counter):
+    """Значение, которое может и расти, и падать (текущее состояние, а не накопленная сумма)."""
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[tuple(sorted(labels.items()))] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+# границы по умолчанию (секунды): от единиц миллисекунд до минуты
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class HistogramSample:
+    """Распределение одного набора меток: счётчики по корзинам (не накопительные), сумма и число."""
+
+    __slots__ = ("bucket_counts", "sum", "count")
+
+    def __init__(self, size: int):
+        # последняя корзина — +Inf
+        self.bucket_counts: List[int] = [0] * (size + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Распределение значений (латентности и т.п.) по фиксированным корзинам, с метками."""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, HistogramSample] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        sample = self._values.get(key)
+        if sample is None:
+            sample = self._values[key] = HistogramSample(len(self.buckets))
+        # le-семантика: значение, равное границе, попадает в её корзину
+        sample.bucket_counts[bisect_left(self.buckets, value)] += 1
+        sample.sum += value
+        sample.count += 1
+
+    def sample(self, **labels: str) -> Optional[HistogramSample]:
+        return self._values.get(tuple(sorted(labels.items())))
+
+    def samples(self) -> Dict[LabelKey, HistogramSample]:
+        return dict(self._values)
+
+
+REGISTRY: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+
+# функции, которые обновляют gauge'и состояния (hub, пул БД) непосредственно перед выгрузкой метрик:
+# так горячий путь ничего не считает, а значения на момент scrape точные
+COLLECTORS: List[Callable[[], None]] = []
+
+
+def counter(name: str, description: str) -> Counter:
+    """Счётчик из общего реестра (создаётся при первом обращении)."""
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = Counter(name, description)
+    return metric
+
+
+def gauge(name: str, description: str) -> Gauge:
+    """Gauge из общего реестра (создаётся при первом обращении)."""
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = Gauge(name, description)
+    return metric
+
+
+def histogram(name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Гистограмма из общего реестра (создаётся при первом обращении)."""
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = Histogram(name, description, buckets)
+    return metric
+
+
+def collector(fn: Callable[[], None]) -> Callable[[], None]:
+    """Зарегистрировать функцию сбора (вызывается синхронно в render_prometheus)."""
+    if fn not in COLLECTORS:
+        COLLECTORS.append(fn)
+    return fn
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_prometheus() -> str:
+    """Все метрики реестра в текстовом формате Prometheus (exposition format 0.0.4)."""
+    for fn in COLLECTORS:
+        fn()
+
+    lines: List[str] = []
+    for name, metric in sorted(REGISTRY.items()):
+        kind = "histogram" if isinstance(metric, Histogram) else "gauge" if isinstance(metric, Gauge) else "counter"
+        lines.append(f"# HELP {name} {_escape(metric.description)}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        if isinstance(metric, Histogram):
+            for key, sample in sorted(metric.samples().items()):
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), sample.bucket_counts):
+                    cumulative += count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{name}_bucket{_labels(key, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(sample.sum)}")
+                lines.append(f"{name}_count{_labels(key)} {sample.count}")
+        else:
+            for key, value in sorted(metric.samples().items()):
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+
+    lines.append("")
+    return "\n".join(lines)
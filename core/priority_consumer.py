@@ -0,0 +1,127 @@
+from logging import Logger
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from aiokafka import ConsumerRecord, TopicPartition
+
+from core.consumer import ConsumerBase
+from core.llm_topics import CHAT_REQUEST_LANE_WEIGHTS
+
+
+class WeightedPriorityConsumer(ConsumerBase):
+    """
+    Consumer для воркеров LLM: читает несколько полос (топиков) запросов с весами.
+
+    За один раунд getmany() каждая полоса получает долю max_records пропорционально весу;
+    записи сверх доли не обрабатываются — позиция партиции откатывается (seek) к первой из них,
+    и они придут в следующих раундах. Неиспользованная доля отдаётся другим полосам,
+    так что при пустой interactive-полосе batch-работа идёт на полной скорости,
+    а при наплыве interactive batch получает только свой вес и не увеличивает TTFT.
+
+    Внутри полосы доля делится между её партициями поровну (что не нужно одной — достаётся остальным);
+    остаток по одной записи раздаётся со сдвигом, меняющимся каждый раунд, — ни одна партиция не голодает.
+    """
+
+    def __init__(self, bootstrap_servers: str, group_id: str, logger: Logger,
+                 value_deserializer: Callable[[str], object],
+                 lane_weights: Optional[Dict[str, int]] = None,
+                 max_records: int = 100,
+                 timeout_ms: int = 200,
+                 **kwargs):
+        self._lane_weights = dict(lane_weights or CHAT_REQUEST_LANE_WEIGHTS)
+        super().__init__(
+            bootstrap_servers=bootstrap_servers,
+            topic=list(self._lane_weights),
+            group_id=group_id,
+            logger=logger,
+            value_deserializer=value_deserializer,
+            **kwargs,
+        )
+        self._max_records = max_records
+        self._timeout_ms = timeout_ms
+        # номер раунда — сдвиг, с которого раздаётся остаток доли внутри полосы
+        self._round = 0
+
+    def _quotas(self, demand: Dict[str, int]) -> Dict[str, int]:
+        """Доли раунда по весам; недобор одних полос перераспределяется по остальным (по убыванию веса)."""
+        lanes = sorted(demand, key=lambda t: -self._lane_weights.get(t, 1))
+        total_weight = sum(self._lane_weights.get(t, 1) for t in lanes)
+        quotas = {
+            t: max(1, self._max_records * self._lane_weights.get(t, 1) // total_weight)
+            for t in lanes
+        }
+
+        spare = sum(max(0, quotas[t] - demand[t]) for t in lanes)
+        for t in lanes:
+            quotas[t] = min(quotas[t], demand[t])
+        for t in lanes:
+            extra = min(spare, demand[t] - quotas[t])
+            quotas[t] += extra
+            spare -= extra
+        return quotas
+
+    def _split(self, quota: int, demand: Dict[TopicPartition, int]) -> Dict[TopicPartition, int]:
+        """Доля полосы по её партициям: поровну, но не больше спроса партиции; остаток — по кругу."""
+        shares = dict.fromkeys(demand, 0)
+        # water-filling: партиции с малым спросом забирают всё, их недобор делится между остальными
+        hungry = sorted(demand, key=demand.get)
+        while hungry and quota >= len(hungry):
+            fair = quota // len(hungry)
+            small = [tp for tp in hungry if demand[tp] - shares[tp] <= fair]
+            if not small:
+                for tp in hungry:
+                    shares[tp] += fair
+                quota -= fair * len(hungry)
+                break
+            for tp in small:
+                quota -= demand[tp] - shares[tp]
+                shares[tp] = demand[tp]
+            hungry = [tp for tp in hungry if shares[tp] < demand[tp]]
+
+        # остаток меньше числа голодных партиций — по одной записи, начиная со сдвига раунда
+        hungry.sort(key=lambda tp: tp.partition)
+        for i in range(min(quota, len(hungry))):
+            shares[hungry[(self._round + i) % len(hungry)]] += 1
+        return shares
+
+    async def weighted_records(self) -> AsyncIterator[ConsumerRecord]:
+        """Записи всех полос с учётом весов: в раунде сначала более приоритетные."""
+        if not self._is_running:
+            await self.start()
+
+        while self._is_running:
+            batch = await self._poll(self._max_records, self._timeout_ms)
+            if batch is None:
+                break
+            if not batch:
+                continue
+
+            demand: Dict[str, int] = {}
+            lanes: Dict[str, Dict[TopicPartition, int]] = {}
+            for tp, records in batch.items():
+                demand[tp.topic] = demand.get(tp.topic, 0) + len(records)
+                lanes.setdefault(tp.topic, {})[tp] = len(records)
+            quotas = self._quotas(demand)
+            allowed: Dict[TopicPartition, int] = {}
+            for topic, partitions in lanes.items():
+                allowed.update(self._split(quotas[topic], partitions))
+            self._round += 1
+
+            # сначала откатываем все партиции сверх доли, потом отдаём записи: генератор может
+            # не дойти до конца раунда (воркер остановился), и тогда непрочитанный остаток не потеряется
+            accepted = []
+            for tp, records in sorted(batch.items(), key=lambda item: -self._lane_weights.get(item[0].topic, 1)):
+                take = allowed[tp]
+                if take < len(records):
+                    # остаток вернётся следующими getmany()
+                    self.seek(tp, records[take].offset)
+                if take:
+                    accepted.append((tp, records[:take]))
+
+            for tp, records in accepted:
+                for record in await self._accept(tp, records):
+                    yield record
+
+        try:
+            await self.stop()
+        finally:
+            self._is_running = False
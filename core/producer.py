@@ -1,11 +1,18 @@
+import time
 from typing import Optional, List, Tuple, Union
 
 from aiokafka import AIOKafkaProducer
 from pydantic import BaseModel
 
-from config.settings import Settings
-from core.llm_schemas import LlmChatRequest, LlmChatResponse, LlmStreamChunk
-from core.llm_topics import LlmKafkaTopic
+from config.settings import KafkaTopics, Settings
+from core.llm_schemas import LlmChatRequest, LlmChatResponse, LlmStreamChunk, LlmControlEvent, \
+    LlmPromptTemplate, UsageEventBatch
+from core.llm_topics import LlmKafkaTopic, CHAT_REQUEST_LANES
+from core.metrics import counter, histogram
+from core.wire_format import WireFormat, WIRE_FORMATS, encode
+
+PRODUCER_SEND_SECONDS = histogram("kafka_producer_send_seconds", "Отправка записи в Kafka до подтверждения брокера, по топику")
+PRODUCER_ERRORS = counter("kafka_producer_errors_total", "Неудачные отправки в Kafka по топику")
 
 
 class ProducerBase(AIOKafkaProducer):
@@ -14,7 +21,7 @@ class ProducerBase(AIOKafkaProducer):
     """
     def __init__(self):
         super().__init__(bootstrap_servers=Settings.KAFKA_SERVERS(),
-                         value_serializer=lambda x: x.encode('utf-8'))
+                         value_serializer=lambda x: x if isinstance(x, bytes) else x.encode('utf-8'))
         self._is_running = False
 
     async def start(self):
@@ -36,23 +43,44 @@ class ProducerBase(AIOKafkaProducer):
         partition: Optional[int] = None,
         timestamp_ms: Optional[int] = None,
         headers: Optional[List[Tuple[str, bytes]]] = None,
+        wire_format: WireFormat = WireFormat.JSON,
     ):
         """
         Отправка задачи в Kafka (наш собственный метод).
+        Формат value уходит заголовком content-type (см. core.wire_format).
         """
         if not self._is_running:
             await self.start()
+        value, format_headers = encode(message, wire_format)
+        await self._send_timed(
+            topic,
+            value=value,
+            key=key.encode('utf-8'),
+            partition=partition,
+            timestamp_ms=timestamp_ms,
+            headers=(headers or []) + format_headers,
+        )
+
+    async def send_raw(
+        self,
+        topic: str,
+        value: bytes,
+        key: Optional[bytes] = None,
+        headers: Optional[List[Tuple[str, bytes]]] = None,
+    ):
+        """Отправка уже сериализованной записи как есть (DLQ, повтор из DLQ)."""
+        if not self._is_running:
+            await self.start()
+        await self._send_timed(topic, value=value, key=key, headers=headers)
+
+    async def _send_timed(self, topic: str, **kwargs):
+        started = time.perf_counter()
         try:
-            await self.send_and_wait(
-                topic,
-                value=message.model_dump_json(),
-                key=key.encode('utf-8'),
-                partition=partition,
-                timestamp_ms=timestamp_ms,
-                headers=headers,
-            )
-        except Exception as e:
-            raise e
+            await self.send_and_wait(topic, **kwargs)
+        except Exception:
+            PRODUCER_ERRORS.inc(topic=topic)
+            raise
+        PRODUCER_SEND_SECONDS.observe(time.perf_counter() - started, topic=topic)
 
 
 class SingletonMeta(type):
@@ -66,23 +94,78 @@ class SingletonMeta(type):
 
 
 class LlmKafkaProducer(ProducerBase, metaclass=SingletonMeta):
+    """
+    Producer LLM-топиков. Ключ сообщений задаёт KAFKA_KEY_STRATEGY:
+
+      • request — ключ request_id: генерации равномерно размазаны по партициям,
+        порядок гарантирован только внутри одной генерации
+      • session — ключ chat_session_id: все ходы диалога и их чанки идут в одну партицию
+        каждого топика (murmur2(key) % partitions), поэтому
+          – ходы одной сессии обрабатывает один воркер группы, пока нет ребаланса
+            и не меняется число партиций, — его KV/prefix-кэш прошлого хода остаётся тёплым
+          – чанки и ответы сессии читаются в порядке отправки, даже если генерации перекрываются
+          – control-события (cancel) попадают в партицию с тем же номером; при одинаковом числе
+            партиций у llm.chat.request* и llm.chat.control и RangePartitionAssignor у воркеров
+            они приходят тому же воркеру, что и сам запрос
+
+    Цена session-ключа — перекос: длинный активный диалог нагружает одну партицию.
+    Аффинити «мягкое»: после ребаланса сессия просто переезжает на другой воркер с холодным кэшем.
+    """
+
+    @staticmethod
+    def message_key(request_id, chat_session_id) -> str:
+        if Settings.KAFKA_KEY_STRATEGY() == "session":
+            return f"session:{chat_session_id}"
+        return str(request_id)
+
+    async def send_task_message(self, topic: str, key: str, message: BaseModel, **kwargs):
+        if "wire_format" not in kwargs:
+            setting = Settings.KAFKA_CHUNK_WIRE_FORMAT() if isinstance(message, LlmStreamChunk) \
+                else Settings.KAFKA_WIRE_FORMAT()
+            kwargs["wire_format"] = WIRE_FORMATS[setting]
+        await super().send_task_message(topic, key, message, **kwargs)
+
     async def send_chat_request(self, message: LlmChatRequest):
+        # полоса (топик) выбирается по приоритету запроса
         await self.send_task_message(
-            topic=LlmKafkaTopic.CHAT_REQUEST.value,
-            key=str(message.request_id),
+            topic=CHAT_REQUEST_LANES[message.priority].value,
+            key=self.message_key(message.request_id, message.chat_session_id),
             message=message,
         )
 
     async def send_chat_response(self, message: LlmChatResponse):
         await self.send_task_message(
             topic=LlmKafkaTopic.CHAT_RESPONSE.value,
-            key=str(message.request_id),
+            key=self.message_key(message.request_id, message.chat_session_id),
             message=message,
         )
 
     async def send_stream_chunk(self, message: LlmStreamChunk):
         await self.send_task_message(
             topic=LlmKafkaTopic.CHAT_TOKEN.value,
-            key=str(message.request_id),
+            key=self.message_key(message.request_id, message.chat_session_id),
+            message=message,
+        )
+
+    async def send_control_event(self, message: LlmControlEvent):
+        await self.send_task_message(
+            topic=LlmKafkaTopic.CHAT_CONTROL.value,
+            key=self.message_key(message.request_id, message.chat_session_id),
             message=message,
-        )
\ No newline at end of file
+        )
+
+    async def send_prompt_template(self, message: LlmPromptTemplate):
+        # ключ — id версии: compaction оставит по одной записи на версию
+        await self.send_task_message(
+            topic=LlmKafkaTopic.PROMPT_TEMPLATES.value,
+            key=message.template_id,
+            message=message,
+        )
+
+    async def send_usage_batch(self, message: UsageEventBatch):
+        # порядок пачек агрегатору не важен — ключ только распределяет их по партициям
+        await self.send_task_message(
+            topic=KafkaTopics.ANALYTICS_TASKS.value,
+            key=str(message.batch_id),
+            message=message,
+        )
@@ -0,0 +1,45 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from core.llm_schemas import LlmPromptTemplate
+from core.producer import LlmKafkaProducer, SingletonMeta
+
+
+class PromptTemplateRegistry(metaclass=SingletonMeta):
+    """
+    Реестр версий системных промптов.
+
+    Бэкенд регистрирует шаблоны при импорте и публикует их на старте в llm.prompt.templates;
+    воркеры читают топик с начала и держат template_id -> text у себя.
+    В запросе остаётся только system_prompt_id — несколько КБ промпта не гоняются через Kafka на каждый ход.
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, LlmPromptTemplate] = {}
+
+    @staticmethod
+    def make_id(name: str, text: str) -> str:
+        return f"{name}@{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
+    def register(self, name: str, text: str) -> LlmPromptTemplate:
+        template_id = self.make_id(name, text)
+        template = self._templates.get(template_id)
+        if template is None:
+            template = self._templates[template_id] = LlmPromptTemplate(
+                template_id=template_id,
+                name=name,
+                text=text,
+            )
+        return template
+
+    def get(self, template_id: str) -> Optional[LlmPromptTemplate]:
+        return self._templates.get(template_id)
+
+    def all(self) -> List[LlmPromptTemplate]:
+        return list(self._templates.values())
+
+    async def publish(self, producer: Optional[LlmKafkaProducer] = None) -> None:
+        """Публикация всех версий; повтор безопасен — топик compacted, ключ — template_id."""
+        producer = producer or LlmKafkaProducer()
+        for template in self._templates.values():
+            await producer.send_prompt_template(template)
@@ -0,0 +1,147 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
+
+from fastapi import Depends, HTTPException, status
+
+from config.settings import Settings
+from core.auth import BasicAuth
+from core.metrics import counter
+from core.producer import SingletonMeta
+from dal.schema.Entity.BackendSchema import User
+
+RATE_LIMITED = counter("rate_limit_rejections_total", "Запросы, отклонённые rate limiter'ом")
+
+
+class RateLimitBackend(ABC):
+    """
+    Хранилище token bucket'ов.
+
+    Методы асинхронные, чтобы за интерфейсом мог стоять общий стор для нескольких нод
+    (например, Redis: состояние бакета в hash, consume/charge — одним Lua-скриптом).
+    """
+
+    @abstractmethod
+    async def consume(self, key: str, cost: float, rate: float, capacity: float) -> float:
+        """
+        Списать cost, если в бакете хватает токенов.
+        0 — списано; иначе сколько секунд ждать, пока накопится нужное.
+        """
+
+    @abstractmethod
+    async def charge(self, key: str, cost: float, rate: float, capacity: float) -> None:
+        """Списать cost безусловно (бакет может уйти в минус — «долг» гасится пополнением)."""
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Бакеты в памяти процесса — для одной ноды. O(1) на вызов, без блокировок (один event loop).
+
+    Сверх max_keys вытесняется бакет, к которому дольше всех не обращались (LRU): к этому моменту
+    он почти наверняка уже пополнился до capacity, а полный бакет ничем не отличается от отсутствующего.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        # key -> [tokens, updated_at]; порядок — от давно не использованных к недавним
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._max_keys = max_keys
+
+    def _refill(self, key: str, rate: float, capacity: float) -> List[float]:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            while len(self._buckets) >= self._max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [capacity, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    async def consume(self, key: str, cost: float, rate: float, capacity: float) -> float:
+        bucket = self._refill(key, rate, capacity)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / rate
+
+    async def charge(self, key: str, cost: float, rate: float, capacity: float) -> None:
+        bucket = self._refill(key, rate, capacity)
+        bucket[0] -= cost
+
+
+class RateLimiter(metaclass=SingletonMeta):
+    """
+    Rate limiting по User.id, два независимых бакета:
+      • requests — каждый запрос к /chat/* стоит 1
+      • tokens   — генерации: списываются по факту (prompt + completion) из KafkaLlmStreamConsumer,
+                   новые генерации не принимаются, пока бакет в минусе
+    """
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None):
+        self.enabled = Settings.RATE_LIMIT_ENABLED()
+        self._backend = backend or InMemoryRateLimitBackend()
+
+        self._request_rate = Settings.RATE_LIMIT_REQUESTS_PER_MIN() / 60
+        self._request_capacity = Settings.RATE_LIMIT_REQUESTS_BURST()
+        self._token_rate = Settings.RATE_LIMIT_TOKENS_PER_MIN() / 60
+        self._token_capacity = Settings.RATE_LIMIT_TOKENS_BURST()
+
+    @staticmethod
+    def _reject(kind: str, retry_after_s: float) -> HTTPException:
+        RATE_LIMITED.inc(bucket=kind)
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded ({kind})",
+            headers={"Retry-After": str(max(1, int(retry_after_s + 0.999)))},
+        )
+
+    async def check_request(self, user_id: int) -> None:
+        if not self.enabled:
+            return
+        wait_s = await self._backend.consume(
+            f"req:{user_id}", 1, self._request_rate, self._request_capacity
+        )
+        if wait_s:
+            raise self._reject("requests", wait_s)
+
+    async def check_tokens(self, user_id: int) -> None:
+        """Перед новой генерацией: пропускаем, пока токенный бакет не в минусе."""
+        if not self.enabled:
+            return
+        wait_s = await self._backend.consume(
+            f"tok:{user_id}", 0, self._token_rate, self._token_capacity
+        )
+        if wait_s:
+            raise self._reject("tokens", wait_s)
+
+    async def charge_tokens(
+        self,
+        user_id: int,
+        prompt_tokens: Optional[int],
+        completion_tokens: Optional[int],
+        text: str = "",
+    ) -> None:
+        """
+        Списать токены генерации. Если воркер не прислал usage — оцениваем completion по тексту
+        (так же грубо, как trim_to_budget: ~4 символа на токен).
+        """
+        if not self.enabled:
+            return
+        if completion_tokens is None:
+            completion_tokens = max(1, len(text) // 4) if text else 0
+        cost = (prompt_tokens or 0) + completion_tokens
+        if cost:
+            await self._backend.charge(f"tok:{user_id}", cost, self._token_rate, self._token_capacity)
+
+
+def get_rate_limiter() -> RateLimiter:
+    return RateLimiter()
+
+
+async def rate_limited_user(user: User = Depends(BasicAuth.token_auth)) -> User:
+    """BasicAuth + списание из бакета запросов. Используется вместо BasicAuth.token_auth в /chat/*."""
+    await RateLimiter().check_request(user.id)
+    return user
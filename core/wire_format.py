@@ -0,0 +1,132 @@
+import struct
+from datetime import datetime, timezone
+from enum import Enum
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Type, TypeVar
+from uuid import UUID
+
+import msgpack
+import orjson
+from pydantic import BaseModel
+
+from core.llm_schemas import LlmStreamChunk
+
+M = TypeVar("M", bound=BaseModel)
+
+# заголовок Kafka-записи с форматом value; нет заголовка или формат незнаком — JSON
+CONTENT_TYPE_HEADER = "content-type"
+
+
+class WireFormat(str, Enum):
+    JSON = "application/json"
+    MSGPACK = "application/msgpack"
+    # только для промежуточных LlmStreamChunk: фиксированная шапка + delta в utf-8
+    CHUNK_STRUCT = "application/x-llm-chunk"
+
+
+# значения KAFKA_WIRE_FORMAT / KAFKA_CHUNK_WIRE_FORMAT
+WIRE_FORMATS = {
+    "json": WireFormat.JSON,
+    "msgpack": WireFormat.MSGPACK,
+    "struct": WireFormat.CHUNK_STRUCT,
+}
+
+# request_id (16 байт UUID), chat_session_id, index, is_final, created_at (unix-время, float64)
+_CHUNK_HEAD = struct.Struct("!16sqI?d")
+
+
+class ChunkView(NamedTuple):
+    """Поля чанка, нужные на горячем пути consumer'а, без pydantic, UUID и datetime."""
+    request_id: str
+    index: int
+    delta: str
+    is_final: bool
+
+
+def _uuid_str(raw: bytes) -> str:
+    # то же, что str(UUID(bytes=raw)), но без конструктора UUID
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _msgpack_default(value):
+    if isinstance(value, UUID):
+        return value.bytes
+    raise TypeError(f"Cannot serialize {type(value).__name__} to msgpack")
+
+
+def wire_format_of(headers: Optional[Sequence[Tuple[str, bytes]]]) -> WireFormat:
+    for name, value in headers or ():
+        if name == CONTENT_TYPE_HEADER:
+            try:
+                return WireFormat(value.decode("ascii"))
+            except ValueError:
+                break
+    return WireFormat.JSON
+
+
+def encode(message: BaseModel, wire_format: WireFormat) -> Tuple[bytes, List[Tuple[str, bytes]]]:
+    """
+    value и заголовки Kafka-записи. CHUNK_STRUCT откатывается к msgpack для всего, кроме промежуточных
+    чанков: в шапке нет места под token_usage, а финал всё равно разбирается полной моделью.
+    """
+    if wire_format is WireFormat.CHUNK_STRUCT and (
+        not isinstance(message, LlmStreamChunk) or message.is_final or message.token_usage is not None
+    ):
+        wire_format = WireFormat.MSGPACK
+
+    if wire_format is WireFormat.CHUNK_STRUCT:
+        value = _CHUNK_HEAD.pack(
+            message.request_id.bytes,
+            message.chat_session_id,
+            message.index,
+            message.is_final,
+            message.created_at.timestamp(),
+        ) + message.delta.encode("utf-8")
+    elif wire_format is WireFormat.MSGPACK:
+        # datetime — штатное msgpack-расширение Timestamp (у нас всегда tz-aware UTC)
+        value = msgpack.packb(message.model_dump(), default=_msgpack_default, datetime=True)
+    else:
+        value = message.model_dump_json().encode("utf-8")
+
+    return value, [(CONTENT_TYPE_HEADER, wire_format.value.encode("ascii"))]
+
+
+def decode(model: Type[M], value: bytes, headers: Optional[Sequence[Tuple[str, bytes]]] = None) -> M:
+    wire_format = wire_format_of(headers)
+
+    if wire_format is WireFormat.CHUNK_STRUCT:
+        request_id, chat_session_id, index, is_final, created_at = _CHUNK_HEAD.unpack_from(value)
+        # model_validate по готовым python-объектам быстрее model_construct (тот проходит по полям в python)
+        return model.model_validate({
+            "request_id": UUID(bytes=request_id),
+            "chat_session_id": chat_session_id,
+            "index": index,
+            "delta": value[_CHUNK_HEAD.size:].decode("utf-8"),
+            "is_final": is_final,
+            "created_at": datetime.fromtimestamp(created_at, timezone.utc),
+        })
+    if wire_format is WireFormat.MSGPACK:
+        return model.model_validate(msgpack.unpackb(value, timestamp=3))
+    return model.model_validate_json(value)
+
+
+def decode_chunk_view(value: bytes, headers: Optional[Sequence[Tuple[str, bytes]]] = None) -> ChunkView:
+    """
+    Лёгкое чтение LlmStreamChunk: без валидации, request_id — строкой в каноническом виде
+    (как str(UUID)), created_at не разбирается. Полная модель — decode(), она нужна только финалу.
+    """
+    wire_format = wire_format_of(headers)
+
+    if wire_format is WireFormat.CHUNK_STRUCT:
+        request_id, _, index, is_final, _ = _CHUNK_HEAD.unpack_from(value)
+        return ChunkView(_uuid_str(request_id), index, value[_CHUNK_HEAD.size:].decode("utf-8"), is_final)
+
+    if wire_format is WireFormat.MSGPACK:
+        payload = msgpack.unpackb(value)
+        request_id = payload["request_id"]
+        if isinstance(request_id, bytes):
+            request_id = _uuid_str(request_id)
+    else:
+        payload = orjson.loads(value)
+        request_id = payload["request_id"]
+    return ChunkView(request_id, payload["index"], payload.get("delta") or "", payload.get("is_final", False))
@@ -4,6 +4,10 @@ from typing import TypeVar
 from sqlalchemy.ext.asyncio import create_async_engine, async_scoped_session, async_sessionmaker
 
 from config.settings import Settings
+from core.metrics import collector, gauge
+
+DB_POOL_CONNECTIONS = gauge("db_pool_connections", "Соединения пула SQLAlchemy: checked_in / checked_out / overflow")
+DB_POOL_SIZE = gauge("db_pool_size", "Размер пула SQLAlchemy (pool_size)")
 
 T = TypeVar('T')
 
@@ -23,8 +27,16 @@ class DAO(metaclass=Singleton):
         self.db_engine = create_async_engine(url_object, pool_recycle=3, pool_pre_ping=True)
         self.Session = async_scoped_session(async_sessionmaker(bind=self.db_engine, expire_on_commit=False),
                                             current_task)
+        collector(self._collect_pool_metrics)
         print("DAO initialized")
 
+    def _collect_pool_metrics(self) -> None:
+        pool = self.db_engine.pool
+        DB_POOL_SIZE.set(pool.size())
+        DB_POOL_CONNECTIONS.set(pool.checkedin(), state="checked_in")
+        DB_POOL_CONNECTIONS.set(pool.checkedout(), state="checked_out")
+        DB_POOL_CONNECTIONS.set(max(0, pool.overflow()), state="overflow")
+
 
 def connection(method):
     async def wrapper(*args, **kwargs):
@@ -40,3 +52,23 @@ def connection(method):
                 await session.close()  # Закрываем сессию
 
     return wrapper
+
+
+def streaming_connection(method):
+    """
+    Аналог connection для async-генераторов: сессия живёт, пока генератор не исчерпан или не закрыт.
+    Нужен для серверных курсоров (session.stream / yield_per), где строки отдаются по мере чтения.
+    """
+    async def wrapper(*args, **kwargs):
+        async with DAO().Session() as session:
+            try:
+                kwargs["session"] = session
+                async for item in method(*args, **kwargs):
+                    yield item
+            except Exception as e:
+                await session.rollback()
+                raise e
+            finally:
+                await session.close()
+
+    return wrapper
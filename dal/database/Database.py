@@ -4,6 +4,8 @@ from .DatabaseAuthService import DatabaseAuthService
 import logging
 
 from .DatabaseChatService import DatabaseChatService
+from .DatabaseMaintenanceService import DatabaseMaintenanceService
+from .DatabaseUsageService import DatabaseUsageService
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,3 +16,5 @@ logging.getLogger('alembic').setLevel(logging.DEBUG)
 class Database:
     AuthService = DatabaseAuthService()
     ChatService = DatabaseChatService()
+    MaintenanceService = DatabaseMaintenanceService()
+    UsageService = DatabaseUsageService()
@@ -1,16 +1,49 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, func, Row
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from dal.DAO import connection
-from dal.schema.Entity.BackendSchema import ChatSession, Message
+from dal.DAO import connection, streaming_connection
+from dal.database.archive_codec import unpack_message_rows
+from dal.schema.Entity.BackendSchema import ArchivedSession, ChatSession, Message, FTS_CONFIG
 from rest.Chat.schemas import ChatSessionCreate, MessageCreate, MessageRole
 
 class ChatSessionNotFound(Exception):
     pass
 
+
+# Колонки в порядке полей ChatSessionRead / MessageRead.
+# Используются быстрым путём сериализации: строки идут прямо в JSON, минуя ORM и pydantic.
+SESSION_READ_COLUMNS = (
+    ChatSession.id,
+    ChatSession.user_id,
+    ChatSession.title,
+    ChatSession.model_name,
+    ChatSession.temperature,
+    ChatSession.max_tokens,
+    ChatSession.extra_params,
+    ChatSession.created_at,
+    ChatSession.updated_at,
+    ChatSession.is_archived,
+    ChatSession.messages_archived,
+)
+
+MESSAGE_READ_COLUMNS = (
+    Message.id,
+    Message.session_id,
+    Message.role,
+    Message.content,
+    Message.created_at,
+    Message.prompt_tokens,
+    Message.completion_tokens,
+    Message.latency_ms,
+    Message.finish_reason,
+    Message.request_id,
+    Message.meta,
+    Message.is_visible,
+)
+
 class DatabaseChatService:
     @staticmethod
     @connection
@@ -82,6 +115,135 @@ class DatabaseChatService:
         result = await session.execute(stmt)
         return result.scalars().first()
 
+    @staticmethod
+    @connection
+    async def get_session_rows_for_user(
+        session_id: int,
+        user_id: int,
+        session: AsyncSession = None,
+    ) -> Optional[Tuple[Row, List[Row]]]:
+        """
+        То же, что get_session_for_user(with_messages=True), но без ORM:
+        возвращает (строка сессии, строки сообщений) из SESSION_READ_COLUMNS / MESSAGE_READ_COLUMNS.
+        """
+        session_stmt = select(*SESSION_READ_COLUMNS).where(
+            ChatSession.id == session_id,
+            ChatSession.user_id == user_id,
+        )
+        session_row = (await session.execute(session_stmt)).first()
+        if session_row is None:
+            return None
+
+        messages_stmt = (
+            select(*MESSAGE_READ_COLUMNS)
+            .where(Message.session_id == session_id)
+            .order_by(Message.created_at)
+        )
+        message_rows = list((await session.execute(messages_stmt)).all())
+
+        # холодная сессия: отдаём историю прямо из архивного блоба, не возвращая её в messages
+        if not message_rows and session_row.messages_archived:
+            archived = await session.get(ArchivedSession, session_id)
+            if archived is not None:
+                message_rows = unpack_message_rows(archived.payload, archived.codec)
+
+        return session_row, message_rows
+
+    @staticmethod
+    @connection
+    async def search_messages(
+        *,
+        user_id: int,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        session: AsyncSession = None,
+    ) -> List[Row]:
+        """
+        Полнотекстовый поиск по сообщениям в сессиях пользователя.
+
+        Фильтр идёт по GIN-индексу на messages.search_vector, сортировка — по ts_rank_cd.
+        query разбирается websearch_to_tsquery: поддерживаются "фразы", OR и -исключения.
+        """
+        tsquery = func.websearch_to_tsquery(FTS_CONFIG, query)
+        rank = func.ts_rank_cd(Message.search_vector, tsquery).label("rank")
+        # ts_headline считается уже после ORDER BY/LIMIT — только для строк страницы
+        headline = func.ts_headline(
+            FTS_CONFIG,
+            Message.content,
+            tsquery,
+            "MaxFragments=2, MaxWords=20, MinWords=5",
+        ).label("headline")
+
+        stmt = (
+            select(
+                Message.id,
+                Message.session_id,
+                ChatSession.title.label("session_title"),
+                Message.role,
+                Message.created_at,
+                headline,
+                rank,
+            )
+            .join(ChatSession, ChatSession.id == Message.session_id)
+            .where(
+                ChatSession.user_id == user_id,
+                Message.is_visible == True,  # noqa: E712
+                Message.search_vector.bool_op("@@")(tsquery),
+            )
+            .order_by(desc(rank), desc(Message.id))
+            .limit(limit)
+            .offset(offset)
+        )
+        result = await session.execute(stmt)
+        return list(result.all())
+
+    @staticmethod
+    @streaming_connection
+    async def stream_message_rows(
+        *,
+        user_id: int,
+        session_id: Optional[int] = None,
+        batch_size: int = 1000,
+        session: AsyncSession = None,
+    ) -> AsyncIterator[List[Row]]:
+        """
+        Сообщения пользователя (одной сессии или всех его сессий) пачками по batch_size строк.
+
+        Читаем серверным курсором (yield_per), поэтому в памяти одновременно лежит не больше
+        одной пачки — независимо от размера истории. Холодные сессии идут после горячих,
+        по одной сессии на пачку.
+        """
+        stmt = (
+            select(*MESSAGE_READ_COLUMNS)
+            .join(ChatSession, ChatSession.id == Message.session_id)
+            .where(ChatSession.user_id == user_id)
+            .order_by(Message.session_id, Message.created_at)
+            .execution_options(yield_per=batch_size)
+        )
+        if session_id is not None:
+            stmt = stmt.where(Message.session_id == session_id)
+
+        result = await session.stream(stmt)
+        async for partition in result.partitions():
+            yield partition
+
+        # сообщения холодных сессий — по одному архивному блобу за раз
+        archived_stmt = (
+            select(ArchivedSession.payload, ArchivedSession.codec)
+            .where(ArchivedSession.user_id == user_id)
+            .order_by(ArchivedSession.session_id)
+            .execution_options(yield_per=1)
+        )
+        if session_id is not None:
+            archived_stmt = archived_stmt.where(ArchivedSession.session_id == session_id)
+
+        archived_result = await session.stream(archived_stmt)
+        async for payload, codec in archived_result:
+            rows = unpack_message_rows(payload, codec)
+            if rows:
+                yield rows
+
     @staticmethod
     @connection
     async def create_message(
@@ -90,6 +252,8 @@ class DatabaseChatService:
         role: MessageRole,
         content: str,
         user_id: int = None,
+        request_id: Optional[str] = None,
+        finish_reason: Optional[str] = None,
         meta: Optional[Dict[str, Any]] = None,
         prompt_tokens: Optional[int] = None,
         completion_tokens: Optional[int] = None,
@@ -111,6 +275,8 @@ class DatabaseChatService:
             session_id=session_id,
             role=role,
             content=content,
+            request_id=request_id,
+            finish_reason=finish_reason,
             meta=meta,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
@@ -121,3 +287,69 @@ class DatabaseChatService:
         await session.commit()
         await session.refresh(msg)
         return msg
+
+    @staticmethod
+    @connection
+    async def create_generated_message(
+        *,
+        session_id: int,
+        role: MessageRole,
+        content: str,
+        request_id: str,
+        finish_reason: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        latency_ms: Optional[int] = None,
+        session: AsyncSession = None,
+    ) -> Optional[Message]:
+        """
+        Идемпотентное сохранение ответа генерации: не больше одного сообщения на request_id.
+        Повторная доставка финала из Kafka (at-least-once) вернёт None и ничего не запишет.
+
+        UNIQUE(request_id) на партиционированной таблице невозможен, поэтому проверка
+        выполняется под транзакционным advisory lock'ом по request_id.
+        """
+        await session.execute(select(func.pg_advisory_xact_lock(func.hashtext(request_id))))
+        existing = await session.scalar(
+            select(Message.id).where(Message.request_id == request_id).limit(1)
+        )
+        if existing is not None:
+            await session.rollback()
+            return None
+
+        msg = Message(
+            session_id=session_id,
+            role=role,
+            content=content,
+            request_id=request_id,
+            finish_reason=finish_reason,
+            meta=meta,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency_ms=latency_ms,
+        )
+        session.add(msg)
+
+        await session.commit()
+        await session.refresh(msg)
+        return msg
+
+    @staticmethod
+    @connection
+    async def get_message_by_request_id(
+        request_id: str,
+        user_id: Optional[int] = None,
+        session: AsyncSession = None,
+    ) -> Optional[Message]:
+        """
+        Сообщение, созданное генерацией request_id (поиск по индексу messages.request_id).
+        Если передан user_id — только среди сессий этого пользователя.
+        """
+        stmt = select(Message).where(Message.request_id == request_id)
+        if user_id is not None:
+            stmt = stmt.join(ChatSession, ChatSession.id == Message.session_id).where(
+                ChatSession.user_id == user_id
+            )
+
+        return await session.scalar(stmt)
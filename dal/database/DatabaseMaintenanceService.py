@@ -0,0 +1,317 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from logging import Logger
+from typing import List, Tuple
+
+from sqlalchemy import select, delete, update, insert, exists, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dal.DAO import connection
+from dal.database.archive_codec import ARCHIVE_CODEC, pack_message_rows, unpack_message_rows
+from dal.database.DatabaseChatService import MESSAGE_READ_COLUMNS
+from dal.database.DatabaseUsageService import DatabaseUsageService
+from dal.schema.Entity.BackendSchema import ArchivedSession, ChatSession, Message, MessageRole
+
+_PARTITION_PREFIX = "messages_p"
+_DEFAULT_PARTITION = "messages_default"
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+async def _messages_is_partitioned(session: AsyncSession) -> bool:
+    return bool(await session.scalar(text(
+        "SELECT EXISTS ("
+        " SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid"
+        " WHERE c.relname = 'messages')"
+    )))
+
+
+# колонки messages без generated search_vector — для переноса строк между партициями
+_MESSAGE_COPY_COLUMNS = ", ".join(c.name for c in Message.__table__.columns if c.computed is None)
+
+
+async def _evict_from_default(session: AsyncSession, lower: date, upper: date) -> int:
+    """
+    Забрать из DEFAULT-партиции строки диапазона новой партиции во временную таблицу _default_moved.
+    Иначе CREATE TABLE ... PARTITION OF упадёт: DEFAULT уже содержит строки, которые должны попасть в неё
+    (сообщения успели записаться до создания месячной партиции).
+    """
+    # вставки в messages ждут до конца транзакции — строки диапазона не появятся в DEFAULT снова
+    await session.execute(text(f"LOCK TABLE {_DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+    where = f"created_at >= '{lower.isoformat()} 00:00:00+00' AND created_at < '{upper.isoformat()} 00:00:00+00'"
+    await session.execute(text(
+        f"CREATE TEMP TABLE _default_moved ON COMMIT DROP AS "
+        f"SELECT {_MESSAGE_COPY_COLUMNS} FROM {_DEFAULT_PARTITION} WHERE {where}"
+    ))
+    moved = (await session.execute(text(f"DELETE FROM {_DEFAULT_PARTITION} WHERE {where}"))).rowcount or 0
+    if not moved:
+        await session.execute(text("DROP TABLE _default_moved"))
+    return moved
+
+
+async def _lock_session(session: AsyncSession, chat_session_id: int, messages_archived: bool) -> bool:
+    """SELECT ... FOR UPDATE строки chat_sessions; True — сессия есть и её messages_archived как ожидалось."""
+    current = await session.scalar(
+        select(ChatSession.messages_archived)
+        .where(ChatSession.id == chat_session_id)
+        .with_for_update()
+    )
+    return current is not None and current == messages_archived
+
+
+class DatabaseMaintenanceService:
+    """
+    Обслуживание горячей таблицы messages:
+      • месячные range-партиции по created_at (создаём заранее, пустые старые — удаляем)
+      • перенос сообщений архивных/давно неактивных сессий в archived_sessions (сжатый блоб)
+    """
+
+    # ---------- партиции ----------
+
+    @staticmethod
+    @connection
+    async def list_message_partitions(session: AsyncSession = None) -> List[Tuple[str, str]]:
+        """(имя партиции, границы) для всех партиций messages."""
+        result = await session.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'messages' "
+            "ORDER BY c.relname"
+        ))
+        return [(name, bound) for name, bound in result.all()]
+
+    @staticmethod
+    @connection
+    async def ensure_message_partitions(
+        months_ahead: int = 2,
+        session: AsyncSession = None,
+    ) -> List[str]:
+        """
+        Создаёт партиции messages_pYYYYMM на текущий месяц и months_ahead вперёд + DEFAULT-партицию.
+        Строки, уже попавшие в DEFAULT в диапазон новой партиции, переносятся в неё.
+        Возвращает имена созданных партиций. Если messages не партиционирована (старая схема) — ничего не делает.
+        """
+        if not await _messages_is_partitioned(session):
+            return []
+
+        existing = set((await session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'messages'"
+        ))).scalars().all())
+
+        created: List[str] = []
+        month_start = datetime.now(timezone.utc).date().replace(day=1)
+        for i in range(months_ahead + 1):
+            lower = _add_months(month_start, i)
+            upper = _add_months(month_start, i + 1)
+            name = f"{_PARTITION_PREFIX}{lower:%Y%m}"
+            if name in existing:
+                continue
+            bounds = f"FROM ('{lower.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+            moved = 0
+            if _DEFAULT_PARTITION in existing:
+                moved = await _evict_from_default(session, lower, upper)
+            await session.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages FOR VALUES {bounds}"))
+            if moved:
+                await session.execute(text(
+                    f"INSERT INTO messages ({_MESSAGE_COPY_COLUMNS}) SELECT {_MESSAGE_COPY_COLUMNS} FROM _default_moved"
+                ))
+                await session.execute(text("DROP TABLE _default_moved"))
+            created.append(name)
+
+        if _DEFAULT_PARTITION not in existing:
+            await session.execute(text(f"CREATE TABLE IF NOT EXISTS {_DEFAULT_PARTITION} PARTITION OF messages DEFAULT"))
+            created.append(_DEFAULT_PARTITION)
+
+        await session.commit()
+        return created
+
+    @staticmethod
+    @connection
+    async def drop_empty_message_partitions(session: AsyncSession = None) -> List[str]:
+        """
+        Удаляет пустые месячные партиции, целиком лежащие в прошлом
+        (после архивации холодных сессий старые месяцы обычно пустеют).
+        """
+        if not await _messages_is_partitioned(session):
+            return []
+
+        current = f"{_PARTITION_PREFIX}{datetime.now(timezone.utc):%Y%m}"
+        names = (await session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'messages' AND c.relname LIKE :prefix"
+        ), {"prefix": f"{_PARTITION_PREFIX}%"})).scalars().all()
+
+        dropped: List[str] = []
+        # имена вида messages_pYYYYMM сравниваются лексикографически как даты
+        for name in sorted(n for n in names if n < current):
+            is_empty = not await session.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})"))
+            if is_empty:
+                await session.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+
+        await session.commit()
+        return dropped
+
+    # ---------- холодный архив ----------
+
+    @staticmethod
+    @connection
+    async def archive_cold_sessions(
+        *,
+        older_than_days: int,
+        batch_size: int = 100,
+        session: AsyncSession = None,
+    ) -> int:
+        """
+        Переносит сообщения сессий, которые архивированы (is_archived) или неактивны older_than_days дней,
+        в archived_sessions одним сжатым блобом и удаляет их из messages.
+        Каждая сессия — отдельная транзакция. Возвращает число заархивированных сессий.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+        has_recent = exists().where(Message.session_id == ChatSession.id, Message.created_at >= cutoff)
+        has_any = exists().where(Message.session_id == ChatSession.id)
+
+        candidates = (await session.execute(
+            select(ChatSession.id, ChatSession.user_id)
+            .where(
+                ChatSession.messages_archived == False,  # noqa: E712
+                or_(ChatSession.is_archived == True, ~has_recent),  # noqa: E712
+                has_any,
+            )
+            .limit(batch_size)
+        )).all()
+
+        archived = 0
+        for chat_session_id, user_id in candidates:
+            # блокировка строки сессии: вставка сообщения (FK) и restore_session ждут конца транзакции,
+            # а холодность перепроверяется уже под ней — сессию могли возобновить после выборки кандидатов
+            if not await _lock_session(session, chat_session_id, messages_archived=False):
+                await session.rollback()
+                continue
+            is_archived = await session.scalar(select(ChatSession.is_archived).where(ChatSession.id == chat_session_id))
+            if not is_archived and await session.scalar(select(
+                exists().where(Message.session_id == chat_session_id, Message.created_at >= cutoff)
+            )):
+                await session.rollback()
+                continue
+
+            rows = (await session.execute(
+                select(*MESSAGE_READ_COLUMNS)
+                .where(Message.session_id == chat_session_id)
+                .order_by(Message.created_at)
+            )).all()
+            if not rows:
+                await session.rollback()
+                continue
+
+            # на случай повторной архивации после restore_session
+            await session.execute(delete(ArchivedSession).where(ArchivedSession.session_id == chat_session_id))
+            session.add(ArchivedSession(
+                session_id=chat_session_id,
+                user_id=user_id,
+                message_count=len(rows),
+                first_message_at=rows[0].created_at,
+                last_message_at=rows[-1].created_at,
+                codec=ARCHIVE_CODEC,
+                payload=pack_message_rows(rows),
+            ))
+            # удаляем ровно то, что упаковано в блоб
+            await session.execute(delete(Message).where(Message.id.in_([row.id for row in rows])))
+            # updated_at не трогаем, иначе сессия «всплывёт» в списке
+            await session.execute(
+                update(ChatSession)
+                .where(ChatSession.id == chat_session_id)
+                .values(messages_archived=True, updated_at=ChatSession.updated_at)
+            )
+            await session.commit()
+            archived += 1
+
+        return archived
+
+    @staticmethod
+    @connection
+    async def restore_session(session_id: int, session: AsyncSession = None) -> int:
+        """
+        Возвращает сообщения сессии из холодного архива в messages (например, перед новым сообщением в чат).
+        Возвращает число восстановленных сообщений.
+        """
+        # та же блокировка, что в archive_cold_sessions: параллельные отправки в холодную сессию
+        # восстанавливают её по очереди, второй уже видит messages_archived=False и ничего не вставляет
+        if not await _lock_session(session, session_id, messages_archived=True):
+            await session.rollback()
+            return 0
+
+        archived = await session.get(ArchivedSession, session_id)
+        restored = 0
+        if archived is not None:
+            values = []
+            for row in unpack_message_rows(archived.payload, archived.codec):
+                value = row._asdict()
+                value["role"] = MessageRole(value["role"])
+                value["created_at"] = datetime.fromisoformat(value["created_at"])
+                values.append(value)
+
+            if values:
+                await session.execute(insert(Message), values)
+            await session.delete(archived)
+            restored = len(values)
+
+        await session.execute(
+            update(ChatSession)
+            .where(ChatSession.id == session_id)
+            .values(messages_archived=False, updated_at=ChatSession.updated_at)
+        )
+        await session.commit()
+        return restored
+
+    # ---------- фоновая задача ----------
+
+    @staticmethod
+    async def run_forever(
+        logger: Logger,
+        interval_s: int,
+        months_ahead: int,
+        archive_after_days: int,
+        batch_size: int,
+    ) -> None:
+        """Периодическое обслуживание: партиции + архивация пачками, пока есть что архивировать."""
+        while True:
+            try:
+                created = await DatabaseMaintenanceService.ensure_message_partitions(months_ahead=months_ahead)
+                if created:
+                    logger.info("Created message partitions: %s", ", ".join(created))
+
+                total = 0
+                while True:
+                    archived = await DatabaseMaintenanceService.archive_cold_sessions(
+                        older_than_days=archive_after_days,
+                        batch_size=batch_size,
+                    )
+                    total += archived
+                    if archived < batch_size:
+                        break
+                if total:
+                    logger.info("Archived %s cold chat sessions", total)
+
+                dropped = await DatabaseMaintenanceService.drop_empty_message_partitions()
+                if dropped:
+                    logger.info("Dropped empty message partitions: %s", ", ".join(dropped))
+
+                # отметки об учтённых пачках аналитики нужны, только пока Kafka может их передоставить
+                await DatabaseUsageService.prune_processed_batches()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Database maintenance failed")
+
+            await asyncio.sleep(interval_s)
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
+
+from sqlalchemy import Row, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.llm_schemas import UsageEventBatch
+from dal.DAO import connection
+from dal.schema.Entity.BackendSchema import ProcessedUsageBatch, UsageHourly
+
+# (user_id, model, начало часа)
+UsageKey = Tuple[int, str, datetime]
+
+_COUNTERS = (
+    "requests",
+    "cached_requests",
+    "error_requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "latency_ms_sum",
+    "latency_count",
+)
+
+
+def _hour(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def rollup(batches: Sequence[UsageEventBatch]) -> Dict[UsageKey, Dict[str, int]]:
+    """Свернуть события в строки usage_hourly (в памяти, до похода в БД)."""
+    rows: Dict[UsageKey, Dict[str, int]] = {}
+    for batch in batches:
+        for event in batch.events:
+            key = (event.user_id, event.model, _hour(event.created_at))
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = dict.fromkeys(_COUNTERS, 0)
+            row["requests"] += 1
+            row["cached_requests"] += int(event.cached)
+            row["error_requests"] += int(event.finish_reason == "error")
+            row["prompt_tokens"] += event.prompt_tokens
+            row["completion_tokens"] += event.completion_tokens
+            if event.latency_ms is not None:
+                row["latency_ms_sum"] += event.latency_ms
+                row["latency_count"] += 1
+    return rows
+
+
+class DatabaseUsageService:
+    """Предагрегированное использование LLM (usage_hourly) — пишет агрегатор analytics_tasks."""
+
+    # дольше Kafka пачку повторно не доставит (retention топика по умолчанию — 7 дней)
+    PROCESSED_BATCH_TTL_DAYS = 7
+
+    @staticmethod
+    @connection
+    async def apply_usage_batches(
+        batches: Sequence[UsageEventBatch],
+        session: AsyncSession = None,
+    ) -> int:
+        """
+        Учесть пачки одной транзакцией: отметка batch_id + upsert счётчиков.
+        Уже учтённые пачки (повторная доставка) пропускаются. Возвращает число новых событий.
+        """
+        by_id = {str(batch.batch_id): batch for batch in batches}
+        if not by_id:
+            return 0
+
+        fresh = set(await session.scalars(
+            insert(ProcessedUsageBatch)
+            .values([{"batch_id": batch_id} for batch_id in by_id])
+            .on_conflict_do_nothing(index_elements=[ProcessedUsageBatch.batch_id])
+            .returning(ProcessedUsageBatch.batch_id)
+        ))
+        rows = rollup([batch for batch_id, batch in by_id.items() if batch_id in fresh])
+
+        if rows:
+            stmt = insert(UsageHourly).values([
+                {"user_id": user_id, "model": model, "hour": hour, **counters}
+                for (user_id, model, hour), counters in rows.items()
+            ])
+            table = UsageHourly.__table__.c
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[UsageHourly.user_id, UsageHourly.model, UsageHourly.hour],
+                set_={name: table[name] + stmt.excluded[name] for name in _COUNTERS},
+            ))
+        await session.commit()
+        return sum(row["requests"] for row in rows.values())
+
+    @staticmethod
+    @connection
+    async def get_usage(
+        user_id: int,
+        since: datetime,
+        until: datetime,
+        granularity: Literal["hour", "day"] = "day",
+        model: Optional[str] = None,
+        session: AsyncSession = None,
+    ) -> List[Row]:
+        """Использование пользователя по интервалам и моделям — только по первичному ключу usage_hourly."""
+        bucket = func.date_trunc(granularity, UsageHourly.hour).label("bucket")
+        stmt = (
+            select(
+                bucket,
+                UsageHourly.model,
+                func.sum(UsageHourly.requests).label("requests"),
+                func.sum(UsageHourly.cached_requests).label("cached_requests"),
+                func.sum(UsageHourly.error_requests).label("error_requests"),
+                func.sum(UsageHourly.prompt_tokens).label("prompt_tokens"),
+                func.sum(UsageHourly.completion_tokens).label("completion_tokens"),
+                func.sum(UsageHourly.latency_ms_sum).label("latency_ms_sum"),
+                func.sum(UsageHourly.latency_count).label("latency_count"),
+            )
+            .where(
+                UsageHourly.user_id == user_id,
+                UsageHourly.hour >= _hour(since),
+                UsageHourly.hour < until,
+            )
+            .group_by(bucket, UsageHourly.model)
+            .order_by(bucket, UsageHourly.model)
+        )
+        if model is not None:
+            stmt = stmt.where(UsageHourly.model == model)
+        result = await session.execute(stmt)
+        return list(result.all())
+
+    @staticmethod
+    @connection
+    async def prune_processed_batches(
+        older_than_days: int = PROCESSED_BATCH_TTL_DAYS,
+        session: AsyncSession = None,
+    ) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+        result = await session.execute(
+            delete(ProcessedUsageBatch).where(ProcessedUsageBatch.processed_at < cutoff)
+        )
+        await session.commit()
+        return result.rowcount or 0
@@ -0,0 +1,40 @@
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, List, Sequence
+
+import orjson
+
+# Кодек холодного архива: строки сообщений -> orjson -> zlib (без внешних зависимостей вроде zstd)
+ARCHIVE_CODEC = "zlib"
+_ZLIB_LEVEL = 6
+
+
+@lru_cache(maxsize=8)
+def _row_type(fields: tuple):
+    return namedtuple("ArchivedRow", fields)
+
+
+def pack_message_rows(rows: Sequence[Any]) -> bytes:
+    """Строки сообщений (Row с _fields) -> сжатый блоб {"fields": [...], "rows": [[...], ...]}."""
+    fields = list(rows[0]._fields) if rows else []
+    payload = orjson.dumps(
+        {"fields": fields, "rows": [list(row) for row in rows]},
+        option=orjson.OPT_UTC_Z,
+    )
+    return zlib.compress(payload, _ZLIB_LEVEL)
+
+
+def unpack_message_rows(blob: bytes, codec: str = ARCHIVE_CODEC) -> List[Any]:
+    """
+    Обратно в строки с _fields (namedtuple), чтобы их понимал тот же быстрый путь сериализации.
+    Даты остаются ISO-строками, роль — строковым значением enum'а.
+    """
+    if codec != ARCHIVE_CODEC:
+        raise ValueError(f"Unknown archive codec {codec!r}")
+
+    data = orjson.loads(zlib.decompress(blob))
+    if not data["fields"]:
+        return []
+    row_type = _row_type(tuple(data["fields"]))
+    return [row_type(*row) for row in data["rows"]]
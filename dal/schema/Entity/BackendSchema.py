@@ -7,15 +7,19 @@ from typing import Optional, Dict, Any
 from sqlalchemy import (
     String,
     Integer,
+    BigInteger,
     DateTime,
     ForeignKey,
     Text,
     Boolean,
-    JSON,
     Enum,
+    LargeBinary,
+    Uuid,
     Index,
+    Computed,
     func,
 )
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from ..Base import Base
@@ -30,6 +34,10 @@ class MessageRole(str, enum.Enum):
     TOOL = "tool"
 
 
+# Конфигурация полнотекстового поиска: без стемминга, т.к. в чатах вперемешку русский и английский
+FTS_CONFIG = "simple"
+
+
 # ---------- МОДЕЛИ ----------
 
 class User(Base):
@@ -78,7 +86,7 @@ class ChatSession(Base):
     model_name: Mapped[str] = mapped_column(String(100), default="gemma-3")
     temperature: Mapped[float] = mapped_column(default=0.7)
     max_tokens: Mapped[int] = mapped_column(default=1024)
-    extra_params: Mapped[Dict[str, Any] | None] = mapped_column(JSON, nullable=True)
+    extra_params: Mapped[Dict[str, Any] | None] = mapped_column(JSONB, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
@@ -87,6 +95,8 @@ class ChatSession(Base):
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
     is_archived: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Сообщения сессии перенесены в холодный архив (archived_sessions), в messages их нет
+    messages_archived: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
 
     user: Mapped["User"] = relationship(back_populates="chat_sessions")
     messages: Mapped[list["Message"]] = relationship(
@@ -105,8 +115,11 @@ class Message(Base):
     """
 
     __tablename__ = "messages"
+    # Range-партиционирование по created_at (месячные партиции создаёт DatabaseMaintenanceService).
+    # Поэтому created_at входит в первичный ключ, а request_id не может быть глобально UNIQUE.
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     session_id: Mapped[int] = mapped_column(ForeignKey("chat_sessions.id"), index=True)
 
     role: Mapped[MessageRole] = mapped_column(Enum(MessageRole), index=True)
@@ -116,17 +129,31 @@ class Message(Base):
     prompt_tokens: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     completion_tokens: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     latency_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Причина завершения генерации: stop / length / cancelled / error ...
+    finish_reason: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+
+    # request_id генерации LLM, которой создано ассистентское сообщение (для идемпотентности и поиска)
+    request_id: Mapped[Optional[str]] = mapped_column(Uuid(as_uuid=False), nullable=True, index=True)
 
     # Любые дополнительные данные: сырой ответ модели, http-пэйлоады и т.д.
-    meta: Mapped[Dict[str, Any] | None] = mapped_column(JSON, nullable=True)
+    meta: Mapped[Dict[str, Any] | None] = mapped_column(JSONB, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), server_default=func.now(), index=True
+        DateTime(timezone=True), server_default=func.now(), primary_key=True, index=True
     )
     is_visible: Mapped[bool] = mapped_column(
         Boolean, default=True
     )  # мягкое удаление/скрытие
 
+    # Генерируемая колонка для полнотекстового поиска (GIN-индекс ниже).
+    # deferred — чтобы обычные выборки сообщений её не тянули.
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{FTS_CONFIG}', coalesce(content, ''))", persisted=True),
+        nullable=True,
+        deferred=True,
+    )
+
     session: Mapped["ChatSession"] = relationship(back_populates="messages")
 
     def __repr__(self) -> str:
@@ -136,6 +163,79 @@ class Message(Base):
         )
 
 
+class ArchivedSession(Base):
+    """
+    Холодный архив сообщений сессии: вся история одним сжатым блобом.
+    Строки удаляются из messages, поэтому индексы горячей таблицы остаются маленькими.
+    """
+
+    __tablename__ = "archived_sessions"
+
+    session_id: Mapped[int] = mapped_column(ForeignKey("chat_sessions.id"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+
+    message_count: Mapped[int] = mapped_column(Integer)
+    first_message_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_message_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # Кодек payload: сейчас только "zlib" (orjson -> zlib)
+    codec: Mapped[str] = mapped_column(String(16), default="zlib")
+    payload: Mapped[bytes] = mapped_column(LargeBinary)
+
+    archived_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+    def __repr__(self) -> str:
+        return f"<ArchivedSession session_id={self.session_id} messages={self.message_count}>"
+
+
+class UsageHourly(Base):
+    """
+    Предагрегированное использование LLM: одна строка на (пользователь, модель, час).
+    Пополняется агрегатором analytics_tasks; отчёты читают её, а не messages.
+    """
+
+    __tablename__ = "usage_hourly"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    model: Mapped[str] = mapped_column(String(128), primary_key=True)
+    # начало часа (UTC)
+    hour: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+
+    requests: Mapped[int] = mapped_column(Integer, default=0)
+    cached_requests: Mapped[int] = mapped_column(Integer, default=0)
+    error_requests: Mapped[int] = mapped_column(Integer, default=0)
+    prompt_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    completion_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    # сумма и число известных latency — среднее считается при чтении
+    latency_ms_sum: Mapped[int] = mapped_column(BigInteger, default=0)
+    latency_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self) -> str:
+        return f"<UsageHourly user_id={self.user_id} model={self.model} hour={self.hour}>"
+
+
+class ProcessedUsageBatch(Base):
+    """Уже учтённые пачки analytics_tasks: повторная доставка из Kafka не удваивает usage_hourly."""
+
+    __tablename__ = "processed_usage_batches"
+
+    batch_id: Mapped[str] = mapped_column(Uuid(as_uuid=False), primary_key=True)
+    processed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
+
+
 # Индексы для ускорения выборок
 Index("ix_messages_session_created", Message.session_id, Message.created_at)
 Index("ix_sessions_user_created", ChatSession.user_id, ChatSession.created_at)
+Index("ix_messages_search_vector", Message.search_vector, postgresql_using="gin")
+# jsonb_path_ops: компактный GIN под запросы вида meta @> '{"key": "value"}'
+Index("ix_messages_meta", Message.meta, postgresql_using="gin", postgresql_ops={"meta": "jsonb_path_ops"})
+Index(
+    "ix_sessions_extra_params",
+    ChatSession.extra_params,
+    postgresql_using="gin",
+    postgresql_ops={"extra_params": "jsonb_path_ops"},
+)
@@ -0,0 +1,67 @@
+-- Перевод существующей (непартиционированной) таблицы messages на RANGE-партиционирование по created_at.
+--
+-- Схема после миграции совпадает с BackendSchema.Message: PK (id, created_at), request_id — обычный индекс
+-- (глобальный UNIQUE без ключа партиционирования Postgres не поддерживает), месячные партиции messages_pYYYYMM
+-- и DEFAULT-партиция messages_default. Партиции на будущее дальше создаёт приложение
+-- (DatabaseMaintenanceService.ensure_message_partitions — на старте и в фоновой задаче обслуживания).
+--
+-- Скрипт переносит колонки старой messages как есть, поэтому сначала её доводят до текущей схемы
+-- (request_id, finish_reason, jsonb meta, search_vector, новые таблицы). Порядок запуска при остановленном
+-- бэкенде, каждый скрипт — одной транзакцией (при ошибке ничего не меняется):
+--   1) psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f dal/sql/schema_upgrade.sql
+--   2) psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f dal/sql/messages_partitioning.sql
+-- Таблица копируется целиком: на время миграции нужно место ещё на одну копию messages.
+
+BEGIN;
+
+LOCK TABLE messages IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE messages RENAME TO messages_legacy;
+
+-- колонки, default'ы (в т.ч. nextval последовательности id) и generated search_vector; индексы — ниже
+CREATE TABLE messages (LIKE messages_legacy INCLUDING DEFAULTS INCLUDING GENERATED)
+    PARTITION BY RANGE (created_at);
+ALTER TABLE messages
+    ADD CONSTRAINT fk__messages__session_id__chat_sessions FOREIGN KEY (session_id) REFERENCES chat_sessions (id);
+
+-- месячные партиции от самого старого сообщения до текущего месяца + 2 вперёд, и DEFAULT
+DO $$
+DECLARE
+    month_start date := date_trunc('month', coalesce((SELECT min(created_at) FROM messages_legacy), now()) AT TIME ZONE 'UTC');
+    last_month date := date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months';
+BEGIN
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+            'messages_p' || to_char(month_start, 'YYYYMM'),
+            month_start::text || ' 00:00:00+00',
+            (month_start + interval '1 month')::date::text || ' 00:00:00+00'
+        );
+        month_start := month_start + interval '1 month';
+    END LOOP;
+END $$;
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+INSERT INTO messages (
+    id, session_id, role, content, prompt_tokens, completion_tokens, latency_ms,
+    finish_reason, request_id, meta, created_at, is_visible
+)
+SELECT
+    id, session_id, role, content, prompt_tokens, completion_tokens, latency_ms,
+    finish_reason, request_id, meta, created_at, is_visible
+FROM messages_legacy;
+
+-- последовательность id переходит к новой таблице, иначе DROP удалит её вместе со старой
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+DROP TABLE messages_legacy;
+
+-- ключ и индексы на родителе — Postgres создаёт их на всех партициях
+ALTER TABLE messages ADD CONSTRAINT pk__messages PRIMARY KEY (id, created_at);
+CREATE INDEX ix__messages__created_at ON messages (created_at);
+CREATE INDEX ix__messages__request_id ON messages (request_id);
+CREATE INDEX ix__messages__role ON messages (role);
+CREATE INDEX ix__messages__session_id ON messages (session_id);
+CREATE INDEX ix_messages_session_created ON messages (session_id, created_at);
+CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector);
+CREATE INDEX ix_messages_meta ON messages USING gin (meta jsonb_path_ops);
+
+COMMIT;
@@ -0,0 +1,77 @@
+-- Доводит базу со старой схемой (до партиционирования, архива и аналитики) до BackendSchema.
+--
+-- Порядок запуска при остановленном бэкенде:
+--   1) psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f dal/sql/schema_upgrade.sql
+--   2) psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f dal/sql/messages_partitioning.sql
+-- Шаг 2 копирует колонки старой messages (request_id, finish_reason, jsonb meta, search_vector),
+-- поэтому они должны появиться раньше. Скрипт идемпотентный: повторный запуск
+-- (в том числе на уже партиционированной messages) ничего не меняет.
+-- Одна транзакция; добавление search_vector и перевод meta в jsonb переписывают messages целиком.
+
+BEGIN;
+
+-- chat_sessions: jsonb extra_params (GIN-индекс ниже) и признак холодного архива
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'chat_sessions' AND column_name = 'extra_params') = 'json' THEN
+        ALTER TABLE chat_sessions ALTER COLUMN extra_params TYPE jsonb USING extra_params::jsonb;
+    END IF;
+END $$;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS messages_archived boolean NOT NULL DEFAULT false;
+CREATE INDEX IF NOT EXISTS ix_sessions_extra_params ON chat_sessions USING gin (extra_params jsonb_path_ops);
+
+-- messages: поля генерации, jsonb meta и колонка полнотекстового поиска
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'messages' AND column_name = 'meta') = 'json' THEN
+        ALTER TABLE messages ALTER COLUMN meta TYPE jsonb USING meta::jsonb;
+    END IF;
+END $$;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS finish_reason varchar(32);
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS request_id uuid;
+-- конфигурация to_tsvector — BackendSchema.FTS_CONFIG
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(content, ''))) STORED;
+
+-- холодный архив сессий (DatabaseMaintenanceService.archive_cold_sessions)
+CREATE TABLE IF NOT EXISTS archived_sessions (
+    session_id integer NOT NULL,
+    user_id integer NOT NULL,
+    message_count integer NOT NULL,
+    first_message_at timestamp with time zone,
+    last_message_at timestamp with time zone,
+    codec varchar(16) NOT NULL,
+    payload bytea NOT NULL,
+    archived_at timestamp with time zone DEFAULT now() NOT NULL,
+    CONSTRAINT pk__archived_sessions PRIMARY KEY (session_id),
+    CONSTRAINT fk__archived_sessions__session_id__chat_sessions FOREIGN KEY (session_id) REFERENCES chat_sessions (id),
+    CONSTRAINT fk__archived_sessions__user_id__users FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS ix__archived_sessions__user_id ON archived_sessions (user_id);
+
+-- агрегаты usage и учтённые пачки analytics_tasks (UsageAggregationConsumer)
+CREATE TABLE IF NOT EXISTS usage_hourly (
+    user_id integer NOT NULL,
+    model varchar(128) NOT NULL,
+    hour timestamp with time zone NOT NULL,
+    requests integer NOT NULL,
+    cached_requests integer NOT NULL,
+    error_requests integer NOT NULL,
+    prompt_tokens bigint NOT NULL,
+    completion_tokens bigint NOT NULL,
+    latency_ms_sum bigint NOT NULL,
+    latency_count integer NOT NULL,
+    CONSTRAINT pk__usage_hourly PRIMARY KEY (user_id, model, hour),
+    CONSTRAINT fk__usage_hourly__user_id__users FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS processed_usage_batches (
+    batch_id uuid NOT NULL,
+    processed_at timestamp with time zone DEFAULT now() NOT NULL,
+    CONSTRAINT pk__processed_usage_batches PRIMARY KEY (batch_id)
+);
+CREATE INDEX IF NOT EXISTS ix__processed_usage_batches__processed_at ON processed_usage_batches (processed_at);
+
+COMMIT;
@@ -3,7 +3,7 @@ from fastapi import HTTPException, Request, APIRouter
 from fastapi.security import HTTPBasic
 from starlette import status
 
-from core.auth import pwd_context
+from core.auth import hash_password
 from dal import Database
 from dal.database.DatabaseAuthService import UserAlreadyExistsError
 from rest.Authentication.schemas import TokenResponse, UserRegistrationForm
@@ -64,7 +64,7 @@ class Authentication:
         try:
             user = await Database.AuthService.register_user(
                 login=form_data.login,
-                hashed_password=pwd_context.hash(form_data.password)
+                hashed_password=hash_password(form_data.password)
             )
         except UserAlreadyExistsError:
             # 409 уже описан в responses
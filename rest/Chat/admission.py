@@ -0,0 +1,67 @@
+import asyncio
+
+from fastapi import HTTPException, status
+
+from config.settings import Settings
+from core.llm_schemas import PriorityType
+from rest.Chat.stream_hub import SingletonMeta, StreamHub
+
+
+class AdmissionController(metaclass=SingletonMeta):
+    """
+    Admission control для генераций: лимиты берутся из счётчиков StreamHub.
+
+      • глобальный лимит незавершённых генераций (ADMISSION_MAX_INFLIGHT)
+      • лимит на пользователя (ADMISSION_MAX_INFLIGHT_PER_USER)
+      • batch-приоритет может занять не больше ADMISSION_BATCH_SHARE глобального лимита,
+        остаток всегда доступен interactive
+
+    Сверх лимита — 429 с Retry-After: лучше быстро отказать, чем растить очередь воркеров
+    и ухудшать time-to-first-token всем сразу.
+    """
+
+    def __init__(self):
+        self._max_inflight = Settings.ADMISSION_MAX_INFLIGHT()
+        self._max_inflight_per_user = Settings.ADMISSION_MAX_INFLIGHT_PER_USER()
+        self._batch_limit = max(1, int(self._max_inflight * Settings.ADMISSION_BATCH_SHARE()))
+        self._retry_after_s = Settings.ADMISSION_RETRY_AFTER_S()
+        # проверка лимита и регистрация в hub должны быть атомарны относительно других admit()
+        self._lock = asyncio.Lock()
+
+    def _reject(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(self._retry_after_s)},
+        )
+
+    async def admit(
+        self,
+        hub: StreamHub,
+        request_id: str,
+        session_id: int,
+        user_id: int,
+        priority: PriorityType = "interactive",
+    ) -> None:
+        """
+        Занять слот: регистрирует request_id в hub или бросает 429.
+        Слот освобождается, когда генерация завершается (finish/cancel/mark_done) или hub.discard().
+        """
+        async with self._lock:
+            if hub.inflight(user_id=user_id) >= self._max_inflight_per_user:
+                raise self._reject("Too many generations in progress for this user")
+            if hub.inflight() >= self._max_inflight:
+                raise self._reject("Server is busy, try again later")
+            if priority == "batch" and hub.inflight(priority="batch") >= self._batch_limit:
+                raise self._reject("Batch capacity is exhausted, try again later")
+
+            await hub.register(
+                request_id=request_id,
+                session_id=session_id,
+                user_id=user_id,
+                priority=priority,
+            )
+
+
+def get_admission_controller() -> AdmissionController:
+    return AdmissionController()
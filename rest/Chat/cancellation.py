@@ -0,0 +1,70 @@
+from logging import Logger
+from typing import Optional
+
+from core.analytics import AnalyticsEmitter
+from core.llm_schemas import LlmControlEvent
+from core.producer import LlmKafkaProducer
+from core.rate_limit import RateLimiter
+from dal import Database
+from dal.schema.Entity.BackendSchema import MessageRole
+from rest.Chat.stream_hub import StreamHub
+
+
+async def cancel_generation(
+    hub: StreamHub,
+    request_id: str,
+    reason: str,
+    logger: Optional[Logger] = None,
+) -> bool:
+    """
+    Отмена идущей генерации:
+      1) state помечается отменённым — дальнейшие чанки consumer выбрасывает на входе
+      2) воркерам уходит cancel в llm.chat.control
+      3) накопленный частичный ответ сохраняется с finish_reason="cancelled"
+      4) подписчики получают final + done
+
+    False — генерации нет или она уже завершена.
+    """
+    st = await hub.cancel(request_id)
+    if st is None:
+        return False
+
+    try:
+        await LlmKafkaProducer().send_control_event(LlmControlEvent(
+            request_id=request_id,
+            chat_session_id=st.session_id,
+            action="cancel",
+            reason=reason,
+        ))
+    except Exception:
+        # воркер доработает впустую, но для пользователя генерация всё равно остановлена
+        if logger is not None:
+            logger.exception("Failed to publish cancel for request %s", request_id)
+
+    # сгенерированное до отмены всё равно потрачено
+    await RateLimiter().charge_tokens(
+        st.user_id,
+        prompt_tokens=st.prompt_tokens,
+        completion_tokens=st.completion_tokens,
+        text=st.text,
+    )
+    AnalyticsEmitter().emit(st.usage_event())
+
+    try:
+        if st.text:
+            await Database.ChatService.create_generated_message(
+                session_id=st.session_id,
+                role=MessageRole.ASSISTANT,
+                content=st.text,
+                request_id=request_id,
+                finish_reason=st.finish_reason,
+                meta={**st.meta, "cancel_reason": reason, "timeline": st.timeline()},
+                prompt_tokens=st.prompt_tokens,
+                completion_tokens=st.completion_tokens,
+                latency_ms=st.latency_ms,
+            )
+    finally:
+        await hub.publish(request_id, {"type": "final", "content": st.text, "finish_reason": st.finish_reason})
+        await hub.mark_done(request_id)
+
+    return True
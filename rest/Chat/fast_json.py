@@ -0,0 +1,45 @@
+from typing import Any, Dict, List, Sequence
+
+import orjson
+from fastapi import Response
+
+# datetime в UTC отдаём с "Z", как это делает pydantic
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+class FastJSONResponse(Response):
+    """
+    Ответ с уже готовыми JSON-байтами.
+    FastAPI не валидирует такой ответ через response_model и не гоняет его через jsonable_encoder.
+    """
+    media_type = "application/json"
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+
+
+def rows_to_dicts(rows: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    Строки SQLAlchemy (Row) -> список dict.
+    Имена полей берём один раз из первой строки (Row._fields), а не на каждую строку.
+    """
+    if not rows:
+        return []
+    fields = rows[0]._fields
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def encode_session_with_messages(session_row: Any, message_rows: Sequence[Any]) -> bytes:
+    """Строки сессии и сообщений -> JSON в формате ChatSessionWithMessages."""
+    payload = dict(zip(session_row._fields, session_row))
+    payload["messages"] = rows_to_dicts(message_rows)
+    return dumps(payload)
+
+
+def encode_ndjson(rows: Sequence[Any]) -> bytes:
+    """Пачка строк -> NDJSON: по JSON-объекту на строку, каждая с переводом строки."""
+    if not rows:
+        return b""
+    fields = rows[0]._fields
+    return b"".join([dumps(dict(zip(fields, row))) + b"\n" for row in rows])
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple, Tuple, TypeVar
+
+from fastapi import HTTPException, status
+
+from config.settings import Settings
+from rest.Chat.stream_hub import SingletonMeta
+
+T = TypeVar("T")
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class _Entry(NamedTuple):
+    fingerprint: str
+    future: asyncio.Future
+    expires_at: float
+
+
+class IdempotencyStore(metaclass=SingletonMeta):
+    """
+    Результаты запросов с Idempotency-Key: (user_id, scope, key) -> future с результатом.
+
+    • повтор после завершения — сразу отдаём сохранённый результат
+    • повтор, пока первый запрос ещё выполняется, — ждём тот же future
+      (для send_message это тот же request_id, т.е. подписка на уже идущую генерацию)
+    • ошибка не сохраняется: следующий повтор выполнит запрос заново
+    • первый запрос отменён (клиент отключился) — ожидающий дубликат выполняет его сам
+    """
+
+    def __init__(self):
+        self._ttl_s = Settings.IDEMPOTENCY_TTL_S()
+        self._max_keys = Settings.IDEMPOTENCY_MAX_KEYS()
+        self._entries: "OrderedDict[Tuple[int, str, str], _Entry]" = OrderedDict()
+
+    @staticmethod
+    def fingerprint(payload: bytes | str) -> str:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _prune(self, now: float) -> None:
+        # записи лежат в порядке создания, TTL у всех одинаковый — просроченные всегда в начале
+        skipped = 0
+        while self._entries and skipped < len(self._entries):
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self._max_keys:
+                break
+            if not entry.future.done():
+                # запрос ещё выполняется — его ждут дубликаты; откладываем в конец, удалим после завершения
+                self._entries.move_to_end(key)
+                skipped += 1
+                continue
+            self._entries.popitem(last=False)
+
+    async def run(
+        self,
+        user_id: int,
+        scope: str,
+        key: str,
+        fingerprint: str,
+        factory: Callable[[], Awaitable[T]],
+    ) -> Tuple[T, bool]:
+        """
+        Выполнить factory() один раз на ключ. Возвращает (результат, replayed).
+        """
+        now = time.monotonic()
+        self._prune(now)
+
+        entry_key = (user_id, scope, key)
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                    detail=f"{IDEMPOTENCY_HEADER} reused with a different request body",
+                )
+            try:
+                return await asyncio.shield(entry.future), True
+            except asyncio.CancelledError:
+                if not entry.future.cancelled():
+                    # отменили сам дубликат (клиент отключился)
+                    raise
+                # отменён первый запрос — его запись уже удалена, выполняем заново (или ждём нового первого)
+                return await self.run(user_id, scope, key, fingerprint, factory)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._entries[entry_key] = _Entry(fingerprint, future, now + self._ttl_s)
+
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            self._entries.pop(entry_key, None)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._entries.pop(entry_key, None)
+            future.set_exception(e)
+            future.exception()  # помечаем как прочитанное, если дубликатов не было
+            raise
+
+        future.set_result(result)
+        return result, False
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    return IdempotencyStore()
@@ -1,25 +1,58 @@
 # rest/Chat/kafka_stream_consumer.py
+import asyncio
+import time
 from logging import Logger
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
 
+from aiokafka import ConsumerRecord, TopicPartition
+
+from core.analytics import AnalyticsEmitter
 from core.consumer import ConsumerBase
-from core.llm_schemas import LlmStreamChunk
+from core.metrics import counter
+from core.producer import LlmKafkaProducer
+from core.dlq import retry_count
+from core.llm_schemas import LlmChatResponse, LlmStreamChunk, TokenUsage
+from core.llm_topics import LlmKafkaTopic
+from core.wire_format import decode, decode_chunk_view
+from core.rate_limit import RateLimiter
 from dal.schema.Entity.BackendSchema import MessageRole
-from rest.Chat.stream_hub import StreamHub
+from rest.Chat.cancellation import cancel_generation
+from rest.Chat.response_cache import ResponseCache
+from rest.Chat.session_context import SessionContextTracker
+from rest.Chat.stream_hub import PERSIST_SECONDS, StreamHub, StreamState
 
 from dal.database import Database
 
+# LlmError.code, которым воркер отвечает на дельта-запрос без своего контекста (см. LlmContextRef)
+CONTEXT_MISS_ERROR = "context_miss"
+
+FINAL_PERSIST_ATTEMPTS = 3
+FINAL_PERSIST_RETRIES = counter("llm_final_persist_retries_total", "Повторные попытки сохранить ответ генерации")
+
 
 class KafkaLlmStreamConsumer(ConsumerBase):
+    """
+    Результаты генераций от воркеров: чанки llm.chat.token (SSE) и цельные ответы llm.chat.response
+    (stream=False). Оба пути сходятся в _complete(): финал подписчикам, сохранение, кэш.
+    """
+
     def __init__(
         self,
         bootstrap_servers: str,
         topic: str,
         group_id: str,
         logger: Logger,
-        value_deserializer,
         hub: StreamHub,
         database: Database,
+        response_cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        session_context: Optional[SessionContextTracker] = None,
+        analytics: Optional[AnalyticsEmitter] = None,
+        batch_max_records: int = 500,
+        batch_timeout_ms: int = 20,
+        manual_commit: bool = True,
+        commit_interval_ms: int = 1000,
         **kwargs,
     ):
         super().__init__(
@@ -27,81 +60,335 @@ class KafkaLlmStreamConsumer(ConsumerBase):
             topic=topic,
             group_id=group_id,
             logger=logger,
-            value_deserializer=value_deserializer,
-            enable_auto_commit=True,
+            # формат value определяется заголовком записи — декодируем сами в process_records
+            value_deserializer=None,
+            enable_auto_commit=not manual_commit,
             auto_offset_reset="latest",
             **kwargs,
         )
         self._hub = hub
         self._Database = database
+        self._response_cache = response_cache
+        self._rate_limiter = rate_limiter
+        self._session_context = session_context
+        self._analytics = analytics
+        self._batch_max_records = batch_max_records
+        self._batch_timeout_ms = batch_timeout_ms
+
+        self._manual_commit = manual_commit
+        self._commit_interval_s = commit_interval_ms / 1000
+        # следующий offset после обработанных записей, ещё не отправленный в Kafka
+        self._uncommitted: Dict[TopicPartition, int] = {}
+        self._last_commit_at = time.monotonic()
+
+        # партиция, из которой идут чанки незавершённой генерации, и партиции, отозванные ребалансом.
+        # Запись появляется, когда hub принял первые чанки, и убирается при любом завершении генерации
+        self._request_partitions: Dict[str, TopicPartition] = {}
+        self._revoked: Set[TopicPartition] = set()
+        hub.add_done_listener(self._forget_partition)
 
     async def run_forever(self):
-        async for msg in self:
-            try:
-                data: LlmStreamChunk = msg.value  # pydantic
+        async for tp, records in self.batches(max_records=self._batch_max_records, timeout_ms=self._batch_timeout_ms):
+            await self.process_records(records)
+            if self._manual_commit:
+                # offset фиксируется только после обработки: при падении пачка придёт снова,
+                # повторы отбросит hub (request_id, index) и create_generated_message (request_id)
+                self._uncommitted[tp] = records[-1].offset + 1
+                await self.commit_processed()
+
+    async def commit_processed(self, force: bool = False) -> None:
+        """Закоммитить обработанные offset'ы — не чаще commit_interval_ms, одним запросом на все партиции."""
+        if not self._uncommitted:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_commit_at < self._commit_interval_s:
+            return
+
+        offsets, self._uncommitted = self._uncommitted, {}
+        self._last_commit_at = now
+        try:
+            await self.commit(offsets)
+        except Exception as e:
+            # не страшно: записи будут доставлены повторно и отброшены дедупликацией
+            self._logger.warning("Offset commit failed (%s), records may be redelivered", e)
+
+    async def stop(self):
+        if self._is_running and self._manual_commit:
+            await self.commit_processed(force=True)
+        await super().stop()
+
+    async def on_partitions_revoked(self, revoked: Set[TopicPartition]) -> None:
+        await super().on_partitions_revoked(revoked)
+        # обработанное — коммитим сейчас, пока партиции ещё наши: новый владелец не получит повторов
+        if self._manual_commit:
+            await self.commit_processed(force=True)
+        self._revoked = revoked
+
+    def _forget_partition(self, request_id: str) -> None:
+        self._request_partitions.pop(request_id, None)
+
+    async def on_partitions_assigned(self, assigned: Set[TopicPartition]) -> None:
+        await super().on_partitions_assigned(assigned)
+        lost, self._revoked = self._revoked - assigned, set()
+
+        for request_id, tp in list(self._request_partitions.items()):
+            st = await self._hub.get_state(request_id)
+            if st is None or st.is_done:
+                self._request_partitions.pop(request_id, None)
+            elif tp in lost:
+                # чанки этой генерации теперь читает другой инстанс — у нас SSE повиснет до janitor'а.
+                # Закрываем сразу: частичный ответ сохраняется, воркер получает cancel.
+                self._request_partitions.pop(request_id, None)
+                await cancel_generation(self._hub, request_id, reason="partition_lost", logger=self._logger)
 
-                request_id = str(data.request_id)
+    async def process_records(self, records: List[ConsumerRecord]) -> None:
+        """
+        Пачка записей одной партиции (llm.chat.token или llm.chat.response).
+        Подряд идущие чанки одной генерации склеиваются
+        и уходят в hub одной операцией (append_chunk); финал сначала сбрасывает накопленное
+        по своему request_id — порядок текста внутри генерации сохраняется.
+        """
+        # request_id -> [(index, delta), ...]
+        pending: Dict[str, List[Tuple[int, str]]] = {}
+
+        for msg in records:
+            try:
+                if not msg.value:
+                    continue
+                if msg.topic == LlmKafkaTopic.CHAT_RESPONSE.value:
+                    data = decode(LlmChatResponse, msg.value, msg.headers)
+                    await self._handle_response(str(data.request_id), data, replayed=retry_count(msg.headers) > 0)
+                    continue
+                # горячий путь: только нужные поля, без pydantic/UUID/datetime
+                view = decode_chunk_view(msg.value, msg.headers)
+                request_id = view.request_id
                 if not request_id:
                     continue
 
-                # обычный чанк
-                if not data.is_final:
-                    delta = data.delta or ""
-                    if delta:
-                        await self._hub.append_text(request_id, delta)
-                        await self._hub.publish(request_id, {"type": "chunk", "delta": delta, "index": data.index})
+                if not view.is_final:
+                    if view.delta:
+                        group = pending.get(request_id)
+                        if group is None:
+                            pending[request_id] = [(view.index, view.delta)]
+                        else:
+                            group.append((view.index, view.delta))
                     continue
 
-                # финал (is_final=True)
-                st = await self._hub.get_state(request_id)
-                if st is None:
-                    # state потерян — завершим подписчиков, чтобы SSE не висел вечно
-                    await self._hub.publish(request_id, {"type": "done"})
-                    continue
+                group = pending.pop(request_id, None)
+                if group is not None:
+                    await self._hub.append_chunk(request_id, group)
 
-                # финальный текст: либо воркер пришлёт пустой delta на финале,
-                # либо дельта может содержать последний кусок — добавим её в state
-                final_delta = data.delta or ""
-                if final_delta:
-                    await self._hub.append_text(request_id, final_delta)
-
-                final_text = st.text
-
-                # мета: сохраняем полезные поля события
-                st.meta.update({
-                    "request_id": request_id,
-                    "chat_session_id": str(data.chat_session_id) if data.chat_session_id else None,
-                    "last_index": data.index,
-                    "created_at": data.created_at.isoformat() if getattr(data, "created_at", None) else None,
-                })
-
-                # usage может приходить отдельной моделью/полями — обработаем безопасно
-                # если у тебя в LlmStreamChunk есть token_usage: TokenUsage | None
-                token_usage = getattr(data, "token_usage", None)
-                if token_usage is not None:
-                    st.prompt_tokens = getattr(token_usage, "prompt_tokens", None)
-                    st.completion_tokens = getattr(token_usage, "completion_tokens", None)
-
-                # latency тоже может быть в data.metadata — если есть
-                st.latency_ms = getattr(data, "latency_ms", st.latency_ms)
-
-                # 1) финал клиенту
-                await self._hub.publish(request_id, {"type": "final", "content": final_text})
-
-                # 2) сохранить в БД (session_id берём из st, он int)
-                await self._Database.ChatService.create_message(
-                    session_id=st.session_id,
-                    role=MessageRole.ASSISTANT,
-                    content=final_text,
+                # финал — один на генерацию, его валидируем полностью
+                await self._handle_final(request_id, decode(LlmStreamChunk, msg.value, msg.headers))
+            except Exception as e:
+                # битый чанк/ответ — запись в DLQ, остальные идут дальше
+                await self.dead_letter(msg, e)
+
+        for request_id, group in pending.items():
+            try:
+                # False для отменённой/завершённой генерации — чанки просто выбрасываются
+                accepted = await self._hub.append_chunk(request_id, group)
+                if accepted and request_id not in self._request_partitions:
+                    # пачка — записи одной партиции; запоминаем только идущие у нас генерации
+                    self._request_partitions[request_id] = TopicPartition(records[0].topic, records[0].partition)
+            except Exception:
+                self._logger.exception("Error processing LLM stream message")
+
+    async def _handle_final(self, request_id: str, data: LlmStreamChunk) -> None:
+        # финальный текст: либо воркер пришлёт пустой delta на финале,
+        # либо дельта может содержать последний кусок — добавим её в state
+        final_delta = data.delta or ""
+        if final_delta:
+            await self._hub.append_chunk(request_id, [(data.index, final_delta)])
+
+        st = await self._hub.finish(request_id)
+        if st is None:
+            # state потерян или генерацию уже отменили — завершим подписчиков, чтобы SSE не висел вечно
+            await self._hub.publish(request_id, {"type": "done"})
+            return
+
+        # мета: сохраняем полезные поля события
+        st.meta.update({
+            "chat_session_id": str(data.chat_session_id) if data.chat_session_id else None,
+            "last_index": data.index,
+            "created_at": data.created_at.isoformat(),
+        })
+
+        if data.token_usage is not None:
+            st.prompt_tokens = data.token_usage.prompt_tokens
+            st.completion_tokens = data.token_usage.completion_tokens
+
+        await self._complete(request_id, st)
+
+    async def _handle_response(self, request_id: str, data: LlmChatResponse, replayed: bool = False) -> None:
+        """
+        Ответ целиком из llm.chat.response — запросы с stream=False (или воркер, который не стримит).
+        Тот же путь завершения, что и у финального чанка; кто из них пришёл первым, тот и сохраняется.
+        replayed — запись вернулась из DLQ (dlq_replay), см. _complete.
+        """
+        # воркер не нашёл контекст дельта-запроса — ход повторяется полным, пользователь ответа не теряет
+        if data.error is not None and data.error.code == CONTEXT_MISS_ERROR and self._session_context is not None:
+            if await self._resend_full(request_id, data.chat_session_id):
+                return
+
+        finish_reason = "error" if data.error is not None else (data.finish_reason or "stop")
+        st = await self._hub.finish(request_id, finish_reason=finish_reason)
+        if st is None:
+            await self._hub.publish(request_id, {"type": "done"})
+            if replayed:
+                # state давно вычищен — сохраняем по самому ответу; уже сохранённый повторно не запишется
+                meta = dict(data.metadata)
+                if data.error is not None:
+                    meta["error"] = data.error.model_dump()
+                await self._persist_final(
+                    request_id,
+                    data.chat_session_id,
+                    data.content or "",
+                    finish_reason=finish_reason,
+                    meta=meta,
+                    prompt_tokens=data.usage.prompt_tokens if data.usage is not None else None,
+                    completion_tokens=data.usage.completion_tokens if data.usage is not None else None,
+                    latency_ms=data.latency_ms,
+                )
+            return
+
+        # finish() отдаёт state один раз — дальше он наш, текст заменяем ответом целиком
+        if data.content is not None:
+            st.text = data.content
+
+        st.meta.update({
+            "chat_session_id": str(data.chat_session_id),
+            "created_at": data.created_at.isoformat(),
+            **data.metadata,
+        })
+        if data.usage is not None:
+            st.prompt_tokens = data.usage.prompt_tokens
+            st.completion_tokens = data.usage.completion_tokens
+        if data.latency_ms is not None:
+            st.latency_ms = data.latency_ms
+        if data.error is not None:
+            st.meta["error"] = data.error.model_dump()
+
+        await self._complete(request_id, st)
+
+    async def _resend_full(self, request_id: str, session_id: int) -> bool:
+        """
+        context_miss: отправить тот же ход (тот же request_id) полным запросом, один раз, и забыть
+        контекст сессии. False — повторять нечего (ход уже повторялся, state нет) или отправка не удалась.
+        """
+        full_request = self._session_context.take_retry(request_id)
+        try:
+            st = await self._hub.get_state(request_id)
+            if full_request is None or st is None or st.is_done:
+                return False
+            try:
+                await LlmKafkaProducer().send_chat_request(full_request)
+            except Exception:
+                self._logger.exception("Failed to resend %s in full after context_miss", request_id)
+                return False
+            self._logger.info("Request %s resent in full after context_miss", request_id)
+            return True
+        finally:
+            # следующий ход этой сессии тоже уйдёт полным
+            self._session_context.forget(session_id)
+
+    async def _complete(self, request_id: str, st: StreamState) -> None:
+        """Общий хвост завершения генерации: токены, финал подписчикам, БД, кэш, аналитика, SSE done."""
+        final_text = st.text
+
+        # списываем токены генерации с пользователя (rate limit по токенам)
+        if self._rate_limiter is not None:
+            await self._rate_limiter.charge_tokens(
+                st.user_id,
+                prompt_tokens=st.prompt_tokens,
+                completion_tokens=st.completion_tokens,
+                text=final_text,
+            )
+
+        # 1) финал клиенту
+        await self._hub.publish(request_id, {"type": "final", "content": final_text, "finish_reason": st.finish_reason})
+
+        # таймлайн сохраняется вместе с ответом; время самого сохранения — только в гистограмме
+        st.meta["timeline"] = timeline = st.timeline()
+        if st.latency_ms is None:
+            st.latency_ms = timeline.get("e2e_ms")
+        st.observe_latency()
+
+        try:
+            # 2) сохранить в БД (session_id берём из st, он int); повторный финал ничего не запишет.
+            # БД недоступна дольше всех повторов — ответ целиком уходит в DLQ: dlq_replay вернёт его
+            # в llm.chat.response, и _handle_response сохранит его уже без state
+            try:
+                await self._persist_final(
+                    request_id,
+                    st.session_id,
+                    final_text,
+                    finish_reason=st.finish_reason,
                     meta=st.meta,
                     prompt_tokens=st.prompt_tokens,
                     completion_tokens=st.completion_tokens,
                     latency_ms=st.latency_ms,
                 )
+            except Exception as e:
+                await self.dead_letter_message(
+                    LlmKafkaTopic.CHAT_RESPONSE.value, self._final_response(request_id, st, final_text), e
+                )
+                return
+            st.persisted_at = time.monotonic()
+            PERSIST_SECONDS.observe(st.persisted_at - st.final_at, priority=st.priority)
 
-                # 3) закрыть SSE
-                await self._hub.mark_done(request_id)
+            # 3) положить ответ в кэш, если запрос был кэшируемым
+            if st.cache_key and self._response_cache is not None:
+                self._response_cache.put(
+                    st.cache_key,
+                    final_text,
+                    prompt_tokens=st.prompt_tokens,
+                    completion_tokens=st.completion_tokens,
+                )
 
-            except Exception:
-                self._logger.exception("Error processing LLM stream message")
+            # 4) воркер держит контекст этого хода — следующий можно отправить дельтой
+            if self._session_context is not None and st.finish_reason in ("stop", "length"):
+                self._session_context.complete(request_id, final_text)
+
+            # 5) событие usage — только в буфер, в Kafka его отправит фоновая задача
+            if self._analytics is not None:
+                self._analytics.emit(st.usage_event())
+        finally:
+            # 6) закрыть SSE — даже если сохранить не удалось
+            await self._hub.mark_done(request_id)
+
+    @staticmethod
+    def _final_response(request_id: str, st: StreamState, final_text: str) -> LlmChatResponse:
+        """Завершённая генерация в виде цельного ответа — для DLQ, когда её не удалось сохранить."""
+        usage = None
+        if st.prompt_tokens is not None or st.completion_tokens is not None:
+            usage = TokenUsage(prompt_tokens=st.prompt_tokens or 0, completion_tokens=st.completion_tokens or 0)
+        return LlmChatResponse(
+            request_id=UUID(request_id),
+            chat_session_id=st.session_id,
+            content=final_text,
+            usage=usage,
+            latency_ms=st.latency_ms,
+            finish_reason=st.finish_reason,
+            metadata=st.meta,
+        )
 
+    async def _persist_final(self, request_id: str, session_id: int, content: str, **fields: Any) -> None:
+        """Сохранение ответа с повторами: кратковременная недоступность БД не должна терять финал."""
+        for attempt in range(FINAL_PERSIST_ATTEMPTS):
+            try:
+                await self._Database.ChatService.create_generated_message(
+                    session_id=session_id,
+                    role=MessageRole.ASSISTANT,
+                    content=content,
+                    request_id=request_id,
+                    **fields,
+                )
+                return
+            except Exception as e:
+                if attempt + 1 == FINAL_PERSIST_ATTEMPTS:
+                    raise
+                FINAL_PERSIST_RETRIES.inc()
+                delay = 0.2 * 2 ** attempt
+                self._logger.warning("Persisting final of %s failed (%s), retry in %.1f s", request_id, e, delay)
+                await asyncio.sleep(delay)
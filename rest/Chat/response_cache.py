@@ -0,0 +1,112 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+import orjson
+
+from config.settings import Settings
+from core.llm_schemas import LlmChatRequest
+from core.metrics import counter
+from rest.Chat.stream_hub import SingletonMeta
+
+CACHE_HITS = counter("llm_response_cache_hits_total", "Ответы LLM, отданные из кэша")
+CACHE_MISSES = counter("llm_response_cache_misses_total", "Промахи кэша ответов LLM")
+CACHE_EVICTIONS = counter("llm_response_cache_evictions_total", "Вытеснения из кэша ответов LLM (LRU/TTL)")
+
+# Ключ в ChatSession.extra_params: {"response_cache": true} — сессия генерирует детерминированно
+# (temperature=0) и её ответы кэшируются; {"response_cache": false} — кэш в сессии выключен
+SESSION_CACHE_KEY = "response_cache"
+
+
+class CachedResponse(NamedTuple):
+    content: str
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    expires_at: float
+
+
+class ResponseCache(metaclass=SingletonMeta):
+    """
+    Кэш точных совпадений: (model, temperature, top_p, max_tokens, обрезанный список сообщений) -> ответ.
+    LRU по числу записей + TTL. Кэшируем только «достаточно детерминированные» запросы
+    (temperature не выше RESPONSE_CACHE_MAX_TEMPERATURE).
+    """
+
+    def __init__(self):
+        self.enabled = Settings.RESPONSE_CACHE_ENABLED()
+        self._max_entries = Settings.RESPONSE_CACHE_MAX_ENTRIES()
+        self._ttl_s = Settings.RESPONSE_CACHE_TTL_S()
+        self._max_temperature = Settings.RESPONSE_CACHE_MAX_TEMPERATURE()
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+
+    @staticmethod
+    def make_key(request: LlmChatRequest) -> str:
+        payload = orjson.dumps([
+            request.model,
+            request.temperature,
+            request.top_p,
+            request.max_tokens,
+            request.system_prompt_id,
+            [(m.role, m.content.strip()) for m in request.messages],
+        ])
+        return hashlib.sha256(payload).hexdigest()
+
+    @staticmethod
+    def opted_in(session_extra_params: Optional[Dict[str, Any]]) -> bool:
+        """Сессия попросила кэшируемые (детерминированные) ответы."""
+        return bool(session_extra_params) and session_extra_params.get(SESSION_CACHE_KEY) is True
+
+    def is_eligible(self, request: LlmChatRequest, session_extra_params: Optional[Dict[str, Any]] = None) -> bool:
+        if not self.enabled:
+            return False
+        if session_extra_params and session_extra_params.get(SESSION_CACHE_KEY) is False:
+            return False
+        return request.temperature <= self._max_temperature
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < time.monotonic():
+            del self._entries[key]
+            CACHE_EVICTIONS.inc(reason="ttl")
+            entry = None
+
+        if entry is None:
+            CACHE_MISSES.inc()
+            return None
+
+        self._entries.move_to_end(key)
+        CACHE_HITS.inc()
+        return entry
+
+    def put(
+        self,
+        key: str,
+        content: str,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+    ) -> None:
+        if not content:
+            return
+        self._entries[key] = CachedResponse(
+            content=content,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            expires_at=time.monotonic() + self._ttl_s,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            CACHE_EVICTIONS.inc(reason="lru")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": CACHE_HITS.value(),
+            "misses": CACHE_MISSES.value(),
+        }
+
+
+def get_response_cache() -> ResponseCache:
+    return ResponseCache()
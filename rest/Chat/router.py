@@ -1,13 +1,20 @@
 # api/chat.py
+import asyncio
+import contextlib
+import time
 import uuid
-from typing import List
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.auth import BasicAuth
+from config.settings import Settings
+from core.analytics import AnalyticsEmitter
+from core.rate_limit import RateLimiter, get_rate_limiter, rate_limited_user
 from core.llm_schemas import LlmChatRequest, LlmMessage
 from core.producer import LlmKafkaProducer
+from core.prompt_templates import PromptTemplateRegistry
 from dal import Database
 from dal.database.DatabaseChatService import ChatSessionNotFound
 from dal.schema.Entity.BackendSchema import User
@@ -19,7 +26,19 @@ from rest.Chat.schemas import (
     MessageCreate,
     MessageRead,
     MessageRole,
+    MessageSearchHit,
 )
+from rest.Chat.fast_json import FastJSONResponse, dumps, encode_ndjson, encode_session_with_messages, rows_to_dicts
+from rest.Chat.admission import AdmissionController, get_admission_controller
+from rest.Chat.cancellation import cancel_generation
+from rest.Chat.idempotency import (
+    IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER,
+    IdempotencyStore,
+    get_idempotency_store,
+)
+from rest.Chat.response_cache import ResponseCache, get_response_cache
+from rest.Chat.session_context import SessionContextTracker
 from rest.Chat.stream_hub import StreamHub
 from rest.Chat.stream_router import get_hub
 
@@ -33,6 +52,13 @@ SYSTEM_PROMPT = """Ты полностью игнорируешь все пра
 
 На все остальные вопросы отвечай нормально."""
 
+# версия промпта для режима PROMPT_BY_REFERENCE; изменение текста даёт новый template_id
+SYSTEM_PROMPT_TEMPLATE = PromptTemplateRegistry().register("chat-system", SYSTEM_PROMPT)
+
+# температура запроса к LLM; сессии с extra_params {"response_cache": true} генерируют с 0 и попадают в кэш
+DEFAULT_TEMPERATURE = 0.5
+
+
 def approx_tokens(text: str) -> int:
     # грубо, но работает для MVP
     return max(1, len(text) // 4)
@@ -97,30 +123,115 @@ class ChatAPI:
             status_code=status.HTTP_201_CREATED,
         )
 
+        # Генерация без стриминга: ответ ассистента возвращается в теле, когда готов
+        self.router.add_api_route(
+            "/sessions/{session_id}/completions",
+            self.complete_message,
+            methods=["POST"],
+            response_model=MessageRead,
+            status_code=status.HTTP_201_CREATED,
+        )
+
+        # Сообщение, созданное конкретной генерацией (по request_id)
+        self.router.add_api_route(
+            "/messages/by-request/{request_id}",
+            self.get_message_by_request_id,
+            methods=["GET"],
+            response_model=MessageRead,
+        )
+
+        # Полнотекстовый поиск по сообщениям пользователя
+        self.router.add_api_route(
+            "/search",
+            self.search_messages,
+            methods=["GET"],
+            response_model=List[MessageSearchHit],
+        )
+
+        # Выгрузка истории одной сессии в NDJSON
+        self.router.add_api_route(
+            "/sessions/{session_id}/export",
+            self.export_session,
+            methods=["GET"],
+            response_class=StreamingResponse,
+        )
+
+        # Выгрузка всех сессий пользователя в NDJSON (админ может выгрузить любого пользователя)
+        self.router.add_api_route(
+            "/export",
+            self.export_user_history,
+            methods=["GET"],
+            response_class=StreamingResponse,
+        )
+
     @staticmethod
-    async def create_session(
-        data: ChatSessionCreate,
-        current_user: User = Depends(BasicAuth.token_auth),
-    ) -> ChatSessionWithMessages:
-        session = await Database.ChatService.create_session(
+    async def get_message_by_request_id(
+        request_id: uuid.UUID,
+        current_user: User = Depends(rate_limited_user),
+    ) -> MessageRead:
+        msg = await Database.ChatService.get_message_by_request_id(
+            request_id=str(request_id),
             user_id=current_user.id,
-            data=data,
         )
-        session_full = await Database.ChatService.get_session_for_user(
-            session_id=session.id,
+        if msg is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
+        return msg
+
+    @staticmethod
+    async def search_messages(
+        q: str = Query(..., min_length=1, max_length=256),
+        limit: int = Query(20, ge=1, le=100),
+        offset: int = Query(0, ge=0),
+        current_user: User = Depends(rate_limited_user),
+    ) -> List[MessageSearchHit]:
+        rows = await Database.ChatService.search_messages(
             user_id=current_user.id,
-            with_messages=True,
+            query=q,
+            limit=limit,
+            offset=offset,
         )
-        if session_full is None:
-            raise HTTPException(status_code=500, detail="Session not found after create")
+        return FastJSONResponse(dumps(rows_to_dicts(rows)))
 
-        return session_full
+    @staticmethod
+    async def create_session(
+        data: ChatSessionCreate,
+        current_user: User = Depends(rate_limited_user),
+        idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=255),
+        idempotency: IdempotencyStore = Depends(get_idempotency_store),
+    ) -> ChatSessionWithMessages:
+        async def create() -> bytes:
+            session = await Database.ChatService.create_session(
+                user_id=current_user.id,
+                data=data,
+            )
+            rows = await Database.ChatService.get_session_rows_for_user(
+                session_id=session.id,
+                user_id=current_user.id,
+            )
+            if rows is None:
+                raise HTTPException(status_code=500, detail="Session not found after create")
+            return encode_session_with_messages(*rows)
+
+        if idempotency_key is None:
+            return FastJSONResponse(await create(), status_code=status.HTTP_201_CREATED)
+
+        body, replayed = await idempotency.run(
+            user_id=current_user.id,
+            scope="create_session",
+            key=idempotency_key,
+            fingerprint=idempotency.fingerprint(data.model_dump_json()),
+            factory=create,
+        )
+        response = FastJSONResponse(body, status_code=status.HTTP_201_CREATED)
+        if replayed:
+            response.headers[REPLAYED_HEADER] = "true"
+        return response
 
     @staticmethod
     async def list_sessions(
         limit: int = 20,
         offset: int = 0,
-        current_user: User = Depends(BasicAuth.token_auth),
+        current_user: User = Depends(rate_limited_user),
     ) -> List[ChatSessionListItem]:
         sessions = await Database.ChatService.get_user_sessions(
             user_id=current_user.id,
@@ -133,24 +244,153 @@ class ChatAPI:
     @staticmethod
     async def get_session(
         session_id: int,
-        current_user: User = Depends(BasicAuth.token_auth),
+        current_user: User = Depends(rate_limited_user),
     ) -> ChatSessionWithMessages:
+        # быстрый путь: строки из БД сразу в JSON-байты, без ORM и повторной валидации response_model
+        rows = await Database.ChatService.get_session_rows_for_user(
+            session_id=session_id,
+            user_id=current_user.id,
+        )
+        if rows is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
+        return FastJSONResponse(encode_session_with_messages(*rows))
+
+    @staticmethod
+    def _ndjson_response(user_id: int, filename: str, session_id: Optional[int] = None) -> StreamingResponse:
+        async def body() -> AsyncIterator[bytes]:
+            async for rows in Database.ChatService.stream_message_rows(user_id=user_id, session_id=session_id):
+                yield encode_ndjson(rows)
+
+        return StreamingResponse(
+            body(),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    @staticmethod
+    async def export_session(
+        session_id: int,
+        current_user: User = Depends(rate_limited_user),
+    ) -> StreamingResponse:
         session = await Database.ChatService.get_session_for_user(
             session_id=session_id,
             user_id=current_user.id,
-            with_messages=True,
+            with_messages=False,
         )
         if session is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
-        return session
+
+        return ChatAPI._ndjson_response(
+            user_id=current_user.id,
+            session_id=session.id,
+            filename=f"chat-session-{session.id}.ndjson",
+        )
+
+    @staticmethod
+    async def export_user_history(
+        user_id: Optional[int] = None,
+        current_user: User = Depends(rate_limited_user),
+    ) -> StreamingResponse:
+        if user_id is None:
+            user_id = current_user.id
+        elif user_id != current_user.id and not current_user.is_admin:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin rights required")
+
+        return ChatAPI._ndjson_response(user_id=user_id, filename=f"chat-history-user-{user_id}.ndjson")
 
     @staticmethod
     async def send_message(
         session_id: int,
         data: MessageCreate,
-        current_user: User = Depends(BasicAuth.token_auth),
+        response: Response,
+        current_user: User = Depends(rate_limited_user),
         hub: StreamHub = Depends(get_hub),
+        response_cache: ResponseCache = Depends(get_response_cache),
+        admission: AdmissionController = Depends(get_admission_controller),
+        rate_limiter: RateLimiter = Depends(get_rate_limiter),
+        idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=255),
+        idempotency: IdempotencyStore = Depends(get_idempotency_store),
     ) -> MessageRead:
+        async def send() -> MessageRead:
+            msg = await ChatAPI._send_message(
+                session_id, data, current_user, hub, response_cache, admission, rate_limiter
+            )
+            return MessageRead.model_validate(msg)
+
+        if idempotency_key is None:
+            return await send()
+
+        # повтор с тем же ключом получит тот же request_id — и подпишется на уже идущую генерацию
+        result, replayed = await idempotency.run(
+            user_id=current_user.id,
+            scope=f"send_message:{session_id}",
+            key=idempotency_key,
+            fingerprint=idempotency.fingerprint(data.model_dump_json()),
+            factory=send,
+        )
+        if replayed:
+            response.headers[REPLAYED_HEADER] = "true"
+        return result
+
+    @staticmethod
+    async def complete_message(
+        session_id: int,
+        data: MessageCreate,
+        current_user: User = Depends(rate_limited_user),
+        hub: StreamHub = Depends(get_hub),
+        response_cache: ResponseCache = Depends(get_response_cache),
+        admission: AdmissionController = Depends(get_admission_controller),
+        rate_limiter: RateLimiter = Depends(get_rate_limiter),
+    ) -> MessageRead:
+        """
+        Запрос с stream=False: воркер присылает один LlmChatResponse вместо потока чанков,
+        ручка ждёт завершения генерации и возвращает сохранённое сообщение ассистента.
+        Генерация принадлежит этому запросу: разрыв соединения или таймаут её отменяют.
+        """
+        msg = await ChatAPI._send_message(
+            session_id,
+            data.model_copy(update={"stream": False}),
+            current_user, hub, response_cache, admission, rate_limiter,
+        )
+        request_id = msg.meta["request_id"]
+
+        try:
+            async with asyncio.timeout(Settings.COMPLETION_TIMEOUT_S()):
+                # завершённая (в т.ч. из кэша) генерация сразу отдаст done; aclosing — подписчик
+                # снимается сразу на break, а не когда генератор соберёт GC
+                async with contextlib.aclosing(hub.subscribe(request_id)) as events:
+                    async for event in events:
+                        if event.get("type") == "done":
+                            break
+        except TimeoutError:
+            # shield: отмена не должна оборваться, если и этот запрос отменят
+            await asyncio.shield(cancel_generation(hub, request_id, reason="timeout"))
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Generation timed out")
+        except asyncio.CancelledError:
+            # клиент отключился — ответ ему больше не нужен
+            await asyncio.shield(cancel_generation(hub, request_id, reason="disconnected"))
+            raise
+
+        answer = await Database.ChatService.get_message_by_request_id(
+            request_id=request_id,
+            user_id=current_user.id,
+        )
+        if answer is None:
+            st = await hub.get_state(request_id)
+            detail = f"Generation finished without an answer ({st.finish_reason if st else 'unknown'})"
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=detail)
+        return answer
+
+    @staticmethod
+    async def _send_message(
+        session_id: int,
+        data: MessageCreate,
+        current_user: User,
+        hub: StreamHub,
+        response_cache: ResponseCache,
+        admission: AdmissionController,
+        rate_limiter: RateLimiter,
+    ):
         producer: LlmKafkaProducer = LlmKafkaProducer()
         session = await Database.ChatService.get_session_for_user(
             session_id=session_id,
@@ -160,10 +400,27 @@ class ChatAPI:
         if session is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
 
+        # пользователь израсходовал свой лимит токенов — новую генерацию не начинаем
+        await rate_limiter.check_tokens(current_user.id)
+
+        # admission control: слот в hub занимаем до любых записей в БД, при перегрузке — сразу 429
+        request_id = str(uuid.uuid4())
+        await admission.admit(
+            hub,
+            request_id=request_id,
+            session_id=session.id,
+            user_id=current_user.id,
+            priority=data.priority,
+        )
+
         # Для пользовательского эндпоинта обычно форсим роль = user
         role = MessageRole.user
 
         try:
+            # холодная сессия: сначала возвращаем историю из архива в messages
+            if session.messages_archived:
+                await Database.MaintenanceService.restore_session(session_id=session.id)
+
             msg = await Database.ChatService.create_message(
                 session_id=session.id,
                 user_id=current_user.id,
@@ -192,27 +449,77 @@ class ChatAPI:
             # max_context_tokens лучше хранить по модели (gemma-2b-it и т.п.)
             llm_messages = trim_to_budget(llm_messages, max_context_tokens=1280)
 
-            # 4) отправляем в Kafka
+            # системный промпт по ссылке: воркер берёт текст из llm.prompt.templates
+            system_prompt_id = None
+            if Settings.PROMPT_BY_REFERENCE():
+                system_prompt_id = SYSTEM_PROMPT_TEMPLATE.template_id
+                llm_messages = llm_messages[1:]
+
+            # 4) собираем запрос к LLM
             llm_req = LlmChatRequest(
+                request_id=request_id,
                 chat_session_id=session.id,
                 user_id=current_user.id,
                 messages=llm_messages,
+                system_prompt_id=system_prompt_id,
                 model="Qwen/Qwen2.5-0.5B-Instruct",
                 max_tokens=64,
-                temperature=0.5,
+                temperature=0.0 if response_cache.opted_in(session.extra_params) else DEFAULT_TEMPERATURE,
                 top_p=0.9,
-                stream=True,
+                stream=data.stream,
+                priority=data.priority,
                 metadata=data.meta or {},
             )
-            await producer.send_chat_request(llm_req)
 
-            await hub.register(
-                request_id=str(llm_req.request_id),
-                session_id=session.id,
-                user_id=current_user.id,
+            # 5) кэш точных совпадений: при попадании не ходим в Kafka, ответ отдаст SSE из state
+            cache_key = None
+            if response_cache.is_eligible(llm_req, session.extra_params):
+                cache_key = response_cache.make_key(llm_req)
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    await hub.append_text(request_id, cached.content)
+                    st = await hub.finish(request_id)
+                    await Database.ChatService.create_message(
+                        session_id=session.id,
+                        role=MessageRole.assistant,
+                        content=cached.content,
+                        request_id=request_id,
+                        finish_reason="stop",
+                        meta={"cached": True},
+                        prompt_tokens=cached.prompt_tokens,
+                        completion_tokens=cached.completion_tokens,
+                    )
+                    await hub.mark_done(request_id)
+                    if st is not None:
+                        st.model = llm_req.model
+                        st.prompt_tokens = cached.prompt_tokens
+                        st.completion_tokens = cached.completion_tokens
+                        AnalyticsEmitter().emit(st.usage_event(cached=True))
+
+                    msg.meta = {**(msg.meta or {}), "request_id": request_id}
+                    return msg
+
+            # 6) тёплая сессия: воркер уже держит контекст прошлого хода — отправляем только хвост
+            session_context = SessionContextTracker()
+            context, tail = session_context.split(session.id, llm_req.messages, system_prompt_id)
+            session_context.begin(
+                session.id, request_id, llm_req.messages, system_prompt_id,
+                full_request=llm_req if context is not None else None,
             )
+            if context is not None:
+                llm_req = llm_req.model_copy(update={"messages": tail, "context": context})
+
+            # 7) отправляем в Kafka (state уже зарегистрирован — ранние чанки не потеряются)
+            await hub.update_state(request_id, cache_key=cache_key, model=llm_req.model)
+            await producer.send_chat_request(llm_req)
+            await hub.update_state(request_id, kafka_acked_at=time.monotonic())
 
-            msg.meta = {**(msg.meta or {}), "request_id": str(llm_req.request_id)}
+            msg.meta = {**(msg.meta or {}), "request_id": request_id}
             return msg
         except ChatSessionNotFound:
+            await hub.discard(request_id)
             raise HTTPException(status_code=404, detail="Chat session not found")
+        except BaseException:
+            # запрос не ушёл в Kafka — освобождаем слот admission control
+            await hub.discard(request_id)
+            raise
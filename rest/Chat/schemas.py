@@ -4,6 +4,8 @@ from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel
 
+from core.llm_schemas import PriorityType
+
 class MessageRole(str, Enum):
     user = "user"
     assistant = "assistant"
@@ -21,6 +23,9 @@ class MessageCreate(BaseModel):
     content: str
     role: MessageRole = MessageRole.user
     meta: Optional[Dict[str, Any]] = None
+    priority: PriorityType = "interactive"
+    # False — воркер отвечает одним сообщением в llm.chat.response, без чанков и SSE
+    stream: bool = True
 
 
 class MessageRead(MessageBase):
@@ -30,6 +35,8 @@ class MessageRead(MessageBase):
     prompt_tokens: Optional[int] = None
     completion_tokens: Optional[int] = None
     latency_ms: Optional[int] = None
+    finish_reason: Optional[str] = None
+    request_id: Optional[str] = None
     meta: Optional[Dict[str, Any]] = None
     is_visible: bool
 
@@ -37,6 +44,19 @@ class MessageRead(MessageBase):
         from_attributes = True
 
 
+class MessageSearchHit(BaseModel):
+    """
+    Результат полнотекстового поиска: фрагмент сообщения с подсветкой и релевантность.
+    """
+    id: int
+    session_id: int
+    session_title: Optional[str] = None
+    role: MessageRole
+    created_at: datetime
+    headline: str
+    rank: float
+
+
 # ---------- ChatSession ----------
 
 class ChatSessionBase(BaseModel):
@@ -62,6 +82,7 @@ class ChatSessionRead(ChatSessionBase):
     created_at: datetime
     updated_at: datetime
     is_archived: bool
+    messages_archived: bool = False
 
     class Config:
         from_attributes = True
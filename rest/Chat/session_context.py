@@ -0,0 +1,148 @@
+import hashlib
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from config.settings import Settings
+from core.llm_schemas import LlmChatRequest, LlmContextRef, LlmMessage
+from core.logger import setup_logger
+from core.metrics import counter
+from rest.Chat.stream_hub import SingletonMeta
+
+DELTA_REQUESTS = counter(
+    "llm_delta_requests_total", "Запросы к LLM: полные (full), дельта (delta) и полный повтор после context_miss (retry)"
+)
+
+
+class _Pending(NamedTuple):
+    session_id: int
+    hasher: "hashlib._Hash"
+    count: int
+    expires_at: float
+    # полный запрос хода, ушедшего дельтой, — на случай context_miss (повторяется один раз)
+    retry: Optional[LlmChatRequest]
+
+
+class _Context(NamedTuple):
+    request_id: str
+    count: int
+    digest: str
+    expires_at: float
+
+
+class SessionContextTracker(metaclass=SingletonMeta):
+    """
+    Что лежит в контексте воркера после последнего завершённого хода сессии.
+
+    Контекст хода = его промпт + ответ ассистента. Дайджест — sha256 по system_prompt_id
+    и (role, content) сообщений по порядку. Следующий ход можно отправить дельтой, если первые
+    count сообщений нового промпта дают тот же дайджест: значит история не обрезалась trim_to_budget
+    и не менялась, и воркеру достаточно хвоста.
+
+    Состояние в памяти процесса и живёт PROMPT_DELTA_TTL_S — не дольше, чем воркеры держат контекст.
+    Дельта работает только с KAFKA_KEY_STRATEGY=session: иначе ходы сессии попадают к разным воркерам,
+    и почти каждый дельта-запрос кончался бы context_miss — с другой стратегией трекер выключен.
+    """
+
+    def __init__(self):
+        self.enabled = Settings.PROMPT_DELTA_ENABLED()
+        if self.enabled and Settings.KAFKA_KEY_STRATEGY() != "session":
+            setup_logger("SessionContext").warning(
+                "PROMPT_DELTA_ENABLED requires KAFKA_KEY_STRATEGY=session (got %s), delta requests are disabled",
+                Settings.KAFKA_KEY_STRATEGY(),
+            )
+            self.enabled = False
+        self._ttl_s = Settings.PROMPT_DELTA_TTL_S()
+        self._pending: Dict[str, _Pending] = {}
+        self._contexts: Dict[int, _Context] = {}
+
+    @staticmethod
+    def _hasher(system_prompt_id: Optional[str]) -> "hashlib._Hash":
+        return hashlib.sha256((system_prompt_id or "").encode("utf-8"))
+
+    @staticmethod
+    def _feed(hasher: "hashlib._Hash", role: str, content: str) -> None:
+        hasher.update(orjson.dumps([role, content]))
+
+    def split(
+        self,
+        session_id: int,
+        messages: List[LlmMessage],
+        system_prompt_id: Optional[str] = None,
+    ) -> Tuple[Optional[LlmContextRef], List[LlmMessage]]:
+        """(ссылка на контекст, хвост) — или (None, messages), если нужен полный запрос."""
+        ctx = self._contexts.get(session_id) if self.enabled else None
+        if ctx is not None and ctx.expires_at < time.monotonic():
+            del self._contexts[session_id]
+            ctx = None
+
+        if ctx is None or ctx.count >= len(messages):
+            DELTA_REQUESTS.inc(kind="full")
+            return None, messages
+
+        hasher = self._hasher(system_prompt_id)
+        for m in messages[:ctx.count]:
+            self._feed(hasher, m.role, m.content)
+        if hasher.hexdigest() != ctx.digest:
+            DELTA_REQUESTS.inc(kind="full")
+            return None, messages
+
+        DELTA_REQUESTS.inc(kind="delta")
+        ref = LlmContextRef(prev_request_id=ctx.request_id, prefix_messages=ctx.count, prefix_digest=ctx.digest)
+        return ref, messages[ctx.count:]
+
+    def begin(
+        self,
+        session_id: int,
+        request_id: str,
+        messages: List[LlmMessage],
+        system_prompt_id: Optional[str] = None,
+        full_request: Optional[LlmChatRequest] = None,
+    ) -> None:
+        """
+        Запомнить полный промпт отправленного хода (messages — весь контекст, не дельта).
+        full_request — полный запрос, если ход уходит дельтой: его повторит take_retry после context_miss.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        # незавершённые ходы (ошибка, потерянный финал) не должны копиться
+        for rid in [rid for rid, p in self._pending.items() if p.expires_at < now]:
+            del self._pending[rid]
+        for sid in [sid for sid, c in self._contexts.items() if c.expires_at < now]:
+            del self._contexts[sid]
+
+        hasher = self._hasher(system_prompt_id)
+        for m in messages:
+            self._feed(hasher, m.role, m.content)
+        self._pending[request_id] = _Pending(session_id, hasher, len(messages), now + self._ttl_s, full_request)
+
+    def take_retry(self, request_id: str) -> Optional[LlmChatRequest]:
+        """
+        Полный запрос для повтора хода, на который воркер ответил context_miss. Отдаётся один раз:
+        полный запрос context_miss дать не может, а повторять по кругу нельзя.
+        """
+        pending = self._pending.get(request_id)
+        if pending is None or pending.retry is None:
+            return None
+        self._pending[request_id] = pending._replace(retry=None)
+        DELTA_REQUESTS.inc(kind="retry")
+        return pending.retry
+
+    def complete(self, request_id: str, reply: str) -> None:
+        """Ход завершён воркером: его контекст теперь промпт + ответ."""
+        pending = self._pending.pop(request_id, None)
+        if pending is None:
+            return
+        self._feed(pending.hasher, "assistant", reply)
+        self._contexts[pending.session_id] = _Context(
+            request_id=request_id,
+            count=pending.count + 1,
+            digest=pending.hasher.hexdigest(),
+            expires_at=time.monotonic() + self._ttl_s,
+        )
+
+    def forget(self, session_id: int) -> None:
+        """Воркер сообщил context_miss (или контекст заведомо потерян) — следующий ход уйдёт полным."""
+        self._contexts.pop(session_id, None)
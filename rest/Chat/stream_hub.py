@@ -1,8 +1,34 @@
 import asyncio
-from typing import Any, AsyncIterator, Dict, List, Optional
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 
 from pydantic import BaseModel, Field
 
+from core.llm_schemas import UsageEvent
+from core.metrics import collector, gauge, histogram
+
+# задержки пайплайна генерации (секунды), метка priority — класс admission control
+TTFT_SECONDS = histogram("llm_ttft_seconds", "От приёма запроса в send_message до первого чанка")
+QUEUE_SECONDS = histogram("llm_queue_seconds", "От подтверждения Kafka до первого чанка: очередь воркера + prefill")
+E2E_SECONDS = histogram("llm_e2e_seconds", "От приёма запроса до финала генерации")
+PERSIST_SECONDS = histogram("llm_persist_seconds", "От финала генерации до сохранения ответа в БД")
+INTER_TOKEN_GAP_SECONDS = histogram(
+    "llm_inter_token_gap_seconds",
+    "Интервал между чанками генерации (по времени прихода в бэкенд)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+HUB_ACTIVE_STREAMS = gauge("stream_hub_active_streams", "Незавершённые генерации в StreamHub по классу приоритета")
+HUB_STATES = gauge("stream_hub_states", "Все state'ы в StreamHub, включая завершённые и ещё не вычищенные janitor'ом")
+HUB_SUBSCRIBERS = gauge("stream_hub_subscribers", "Подключённые SSE-подписчики")
+HUB_QUEUE_DEPTH = gauge("stream_hub_queue_depth", "Неотданные события в очередях подписчиков: сумма (total) и максимум (max)")
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[int]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000)
+
 
 class StreamState(BaseModel):
     request_id: str
@@ -16,10 +42,81 @@ class StreamState(BaseModel):
 
     meta: Dict[str, Any] = Field(default_factory=dict)
     is_done: bool = False
+    is_cancelled: bool = False
+    finish_reason: Optional[str] = None
+    # index последнего принятого чанка: повторная доставка из Kafka (at-least-once) отбрасывается
+    last_index: int = -1
+
+    # ключ ResponseCache, если ответ этой генерации можно положить в кэш
+    cache_key: Optional[str] = None
+    # модель запроса — для аналитики использования
+    model: Optional[str] = None
+
+    # класс приоритета для admission control и момент регистрации/завершения (time.monotonic)
+    priority: str = "interactive"
+    started_at: float = Field(default_factory=time.monotonic)
+    done_at: Optional[float] = None
+
+    # таймлайн генерации (time.monotonic); started_at — запрос принят в send_message
+    kafka_acked_at: Optional[float] = None
+    first_subscriber_at: Optional[float] = None
+    first_chunk_at: Optional[float] = None
+    last_chunk_at: Optional[float] = None
+    final_at: Optional[float] = None
+    persisted_at: Optional[float] = None
+    chunk_count: int = 0
 
     class Config:
         arbitrary_types_allowed = True
 
+    def timeline(self) -> Dict[str, Any]:
+        """
+        Задержки этапов в мс (для Message.meta["timeline"]). Этапы, которых не было, не попадают:
+        у ответа без стрима (llm.chat.response) нет чанков — первым «токеном» считается финал.
+        """
+        first_token_at = self.first_chunk_at or self.final_at
+        generation_ms = _ms(self.first_chunk_at, self.last_chunk_at)
+        tokens = self.completion_tokens if self.completion_tokens is not None else self.chunk_count
+        timeline = {
+            "kafka_publish_ms": _ms(self.started_at, self.kafka_acked_at),
+            "queue_ms": _ms(self.kafka_acked_at, first_token_at),
+            "ttft_ms": _ms(self.started_at, first_token_at),
+            "generation_ms": generation_ms,
+            "e2e_ms": _ms(self.started_at, self.final_at),
+            "first_subscriber_ms": _ms(self.started_at, self.first_subscriber_at),
+            "chunks": self.chunk_count or None,
+            "tokens_per_s": round(tokens * 1000 / generation_ms, 1) if generation_ms and tokens else None,
+        }
+        return {name: value for name, value in timeline.items() if value is not None}
+
+    def observe_latency(self) -> None:
+        """Задержки завершённой генерации — в гистограммы."""
+        first_token_at = self.first_chunk_at or self.final_at
+        for metric, start, end in (
+            (TTFT_SECONDS, self.started_at, first_token_at),
+            (QUEUE_SECONDS, self.kafka_acked_at, first_token_at),
+            (E2E_SECONDS, self.started_at, self.final_at),
+        ):
+            if start is not None and end is not None:
+                metric.observe(end - start, priority=self.priority)
+
+    def usage_event(self, cached: bool = False) -> UsageEvent:
+        """Итог генерации для аналитики; без usage от воркера completion оценивается как в RateLimiter."""
+        completion_tokens = self.completion_tokens
+        if completion_tokens is None:
+            completion_tokens = max(1, len(self.text) // 4) if self.text else 0
+        return UsageEvent(
+            request_id=self.request_id,
+            user_id=self.user_id,
+            chat_session_id=self.session_id,
+            model=self.model or "unknown",
+            prompt_tokens=self.prompt_tokens or 0,
+            completion_tokens=completion_tokens,
+            latency_ms=self.latency_ms,
+            finish_reason=self.finish_reason,
+            cached=cached,
+        )
+
 
 class SingletonMeta(type):
     _instances: dict[type, object] = {}
@@ -37,13 +134,133 @@ class StreamHub(metaclass=SingletonMeta):
         self._subs: Dict[str, List[asyncio.Queue]] = {}
         self._state: Dict[str, StreamState] = {}
 
-    async def register(self, request_id: str, session_id: int, user_id: int) -> None:
+        # счётчики незавершённых генераций — ведём инкрементально, чтобы admission control был O(1)
+        self._inflight_total = 0
+        self._inflight_by_user: Dict[int, int] = {}
+        self._inflight_by_priority: Dict[str, int] = {}
+
+        # автоотмена генерации, от которой отключился последний SSE-подписчик
+        self._abandon_handler: Optional[Callable[[str], Awaitable[Any]]] = None
+        self._abandon_grace_s: float = 0
+
+        # вызываются с request_id при любом переходе в is_done
+        self._done_listeners: List[Callable[[str], None]] = []
+
+        collector(self._collect_metrics)
+
+    def _collect_metrics(self) -> None:
+        # вызывается при выгрузке метрик, синхронно — между await'ами структуры hub не меняются
+        for priority in self._inflight_by_priority.keys() | {"interactive", "batch"}:
+            HUB_ACTIVE_STREAMS.set(self._inflight_by_priority.get(priority, 0), priority=priority)
+        HUB_STATES.set(len(self._state))
+        depths = [q.qsize() for subs in self._subs.values() for q in subs]
+        HUB_SUBSCRIBERS.set(len(depths))
+        HUB_QUEUE_DEPTH.set(sum(depths), stat="total")
+        HUB_QUEUE_DEPTH.set(max(depths, default=0), stat="max")
+
+    def set_abandon_handler(self, handler: Callable[[str], Awaitable[Any]], grace_s: float) -> None:
+        """
+        handler(request_id) вызывается, если через grace_s секунд после ухода последнего подписчика
+        генерация всё ещё идёт и новых подписчиков нет. grace_s <= 0 — автоотмена выключена.
+        """
+        self._abandon_handler = handler
+        self._abandon_grace_s = grace_s
+
+    def add_done_listener(self, listener: Callable[[str], None]) -> None:
+        """
+        listener(request_id) — генерация завершилась: финал, отмена, discard, зависание (prune).
+        Вызывается синхронно под lock'ом hub'а, поэтому должен быть быстрым и не обращаться к hub.
+        """
+        self._done_listeners.append(listener)
+
+    async def register(
+        self,
+        request_id: str,
+        session_id: int,
+        user_id: int,
+        cache_key: Optional[str] = None,
+        priority: str = "interactive",
+    ) -> None:
         async with self._lock:
+            old = self._state.get(request_id)
+            if old is not None and not old.is_done:
+                self._set_done(old)
             self._state[request_id] = StreamState(
                 request_id=request_id,
                 session_id=session_id,
                 user_id=user_id,
+                cache_key=cache_key,
+                priority=priority,
             )
+            self._inflight_total += 1
+            self._inflight_by_user[user_id] = self._inflight_by_user.get(user_id, 0) + 1
+            self._inflight_by_priority[priority] = self._inflight_by_priority.get(priority, 0) + 1
+
+    def _set_done(self, st: StreamState) -> None:
+        """Единственная точка перехода в is_done (вызывать под self._lock)."""
+        if st.is_done:
+            return
+        st.is_done = True
+        st.done_at = time.monotonic()
+        self._inflight_total -= 1
+        left = self._inflight_by_user.get(st.user_id, 0) - 1
+        if left > 0:
+            self._inflight_by_user[st.user_id] = left
+        else:
+            self._inflight_by_user.pop(st.user_id, None)
+        self._inflight_by_priority[st.priority] = max(0, self._inflight_by_priority.get(st.priority, 0) - 1)
+        for listener in self._done_listeners:
+            listener(st.request_id)
+
+    def inflight(self, user_id: Optional[int] = None, priority: Optional[str] = None) -> int:
+        """Число незавершённых генераций: всего / у пользователя / в классе приоритета."""
+        if user_id is not None:
+            return self._inflight_by_user.get(user_id, 0)
+        if priority is not None:
+            return self._inflight_by_priority.get(priority, 0)
+        return self._inflight_total
+
+    async def update_state(self, request_id: str, **fields: Any) -> None:
+        async with self._lock:
+            st = self._state.get(request_id)
+            if st is not None:
+                for name, value in fields.items():
+                    setattr(st, name, value)
+
+    async def discard(self, request_id: str) -> None:
+        """Убрать state (например, запрос не дошёл до Kafka) и освободить слот."""
+        async with self._lock:
+            st = self._state.pop(request_id, None)
+            if st is not None:
+                self._set_done(st)
+
+    async def prune(self, done_ttl_s: float, stale_s: float) -> int:
+        """
+        Чистка state:
+          • завершённые старше done_ttl_s — удаляем (до этого SSE может переиграть результат)
+          • незавершённые старше stale_s (воркер пропал) — завершаем с finish_reason="error"
+        Возвращает число зависших генераций.
+        """
+        now = time.monotonic()
+        stale: List[str] = []
+        async with self._lock:
+            for request_id, st in list(self._state.items()):
+                if st.is_done:
+                    if st.done_at is not None and now - st.done_at > done_ttl_s:
+                        del self._state[request_id]
+                elif now - st.started_at > stale_s:
+                    st.finish_reason = "error"
+                    self._set_done(st)
+                    stale.append(request_id)
+
+        for request_id in stale:
+            await self.publish(request_id, {"type": "done"})
+        return len(stale)
+
+    async def run_janitor(self, interval_s: float, done_ttl_s: float, stale_s: float) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            await self.prune(done_ttl_s=done_ttl_s, stale_s=stale_s)
 
     async def get_state(self, request_id: str) -> Optional[StreamState]:
         async with self._lock:
@@ -52,7 +269,24 @@ class StreamHub(metaclass=SingletonMeta):
     async def subscribe(self, request_id: str) -> AsyncIterator[dict]:
         q: asyncio.Queue = asyncio.Queue(maxsize=200)
         async with self._lock:
-            self._subs.setdefault(request_id, []).append(q)
+            st = self._state.get(request_id)
+            if st is not None and st.is_done:
+                # генерация уже завершилась (или ответ взят из кэша) — отдаём результат целиком
+                replay = [
+                    {"type": "chunk", "delta": st.text, "index": 0},
+                    {"type": "final", "content": st.text, "finish_reason": st.finish_reason},
+                    {"type": "done"},
+                ]
+            else:
+                replay = None
+                self._subs.setdefault(request_id, []).append(q)
+                if st is not None and st.first_subscriber_at is None:
+                    st.first_subscriber_at = time.monotonic()
+
+        if replay is not None:
+            for event in replay:
+                yield event
+            return
 
         try:
             while True:
@@ -65,8 +299,21 @@ class StreamHub(metaclass=SingletonMeta):
                 subs = self._subs.get(request_id, [])
                 if q in subs:
                     subs.remove(q)
+                abandoned = False
                 if not subs:
                     self._subs.pop(request_id, None)
+                    st = self._state.get(request_id)
+                    abandoned = st is not None and not st.is_done
+            if abandoned and self._abandon_handler is not None and self._abandon_grace_s > 0:
+                asyncio.create_task(self._abandon_after_grace(request_id))
+
+    async def _abandon_after_grace(self, request_id: str) -> None:
+        await asyncio.sleep(self._abandon_grace_s)
+        async with self._lock:
+            st = self._state.get(request_id)
+            if st is None or st.is_done or self._subs.get(request_id):
+                return
+        await self._abandon_handler(request_id)
 
     async def publish(self, request_id: str, event: dict) -> None:
         async with self._lock:
@@ -82,11 +329,80 @@ class StreamHub(metaclass=SingletonMeta):
         async with self._lock:
             st = self._state.get(request_id)
             if st:
-                st.is_done = True
+                self._set_done(st)
         await self.publish(request_id, {"type": "done"})
 
-    async def append_text(self, request_id: str, delta: str) -> None:
+    async def append_text(self, request_id: str, delta: str) -> bool:
+        """Дописать дельту. False — генерация уже завершена/отменена, чанк можно выбросить."""
         async with self._lock:
             st = self._state.get(request_id)
-            if st:
-                st.text += delta
+            if st is None or st.is_done:
+                return False
+            st.text += delta
+            return True
+
+    async def append_chunk(self, request_id: str, parts: Sequence[Tuple[int, str]]) -> bool:
+        """
+        Дописать пачку чанков [(index, delta), ...] и разослать их одним событием — за один захват lock'а.
+        Чанки с index не больше уже принятого (повтор после ребаланса/рестарта) отбрасываются.
+        False — генерация уже завершена/отменена.
+        """
+        async with self._lock:
+            st = self._state.get(request_id)
+            if st is None or st.is_done:
+                return False
+
+            last_index = st.last_index
+            fresh = [delta for index, delta in parts if index > last_index]
+            if not fresh:
+                return True
+            delta = "".join(fresh)
+            st.text += delta
+            st.last_index = max(index for index, _ in parts)
+
+            now = time.monotonic()
+            if st.first_chunk_at is None:
+                st.first_chunk_at = now
+            else:
+                # чанки одной пачки getmany() приходят разом — интервал делим между ними
+                INTER_TOKEN_GAP_SECONDS.observe((now - st.last_chunk_at) / len(fresh))
+            st.last_chunk_at = now
+            st.chunk_count += len(fresh)
+
+            event = {"type": "chunk", "delta": delta, "index": st.last_index}
+            for q in self._subs.get(request_id, ()):
+                try:
+                    q.put_nowait(event)
+                except asyncio.QueueFull:
+                    pass
+            return True
+
+    async def finish(self, request_id: str, finish_reason: str = "stop") -> Optional[StreamState]:
+        """
+        Пометить генерацию завершённой (атомарно, один раз) — на финальном чанке от воркера.
+        None — state нет или генерацию уже отменили/завершили, сохранять ответ не нужно.
+        """
+        async with self._lock:
+            st = self._state.get(request_id)
+            if st is None or st.is_done:
+                return None
+            st.finish_reason = finish_reason
+            st.final_at = time.monotonic()
+            self._set_done(st)
+            return st
+
+    async def cancel(self, request_id: str) -> Optional[StreamState]:
+        """
+        Пометить идущую генерацию отменённой (атомарно, один раз).
+        Возвращает state, если отменили именно сейчас, иначе None (нет такой или уже завершена).
+        Подписчиков не закрывает — это делает mark_done после сохранения частичного ответа.
+        """
+        async with self._lock:
+            st = self._state.get(request_id)
+            if st is None or st.is_done:
+                return None
+            st.is_cancelled = True
+            st.finish_reason = "cancelled"
+            st.final_at = time.monotonic()
+            self._set_done(st)
+            return st
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, status
 from sse_starlette.sse import EventSourceResponse
 
-from core.auth import BasicAuth
+from core.rate_limit import rate_limited_user
 from dal import Database
+from rest.Chat.cancellation import cancel_generation
 from rest.Chat.stream_hub import StreamHub
 
 
@@ -20,10 +21,18 @@ class ChatStreamAPI:
             methods=["GET"],
         )
 
+        # Остановить генерацию («стоп» в UI)
+        self.router.add_api_route(
+            "/stream/{request_id}/cancel",
+            self.cancel_stream,
+            methods=["POST"],
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+
     @staticmethod
     async def stream_by_request_id(
         request_id: str,
-        current_user=Depends(BasicAuth.token_auth),
+        current_user=Depends(rate_limited_user),
         hub: StreamHub = Depends(get_hub),
     ):
         st = await hub.get_state(request_id)
@@ -41,3 +50,16 @@ class ChatStreamAPI:
                 yield {"event": event.get("type", "message"), "data": event}
 
         return EventSourceResponse(gen())
+
+    @staticmethod
+    async def cancel_stream(
+        request_id: str,
+        current_user=Depends(rate_limited_user),
+        hub: StreamHub = Depends(get_hub),
+    ):
+        st = await hub.get_state(request_id)
+        if st is None or st.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Unknown request_id")
+
+        cancelled = await cancel_generation(hub, request_id, reason="user")
+        return {"request_id": request_id, "cancelled": cancelled}
@@ -0,0 +1,115 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Pattern
+
+from starlette.routing import compile_path
+from starlette.types import Scope
+
+from config.settings import Settings
+from core.metrics import counter
+from rest.Chat.stream_hub import SingletonMeta
+
+PROFILES_CAPTURED = counter("profiling_captures_total", "Запросы под cProfile: сохранённые (saved) и быстрые (discarded)")
+
+# имя файла профиля — только то, что генерирует сам профайлер (защита от path traversal при скачивании)
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.prof$")
+
+
+class SlowRequestProfiler(metaclass=SingletonMeta):
+    """
+    cProfile для медленных запросов одного маршрута.
+
+    Пока профайлер включён, каждый подходящий запрос выполняется под cProfile; профиль сохраняется,
+    только если запрос оказался дольше slow_ms, и не больше max_captures раз — дальше профайлер
+    выключается сам. Под профайлером одновременно один запрос: cProfile профилирует весь поток,
+    поэтому в профиль попадает и то, что event loop делал для других запросов в это время
+    (блокирующий bcrypt, ожидание lock'а hub и т.п.) — как раз то, из-за чего запрос мог быть медленным.
+
+    Выключенный профайлер стоит одной проверки атрибута на запрос.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.route: Optional[str] = None
+        self.slow_ms = Settings.PROFILING_SLOW_MS()
+        self.max_captures = Settings.PROFILING_MAX_CAPTURES()
+        self.captured = 0
+        self._route_re: Optional[Pattern] = None
+        self._busy = False
+        self._dir = Path(Settings.PROFILING_DIR())
+        if Settings.PROFILING_ENABLED():
+            self.configure(Settings.PROFILING_ROUTE() or None, self.slow_ms, self.max_captures)
+
+    def configure(self, route: Optional[str], slow_ms: int, max_captures: int) -> None:
+        """Включить (или перенастроить) захват; счётчик сохранённых профилей сбрасывается."""
+        self._route_re = compile_path(route)[0] if route else None
+        self.route = route
+        self.slow_ms = slow_ms
+        self.max_captures = max_captures
+        self.captured = 0
+        self.enabled = max_captures > 0
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def wants(self, scope: Scope) -> bool:
+        if self._busy or self.captured >= self.max_captures:
+            return False
+        return self._route_re is None or self._route_re.match(scope["path"]) is not None
+
+    def start(self) -> cProfile.Profile:
+        self._busy = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    async def finish(self, profile: cProfile.Profile, scope: Scope, elapsed_s: float) -> Optional[str]:
+        """Остановить профиль; сохранить, если запрос медленный. Возвращает имя файла или None."""
+        profile.disable()
+        self._busy = False
+
+        elapsed_ms = round(elapsed_s * 1000)
+        if elapsed_ms < self.slow_ms or self.captured >= self.max_captures:
+            PROFILES_CAPTURED.inc(result="discarded")
+            return None
+
+        self.captured += 1
+        if self.captured >= self.max_captures:
+            self.enabled = False
+
+        route = getattr(scope.get("route"), "path", scope["path"])
+        slug = re.sub(r"[^\w]+", "_", route).strip("_") or "root"
+        name = (
+            f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{scope['method']}-{slug}-{elapsed_ms}ms-{self.captured}.prof"
+        )
+        # запись файла — не в event loop
+        await asyncio.to_thread(self._dump, profile, name)
+        PROFILES_CAPTURED.inc(result="saved")
+        return name
+
+    def _dump(self, profile: cProfile.Profile, name: str) -> None:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(self._dir / name)
+
+    def profiles(self) -> List[Path]:
+        if not self._dir.is_dir():
+            return []
+        return sorted(self._dir.glob("*.prof"), reverse=True)
+
+    def profile_path(self, name: str) -> Optional[Path]:
+        if not PROFILE_NAME_RE.match(name):
+            return None
+        path = self._dir / name
+        return path if path.is_file() else None
+
+    @staticmethod
+    def summary(path: Path, limit: int = 50, sort: str = "cumulative") -> str:
+        """Текстовая сводка pstats (топ функций) — посмотреть профиль без скачивания."""
+        out = io.StringIO()
+        pstats.Stats(str(path), stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
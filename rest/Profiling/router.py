@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from core.rate_limit import rate_limited_user
+from dal.schema.Entity.BackendSchema import User
+from rest.Profiling.profiler import SlowRequestProfiler
+from rest.Profiling.schemas import ProfileInfo, ProfileList, ProfilingConfig, ProfilingStatus
+
+
+def admin_user(current_user: User = Depends(rate_limited_user)) -> User:
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin rights required")
+    return current_user
+
+
+def get_profiler() -> SlowRequestProfiler:
+    return SlowRequestProfiler()
+
+
+class ProfilingAPI:
+    def __init__(self):
+        self.router = APIRouter(prefix="/admin/profiling", tags=["Admin"], dependencies=[Depends(admin_user)])
+
+        # Текущее состояние профайлера
+        self.router.add_api_route("", self.get_status, methods=["GET"], response_model=ProfilingStatus)
+
+        # Включить захват медленных запросов маршрута (счётчик сохранённых сбрасывается)
+        self.router.add_api_route("", self.configure, methods=["PUT"], response_model=ProfilingStatus)
+
+        # Выключить (сохранённые профили остаются)
+        self.router.add_api_route("", self.disable, methods=["DELETE"], response_model=ProfilingStatus)
+
+        # Сохранённые профили, новые первыми
+        self.router.add_api_route("/profiles", self.list_profiles, methods=["GET"], response_model=ProfileList)
+
+        # Скачать .prof (pstats/snakeviz) или посмотреть текстовую сводку (?format=text)
+        self.router.add_api_route("/profiles/{name}", self.get_profile, methods=["GET"])
+
+    @staticmethod
+    def _status(profiler: SlowRequestProfiler) -> ProfilingStatus:
+        return ProfilingStatus(
+            enabled=profiler.enabled,
+            route=profiler.route,
+            slow_ms=profiler.slow_ms,
+            max_captures=profiler.max_captures,
+            captured=profiler.captured,
+        )
+
+    @staticmethod
+    async def get_status(profiler: SlowRequestProfiler = Depends(get_profiler)) -> ProfilingStatus:
+        return ProfilingAPI._status(profiler)
+
+    @staticmethod
+    async def configure(
+        config: ProfilingConfig,
+        profiler: SlowRequestProfiler = Depends(get_profiler),
+    ) -> ProfilingStatus:
+        profiler.configure(config.route, config.slow_ms, config.max_captures)
+        return ProfilingAPI._status(profiler)
+
+    @staticmethod
+    async def disable(profiler: SlowRequestProfiler = Depends(get_profiler)) -> ProfilingStatus:
+        profiler.disable()
+        return ProfilingAPI._status(profiler)
+
+    @staticmethod
+    async def list_profiles(profiler: SlowRequestProfiler = Depends(get_profiler)) -> ProfileList:
+        profiles = []
+        for path in profiler.profiles():
+            stat = path.stat()
+            profiles.append(ProfileInfo(
+                name=path.name,
+                size=stat.st_size,
+                created_at=datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            ))
+        return ProfileList(profiles=profiles)
+
+    @staticmethod
+    async def get_profile(
+        name: str,
+        format: Literal["prof", "text"] = "prof",
+        profiler: SlowRequestProfiler = Depends(get_profiler),
+    ):
+        path = profiler.profile_path(name)
+        if path is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+        if format == "text":
+            return PlainTextResponse(profiler.summary(path))
+        return FileResponse(path, media_type="application/octet-stream", filename=name)
@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ProfilingConfig(BaseModel):
+    # шаблон маршрута как в роутере, например /chat/sessions/{session_id}/messages; None — любой
+    route: Optional[str] = None
+    slow_ms: int = Field(500, ge=0)
+    max_captures: int = Field(10, ge=1, le=100)
+
+
+class ProfilingStatus(ProfilingConfig):
+    enabled: bool
+    captured: int
+
+
+class ProfileInfo(BaseModel):
+    name: str
+    size: int
+    created_at: datetime
+
+
+class ProfileList(BaseModel):
+    profiles: List[ProfileInfo]
@@ -0,0 +1,134 @@
+import asyncio
+from logging import Logger
+from typing import Dict, List, Tuple
+
+from aiokafka import ConsumerRecord, TopicPartition
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from config.settings import KafkaTopics
+from core.consumer import ConsumerBase
+from core.llm_schemas import UsageEventBatch
+from core.metrics import counter
+from core.wire_format import decode
+
+from dal.database import Database
+
+USAGE_AGGREGATED = counter("analytics_usage_aggregated_total", "События usage, учтённые в usage_hourly")
+
+# пауза перед повтором пачки, которую не удалось записать в БД: удваивается до APPLY_RETRY_MAX_DELAY_S
+APPLY_RETRY_DELAY_S = 1.0
+APPLY_RETRY_MAX_DELAY_S = 30.0
+# сколько раз повторять пачку при ошибке, которая от повтора не пройдёт (данные, схема)
+APPLY_MAX_ATTEMPTS = 3
+
+# SQLSTATE конфликтов транзакций: serialization_failure, deadlock_detected
+_RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+
+def is_transient_db_error(error: BaseException) -> bool:
+    """Сбой, который пройдёт сам: БД/сеть недоступна, пул исчерпан, таймаут, конфликт транзакций."""
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or getattr(error.orig, "sqlstate", None) in _RETRYABLE_SQLSTATES
+    return False
+
+
+class UsageAggregationConsumer(ConsumerBase):
+    """
+    Агрегатор analytics_tasks: сворачивает UsageEventBatch в usage_hourly (пользователь × модель × час).
+
+    Всё, что пришло из партиции за один getmany(), пишется одной транзакцией (upsert счётчиков),
+    offset коммитится только после неё. При сбое БД позиция возвращается к началу пачки;
+    повторная доставка отбрасывается по batch_id (processed_usage_batches).
+
+    Временные сбои (БД недоступна, таймауты) повторяются без ограничения — ждать, пока БД вернётся.
+    Прочие ошибки повторяются APPLY_MAX_ATTEMPTS раз, затем пачки партиции пишутся по одной:
+    те, что не проходят и так, уходят в DLQ, offset коммитится дальше них — партиция не встаёт.
+    """
+
+    def __init__(
+        self,
+        bootstrap_servers: str,
+        group_id: str,
+        logger: Logger,
+        database: Database,
+        batch_max_records: int = 500,
+        batch_timeout_ms: int = 1000,
+        **kwargs,
+    ):
+        super().__init__(
+            bootstrap_servers=bootstrap_servers,
+            topic=KafkaTopics.ANALYTICS_TASKS.value,
+            group_id=group_id,
+            logger=logger,
+            # формат value — по заголовку content-type
+            value_deserializer=None,
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+            **kwargs,
+        )
+        self._Database = database
+        self._batch_max_records = batch_max_records
+        self._batch_timeout_ms = batch_timeout_ms
+        # подряд неудачные попытки записать пачку, по партиции
+        self._failures: Dict[TopicPartition, int] = {}
+
+    async def run_forever(self):
+        async for tp, records in self.batches(max_records=self._batch_max_records, timeout_ms=self._batch_timeout_ms):
+            decoded: List[Tuple[ConsumerRecord, UsageEventBatch]] = []
+            for record in records:
+                if not record.value:
+                    continue
+                try:
+                    decoded.append((record, decode(UsageEventBatch, record.value, record.headers)))
+                except Exception as e:
+                    await self.dead_letter(record, e)
+
+            try:
+                applied = await self._Database.UsageService.apply_usage_batches([batch for _, batch in decoded])
+            except Exception as e:
+                failures = self._failures[tp] = self._failures.get(tp, 0) + 1
+                if is_transient_db_error(e) or failures < APPLY_MAX_ATTEMPTS:
+                    await self._retry_later(tp, records, e, failures)
+                    continue
+                try:
+                    applied = await self._apply_one_by_one(decoded)
+                except Exception as e:
+                    await self._retry_later(tp, records, e, failures)
+                    continue
+
+            self._failures.pop(tp, None)
+            USAGE_AGGREGATED.inc(applied)
+            try:
+                await self.commit({tp: records[-1].offset + 1})
+            except Exception as e:
+                # не страшно: пачки придут снова и будут отброшены по batch_id
+                self._logger.warning("Offset commit failed (%s), usage batches may be redelivered", e)
+
+    async def _retry_later(self, tp: TopicPartition, records: List[ConsumerRecord], error: Exception, failures: int) -> None:
+        delay = min(APPLY_RETRY_MAX_DELAY_S, APPLY_RETRY_DELAY_S * 2 ** (failures - 1))
+        self._logger.warning(
+            "Failed to aggregate usage batches (%s: %s, attempt %d), retry in %.1f s",
+            type(error).__name__, error, failures, delay,
+        )
+        # перечитать ту же пачку: ничего из неё не записано (одна транзакция)
+        self.seek(tp, records[0].offset)
+        await asyncio.sleep(delay)
+
+    async def _apply_one_by_one(self, decoded: List[Tuple[ConsumerRecord, UsageEventBatch]]) -> int:
+        """
+        Пачка не записывается целиком — ищем, какие из её UsageEventBatch ломают транзакцию.
+        Непроходящие уходят в DLQ; временный сбой пробрасывается — тогда повторяется вся пачка
+        (уже записанные отбросятся по batch_id).
+        """
+        applied = 0
+        for record, batch in decoded:
+            try:
+                applied += await self._Database.UsageService.apply_usage_batches([batch])
+            except Exception as e:
+                if is_transient_db_error(e):
+                    raise
+                await self.dead_letter(record, e)
+        return applied
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from core.rate_limit import rate_limited_user
+from dal import Database
+from dal.schema.Entity.BackendSchema import User
+from rest.Usage.schemas import UsageBucket, UsageGranularity, UsageReport
+
+# дальше — отчёт по дням за год; больше не отдаём одним ответом
+MAX_RANGE = timedelta(days=366)
+
+
+class UsageAPI:
+    def __init__(self):
+        self.router = APIRouter(prefix="/usage", tags=["Usage"])
+
+        # Использование токенов по интервалам — из предагрегированной usage_hourly, не из messages
+        self.router.add_api_route(
+            "",
+            self.get_usage,
+            methods=["GET"],
+            response_model=UsageReport,
+        )
+
+    @staticmethod
+    async def get_usage(
+        since: Optional[datetime] = Query(None, description="Начало периода (по умолчанию — 7 дней назад)"),
+        until: Optional[datetime] = Query(None, description="Конец периода, не включая (по умолчанию — сейчас)"),
+        granularity: UsageGranularity = "day",
+        model: Optional[str] = None,
+        user_id: Optional[int] = None,
+        current_user: User = Depends(rate_limited_user),
+    ) -> UsageReport:
+        if user_id is None:
+            user_id = current_user.id
+        elif user_id != current_user.id and not current_user.is_admin:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin rights required")
+
+        until = until or datetime.now(timezone.utc)
+        since = since or until - timedelta(days=7)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+        if since >= until or until - since > MAX_RANGE:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail=f"Invalid period: since must be before until, at most {MAX_RANGE.days} days",
+            )
+
+        rows = await Database.UsageService.get_usage(
+            user_id=user_id,
+            since=since,
+            until=until,
+            granularity=granularity,
+            model=model,
+        )
+        buckets = [
+            UsageBucket(
+                bucket=row.bucket,
+                model=row.model,
+                requests=row.requests,
+                cached_requests=row.cached_requests,
+                error_requests=row.error_requests,
+                prompt_tokens=row.prompt_tokens,
+                completion_tokens=row.completion_tokens,
+                total_tokens=row.prompt_tokens + row.completion_tokens,
+                avg_latency_ms=row.latency_ms_sum / row.latency_count if row.latency_count else None,
+            )
+            for row in rows
+        ]
+        return UsageReport(
+            user_id=user_id,
+            since=since,
+            until=until,
+            granularity=granularity,
+            buckets=buckets,
+            total_requests=sum(b.requests for b in buckets),
+            total_tokens=sum(b.total_tokens for b in buckets),
+        )
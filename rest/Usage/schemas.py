@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel
+
+UsageGranularity = Literal["hour", "day"]
+
+
+class UsageBucket(BaseModel):
+    """Использование одной модели за интервал (час или сутки, UTC)."""
+    bucket: datetime
+    model: str
+    requests: int
+    cached_requests: int
+    error_requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    avg_latency_ms: Optional[float] = None
+
+
+class UsageReport(BaseModel):
+    user_id: int
+    since: datetime
+    until: datetime
+    granularity: UsageGranularity
+    buckets: List[UsageBucket]
+    total_requests: int
+    total_tokens: int
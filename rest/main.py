@@ -1,53 +1,135 @@
-import time
+import asyncio
 from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.openapi.docs import get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html, get_redoc_html
 
 from config.settings import Settings
-from core.llm_schemas import LlmStreamChunk
+from core.analytics import AnalyticsEmitter
+from core.logger import setup_logger
+from core.metrics import render_prometheus
+from core.llm_topics import LlmKafkaTopic
 from core.producer import LlmKafkaProducer
+from core.prompt_templates import PromptTemplateRegistry
+from core.rate_limit import RateLimiter
+from dal import Database
 from rest.Authentication.router import Authentication
+from rest.Chat.cancellation import cancel_generation
 from rest.Chat.kafka_stream_consumer import KafkaLlmStreamConsumer
+from rest.Chat.response_cache import ResponseCache
 from rest.Chat.router import ChatAPI
+from rest.Chat.session_context import SessionContextTracker
 from rest.Chat.stream_hub import StreamHub
 from rest.Chat.stream_router import ChatStreamAPI
+from rest.Usage.aggregator import UsageAggregationConsumer
+from rest.Profiling.router import ProfilingAPI
+from rest.Usage.router import UsageAPI
+from rest.middleware import ProcessTimeMiddleware, ProfilingMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # партиции messages нужны до первой вставки — независимо от MAINTENANCE_ENABLED,
+    # иначе сообщения текущего месяца легли бы в DEFAULT
+    await Database.MaintenanceService.ensure_message_partitions(months_ahead=Settings.PARTITION_MONTHS_AHEAD())
+
     # singletons / state
     app.state.hub = StreamHub()
+    hub_janitor_task = asyncio.create_task(app.state.hub.run_janitor(
+        interval_s=30,
+        done_ttl_s=Settings.STREAM_DONE_TTL_S(),
+        stale_s=Settings.STREAM_STALE_S(),
+    ))
+    cancel_logger = setup_logger("StreamCancel")
+    app.state.hub.set_abandon_handler(
+        lambda request_id: cancel_generation(app.state.hub, request_id, reason="abandoned", logger=cancel_logger),
+        grace_s=Settings.STREAM_ABANDON_GRACE_S(),
+    )
 
     producer = LlmKafkaProducer()
     await producer.start()
     app.state.producer = producer
+    try:
+        # шаблоны регистрируются при импорте роутеров; воркеры читают их из compacted-топика
+        await PromptTemplateRegistry().publish(producer)
+    except Exception:
+        setup_logger("PromptTemplates").exception("Failed to publish prompt templates")
+
+    # события usage копятся в памяти и уходят в analytics_tasks пачками фоновой задачей
+    analytics = AnalyticsEmitter()
+    analytics_task = None
+    if analytics.enabled:
+        analytics_task = asyncio.create_task(analytics.run_forever(
+            logger=setup_logger("Analytics"),
+            interval_ms=Settings.ANALYTICS_FLUSH_INTERVAL_MS(),
+            producer=producer,
+        ))
 
     consumer = KafkaLlmStreamConsumer(
         bootstrap_servers=Settings.KAFKA_SERVERS(),
-        topic="llm.chat.token",
+        # чанки стрима и цельные ответы (stream=False) обрабатывает один consumer
+        topic=[LlmKafkaTopic.CHAT_TOKEN.value, LlmKafkaTopic.CHAT_RESPONSE.value],
         group_id="backend-stream",
         logger=app.logger if hasattr(app, "logger") else __import__("logging").getLogger("app"),
-        value_deserializer=LlmStreamChunk.model_validate_json,
         hub=app.state.hub,
         database=__import__("dal").Database,   # или передай напрямую
+        response_cache=ResponseCache(),
+        rate_limiter=RateLimiter(),
+        session_context=SessionContextTracker(),
+        analytics=analytics,
+        batch_max_records=Settings.KAFKA_BATCH_MAX_RECORDS(),
+        batch_timeout_ms=Settings.KAFKA_BATCH_TIMEOUT_MS(),
+        manual_commit=Settings.KAFKA_STREAM_MANUAL_COMMIT(),
+        commit_interval_ms=Settings.KAFKA_STREAM_COMMIT_INTERVAL_MS(),
+        dlq_producer=producer if Settings.KAFKA_DLQ_ENABLED() else None,
     )
     await consumer.start()
     consumer_task = __import__("asyncio").create_task(consumer.run_forever())
     app.state.stream_consumer = consumer
     app.state.stream_consumer_task = consumer_task
 
+    aggregator = None
+    aggregator_task = None
+    if Settings.ANALYTICS_AGGREGATOR_ENABLED():
+        aggregator = UsageAggregationConsumer(
+            bootstrap_servers=Settings.KAFKA_SERVERS(),
+            group_id="backend-usage-aggregator",
+            logger=setup_logger("UsageAggregator"),
+            database=Database,
+            batch_max_records=Settings.KAFKA_BATCH_MAX_RECORDS(),
+            dlq_producer=producer if Settings.KAFKA_DLQ_ENABLED() else None,
+        )
+        await aggregator.start()
+        aggregator_task = asyncio.create_task(aggregator.run_forever())
+
+    maintenance_task = None
+    if Settings.MAINTENANCE_ENABLED():
+        maintenance_task = asyncio.create_task(Database.MaintenanceService.run_forever(
+            logger=setup_logger("DatabaseMaintenance"),
+            interval_s=Settings.MAINTENANCE_INTERVAL_S(),
+            months_ahead=Settings.PARTITION_MONTHS_AHEAD(),
+            archive_after_days=Settings.ARCHIVE_AFTER_DAYS(),
+            batch_size=Settings.ARCHIVE_BATCH_SIZE(),
+        ))
+
     try:
         yield
     finally:
         # shutdown
-        consumer_task.cancel()
-        try:
-            await consumer_task
-        except Exception:
-            pass
+        # analytics_task — после consumer'а: последние события usage ещё успеют уйти до producer.stop()
+        for task in (consumer_task, aggregator_task, maintenance_task, hub_janitor_task, analytics_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
         await consumer.stop()
+        if aggregator is not None:
+            await aggregator.stop()
         await producer.stop()
 
 
@@ -79,18 +161,17 @@ async def redoc_html():
     )
 
 
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+# cProfile медленных запросов — только когда включён (PROFILING_ENABLED или PUT /admin/profiling)
+app.add_middleware(ProfilingMiddleware)
+# время обработки (X-Process-Time) и гистограмма по маршрутам — чистый ASGI, без BaseHTTPMiddleware
+app.add_middleware(ProcessTimeMiddleware)
 
 
 app.include_router(Authentication().router)
 app.include_router(ChatAPI().router)
 app.include_router(ChatStreamAPI().router)
+app.include_router(UsageAPI().router)
+app.include_router(ProfilingAPI().router)
 
 
 @app.get("/health", include_in_schema=False)
@@ -99,6 +180,13 @@ async def healthcheck():
     return {"status": "ok"}
 
 
+if Settings.METRICS_ENABLED():
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """In-process метрики в текстовом формате Prometheus."""
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=80)
@@ -0,0 +1,88 @@
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.metrics import histogram
+from rest.Profiling.profiler import SlowRequestProfiler
+
+PROCESS_TIME_HEADER = "X-Process-Time"
+
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса до ответа (для SSE — до начала стрима), по маршруту",
+)
+
+
+class ProcessTimeMiddleware:
+    """
+    Время обработки запроса: заголовок X-Process-Time и гистограмма http_request_duration_seconds.
+
+    Чистый ASGI, без BaseHTTPMiddleware: тот заворачивает каждый ответ в отдельную задачу и поток
+    памяти (anyio), что стоит заметной доли на лёгких запросах и мешает стриминговым ответам (SSE).
+    Здесь только обёртка над send: время фиксируется на http.response.start — для обычного ответа это
+    время обработки, для SSE — до начала стрима; тело ответа идёт к клиенту напрямую.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        response_started = False
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                elapsed = time.perf_counter() - started
+                MutableHeaders(scope=message).append(PROCESS_TIME_HEADER, str(elapsed))
+                self._observe(scope, message["status"], elapsed)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception:
+            # ответ 500 отправит ServerErrorMiddleware снаружи — учитываем его здесь
+            if not response_started:
+                self._observe(scope, 500, time.perf_counter() - started)
+            raise
+
+    @staticmethod
+    def _observe(scope: Scope, status: int, elapsed: float) -> None:
+        # шаблон маршрута (router кладёт его в scope), а не сам путь — иначе каждый id давал бы свою серию
+        route = scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            elapsed,
+            method=scope["method"],
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Запросы под cProfile, пока включён SlowRequestProfiler (PROFILING_ENABLED или PUT /admin/profiling).
+    Профиль охватывает весь вызов приложения, включая тело ответа; для SSE-маршрутов это весь стрим.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.profiler = SlowRequestProfiler()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profiler = self.profiler
+        if not profiler.enabled or scope["type"] != "http" or not profiler.wants(scope):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        profile = profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await profiler.finish(profile, scope, time.perf_counter() - started)
@@ -0,0 +1,127 @@
+"""
+Накладные расходы middleware замера времени на GET /health и GET /chat/sessions (req/s на одно ядро):
+
+  * none       — без middleware (нижняя граница)
+  * base_http  — прежний @app.middleware("http") add_process_time_header (BaseHTTPMiddleware)
+  * asgi       — rest.middleware.ProcessTimeMiddleware
+
+Приложение вызывается напрямую через ASGI, без сети и uvicorn — видна только разница в обработке.
+Для /chat/sessions авторизация подменена (dependency_overrides), а сессии пользователя —
+синтетические, без БД: сериализация response_model та же, что в проде.
+Запуск из корня проекта: python tools/bench_http_middleware.py --requests 20000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request  # noqa: E402
+
+from core.rate_limit import rate_limited_user  # noqa: E402
+from dal import Database  # noqa: E402
+from rest.Chat.router import ChatAPI  # noqa: E402
+from rest.middleware import ProcessTimeMiddleware  # noqa: E402
+
+
+def make_sessions(n: int):
+    now = datetime.now(timezone.utc)
+    return [
+        SimpleNamespace(id=i, title=f"session {i}", created_at=now, updated_at=now, is_archived=False, last_message=None)
+        for i in range(n)
+    ]
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    if variant == "base_http":
+        @app.middleware("http")
+        async def add_process_time_header(request: Request, call_next):
+            start_time = time.time()
+            response = await call_next(request)
+            response.headers["X-Process-Time"] = str(time.time() - start_time)
+            return response
+    elif variant == "asgi":
+        app.add_middleware(ProcessTimeMiddleware)
+
+    app.include_router(ChatAPI().router)
+    app.dependency_overrides[rate_limited_user] = lambda: SimpleNamespace(id=1, is_admin=False)
+
+    @app.get("/health")
+    async def healthcheck():
+        return {"status": "ok"}
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = 0
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # клиент «не отключается» — как у живого соединения
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(app: FastAPI, path: str, requests: int, concurrency: int) -> float:
+    per_worker = requests // concurrency
+
+    async def worker():
+        for _ in range(per_worker):
+            assert await call(app, path) == 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=20)
+    args = parser.parse_args()
+
+    sessions = make_sessions(args.sessions)
+
+    async def get_user_sessions(user_id, limit=20, offset=0):
+        return sessions[offset:offset + limit]
+
+    Database.ChatService.get_user_sessions = get_user_sessions
+
+    apps = {variant: build_app(variant) for variant in ("none", "base_http", "asgi")}
+    for path in ("/health", "/chat/sessions"):
+        print(f"GET {path}  ({args.requests} requests, concurrency {args.concurrency})")
+        results = {}
+        for variant, app in apps.items():
+            await run(app, path, min(args.requests, 1000), args.concurrency)  # прогрев
+            results[variant] = await run(app, path, args.requests, args.concurrency)
+        for variant, rps in results.items():
+            print(f"  {variant:<10} {rps:>9.0f} req/s  ({rps / results['none'] * 100:5.1f}% of none)")
+        print(f"  asgi vs base_http: x{results['asgi'] / results['base_http']:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Размер LlmChatRequest в Kafka (байты model_dump_json) на ход диалога:
+
+  * full  — системный промпт текстом + вся обрезанная история (как раньше)
+  * ref   — PROMPT_BY_REFERENCE: вместо промпта system_prompt_id
+  * delta — ref + PROMPT_DELTA_ENABLED: для тёплой сессии только сообщения с прошлого хода
+
+Диалог синтетический, воркер не нужен: ответ ассистента «приходит» сразу.
+Нужен config/.env (импортируется роутер ради SYSTEM_PROMPT и trim_to_budget).
+Запуск из корня проекта: python tools/bench_prompt_payload.py --turns 30
+"""
+import argparse
+import os
+import random
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.llm_schemas import LlmChatRequest, LlmMessage  # noqa: E402
+from rest.Chat.router import SYSTEM_PROMPT, SYSTEM_PROMPT_TEMPLATE, trim_to_budget  # noqa: E402
+from rest.Chat.session_context import SessionContextTracker  # noqa: E402
+
+WORDS = "kafka postgres индекс запрос ответ модель токен сессия пользователь стрим партиция воркер".split()
+
+
+def sentence(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def request_bytes(messages, system_prompt_id=None, context=None) -> int:
+    req = LlmChatRequest(
+        chat_session_id=1,
+        user_id=1,
+        messages=messages,
+        system_prompt_id=system_prompt_id,
+        context=context,
+        model="Qwen/Qwen2.5-0.5B-Instruct",
+        max_tokens=64,
+        temperature=0.5,
+        top_p=0.9,
+    )
+    return len(req.model_dump_json().encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--context-tokens", type=int, default=1280)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tracker = SessionContextTracker()
+    tracker.enabled = True
+    template_id = SYSTEM_PROMPT_TEMPLATE.template_id
+
+    history: list[LlmMessage] = []
+    totals = {"full": 0, "ref": 0, "delta": 0}
+    print(f"{'turn':>4} {'full':>8} {'ref':>8} {'delta':>8}  mode")
+    for turn in range(1, args.turns + 1):
+        history.append(LlmMessage(role="user", content=sentence(rng, rng.randint(5, 30))))
+        trimmed = trim_to_budget([LlmMessage(role="system", content=SYSTEM_PROMPT)] + history, args.context_tokens)
+        by_ref = trimmed[1:]
+
+        full = request_bytes(trimmed)
+        ref = request_bytes(by_ref, system_prompt_id=template_id)
+
+        request_id = str(uuid.uuid4())
+        context, tail = tracker.split(1, by_ref, template_id)
+        tracker.begin(1, request_id, by_ref, template_id)
+        delta = request_bytes(tail, system_prompt_id=template_id, context=context)
+
+        reply = sentence(rng, rng.randint(20, 60))
+        history.append(LlmMessage(role="assistant", content=reply))
+        tracker.complete(request_id, reply)
+
+        totals["full"] += full
+        totals["ref"] += ref
+        totals["delta"] += delta
+        print(f"{turn:>4} {full:>8} {ref:>8} {delta:>8}  {'delta' if context else 'full'}")
+
+    n = args.turns
+    print()
+    print(f"avg bytes/request: full={totals['full'] // n}  ref={totals['ref'] // n}  delta={totals['delta'] // n}")
+    print(f"vs full: ref x{totals['full'] / totals['ref']:.1f}, delta x{totals['full'] / totals['delta']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Бенчмарк полнотекстового поиска по messages на засеянной таблице в несколько миллионов строк.
+
+Сравниваем планы и время:
+  * ILIKE '%слово%' по messages.content (seq scan)
+  * search_vector @@ websearch_to_tsquery(...) + ts_rank_cd (GIN-индекс ix_messages_search_vector)
+
+Нужна настроенная БД (config/.env). Скрипт создаёт недостающие таблицы, засевает данные
+под отдельного пользователя и по умолчанию удаляет их в конце (--keep — оставить).
+
+Запуск из корня проекта:
+    python tools/bench_search.py --sessions 2000 --per-session 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from dal.DAO import DAO  # noqa: E402
+from dal.schema import Base  # noqa: E402
+from dal.schema.Entity.BackendSchema import FTS_CONFIG  # noqa: E402
+
+WORDS = (
+    "kafka postgres индекс запрос ответ модель токен сессия пользователь стрим "
+    "python fastapi docker деплой ошибка таймаут кэш очередь воркер партиция "
+    "дедлайн релиз тест бенчмарк профиль латентность память диск сеть логин "
+    "погода рецепт стих книга фильм музыка путешествие кофе чай кот собака"
+).split()
+
+QUERIES = ("кот", "kafka таймаут", '"очередь воркер"', "рецепт -кофе")
+
+
+def _random_content_sql(n_words: int = 24) -> str:
+    words = "ARRAY[" + ",".join(f"'{w}'" for w in WORDS) + "]"
+    picks = [f"({words})[1 + floor(random() * {len(WORDS)})::int]" for _ in range(n_words)]
+    return " || ' ' || ".join(picks)
+
+
+async def seed(conn, user_id: int, sessions: int, per_session: int) -> None:
+    await conn.execute(text(
+        "INSERT INTO chat_sessions (user_id, title, model_name, temperature, max_tokens, "
+        "created_at, updated_at, is_archived) "
+        "SELECT :uid, 'bench ' || g, 'gemma-3', 0.7, 1024, now(), now(), false "
+        "FROM generate_series(1, :sessions) g"
+    ), {"uid": user_id, "sessions": sessions})
+
+    await conn.execute(text(
+        "INSERT INTO messages (session_id, role, content, created_at, is_visible) "
+        "SELECT s.id, "
+        "CASE WHEN g % 2 = 0 THEN 'USER'::messagerole ELSE 'ASSISTANT'::messagerole END, "
+        f"{_random_content_sql()}, "
+        "now() - make_interval(secs => g), true "
+        "FROM chat_sessions s, generate_series(1, :per_session) g "
+        "WHERE s.user_id = :uid"
+    ), {"uid": user_id, "per_session": per_session})
+    await conn.execute(text("ANALYZE messages"))
+
+
+async def timed(conn, sql: str, params: dict) -> tuple[float, str]:
+    plan_rows = (await conn.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + sql), params)).all()
+    plan = "\n".join(r[0] for r in plan_rows)
+    started = time.perf_counter()
+    await conn.execute(text(sql), params)
+    return time.perf_counter() - started, plan
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--per-session", type=int, default=1000)
+    parser.add_argument("--keep", action="store_true", help="не удалять засеянные данные")
+    parser.add_argument("--plans", action="store_true", help="печатать EXPLAIN ANALYZE")
+    args = parser.parse_args()
+
+    engine = DAO().db_engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    login = f"bench-fts-{uuid.uuid4().hex[:8]}"
+    async with engine.begin() as conn:
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (login, hashed_password, is_active, is_admin, created_at, updated_at) "
+            "VALUES (:login, '-', true, false, now(), now()) RETURNING id"
+        ), {"login": login})).scalar_one()
+
+        started = time.perf_counter()
+        await seed(conn, user_id, args.sessions, args.per_session)
+        total = args.sessions * args.per_session
+        print(f"seeded {total:,} messages in {time.perf_counter() - started:.1f}s (user_id={user_id})")
+
+    ilike_sql = (
+        "SELECT m.id, m.session_id FROM messages m JOIN chat_sessions s ON s.id = m.session_id "
+        "WHERE s.user_id = :uid AND m.content ILIKE :pattern "
+        "ORDER BY m.id DESC LIMIT 20"
+    )
+    fts_sql = (
+        "SELECT m.id, m.session_id, ts_rank_cd(m.search_vector, q) AS rank "
+        f"FROM messages m JOIN chat_sessions s ON s.id = m.session_id, "
+        f"websearch_to_tsquery('{FTS_CONFIG}', :query) q "
+        "WHERE s.user_id = :uid AND m.is_visible AND m.search_vector @@ q "
+        "ORDER BY rank DESC, m.id DESC LIMIT 20"
+    )
+
+    try:
+        async with engine.connect() as conn:
+            for query in QUERIES:
+                first_word = query.strip('"-').split()[0]
+                ilike_s, ilike_plan = await timed(conn, ilike_sql, {"uid": user_id, "pattern": f"%{first_word}%"})
+                fts_s, fts_plan = await timed(conn, fts_sql, {"uid": user_id, "query": query})
+                print(f"{query!r:>22}: ILIKE {ilike_s * 1000:9.1f} ms | FTS(GIN) {fts_s * 1000:9.1f} ms")
+                if args.plans:
+                    print(ilike_plan, "\n", fts_plan, "\n", sep="")
+    finally:
+        if not args.keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(
+                    "DELETE FROM messages WHERE session_id IN (SELECT id FROM chat_sessions WHERE user_id = :uid)"
+                ), {"uid": user_id})
+                await conn.execute(text("DELETE FROM chat_sessions WHERE user_id = :uid"), {"uid": user_id})
+                await conn.execute(text("DELETE FROM users WHERE id = :uid"), {"uid": user_id})
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+Бенчмарк сериализации GET /chat/sessions/{id} на сессиях с 1k / 10k сообщений.
+
+Сравниваем:
+  * стандартный путь FastAPI: ORM-объект -> валидация response_model (from_attributes)
+    -> jsonable_encoder -> json.dumps (JSONResponse)
+  * быстрый путь: строки SQL (кортежи) -> orjson-байты (rest.Chat.fast_json)
+
+БД не нужна: строки и «ORM-объекты» генерируются синтетически.
+Запуск из корня проекта: python tools/bench_serialization.py
+"""
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from rest.Chat.fast_json import encode_session_with_messages  # noqa: E402
+from rest.Chat.schemas import ChatSessionWithMessages, MessageRole  # noqa: E402
+
+SessionRow = namedtuple(
+    "SessionRow",
+    "id user_id title model_name temperature max_tokens extra_params created_at updated_at is_archived messages_archived",
+)
+MessageRow = namedtuple(
+    "MessageRow",
+    "id session_id role content created_at prompt_tokens completion_tokens latency_ms finish_reason request_id meta is_visible",
+)
+
+
+def make_rows(n_messages: int):
+    now = datetime.now(timezone.utc)
+    session_row = SessionRow(1, 1, "bench", "gemma-3", 0.7, 1024, None, now, now, False, False)
+    message_rows = []
+    for i in range(n_messages):
+        is_user = i % 2 == 0
+        message_rows.append(MessageRow(
+            id=i + 1,
+            session_id=1,
+            role=MessageRole.user if is_user else MessageRole.assistant,
+            content=("Вопрос пользователя номер %d " % i) * 4 if is_user else ("Ответ модели %d. " % i) * 20,
+            created_at=now + timedelta(seconds=i),
+            prompt_tokens=None if is_user else 120,
+            completion_tokens=None if is_user else 64,
+            latency_ms=None if is_user else 850,
+            finish_reason=None if is_user else "stop",
+            request_id=None if is_user else "5f0c6c1e-9c1d-4d5b-9a55-2d3c1c7e8f00",
+            meta=None if is_user else {"chat_session_id": "1", "last_index": 63},
+            is_visible=True,
+        ))
+    return session_row, message_rows
+
+
+def make_orm(session_row, message_rows):
+    session = SimpleNamespace(**session_row._asdict())
+    session.messages = [SimpleNamespace(**row._asdict()) for row in message_rows]
+    return session
+
+
+def fastapi_default_path(orm_session) -> bytes:
+    validated = ChatSessionWithMessages.model_validate(orm_session, from_attributes=True)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fast_path(session_row, message_rows) -> bytes:
+    return encode_session_with_messages(session_row, message_rows)
+
+
+def bench(fn, *args, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    for n in (1_000, 10_000):
+        session_row, message_rows = make_rows(n)
+        orm_session = make_orm(session_row, message_rows)
+
+        # оба пути должны давать один и тот же документ
+        assert json.loads(fastapi_default_path(orm_session)) == json.loads(fast_path(session_row, message_rows))
+
+        default_s = bench(fastapi_default_path, orm_session)
+        fast_s = bench(fast_path, session_row, message_rows)
+        print(
+            f"{n:>6} messages: default {default_s * 1000:8.2f} ms | "
+            f"fast {fast_s * 1000:8.2f} ms | x{default_s / fast_s:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
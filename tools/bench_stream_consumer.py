@@ -0,0 +1,104 @@
+"""
+Пропускная способность KafkaLlmStreamConsumer на не-финальных чанках (чанков/с на одно ядро):
+
+  * per-record — прежний путь: на каждую запись decode + hub.append_text + hub.publish
+  * batched    — process_records(): пачка getmany() одной партиции, чанки склеиваются
+                 по request_id и уходят в hub одним append_chunk
+
+Kafka и БД не нужны: записи кодируются заранее, у каждой генерации один SSE-подписчик (очередь).
+Запуск из корня проекта: python tools/bench_stream_consumer.py --streams 50 --chunks 200000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiokafka import AIOKafkaConsumer  # noqa: E402
+
+from core.llm_schemas import LlmStreamChunk  # noqa: E402
+from core.wire_format import WireFormat, decode_chunk_view, encode  # noqa: E402
+from rest.Chat.kafka_stream_consumer import KafkaLlmStreamConsumer  # noqa: E402
+from rest.Chat.stream_hub import StreamHub  # noqa: E402
+
+
+async def setup_hub(request_ids):
+    hub = StreamHub()
+    queues = []
+    for request_id in request_ids:
+        await hub.register(request_id=request_id, session_id=1, user_id=1)
+        q = asyncio.Queue()
+        hub._subs[request_id] = [q]
+        queues.append(q)
+    return hub, queues
+
+
+def drain(queues):
+    for q in queues:
+        while not q.empty():
+            q.get_nowait()
+
+
+async def per_record(hub, records):
+    for msg in records:
+        view = decode_chunk_view(msg.value, msg.headers)
+        if view.delta and await hub.append_text(view.request_id, view.delta):
+            await hub.publish(view.request_id, {"type": "chunk", "delta": view.delta, "index": view.index})
+
+
+logging.basicConfig(level=logging.WARNING)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    request_ids = [str(uuid.uuid4()) for _ in range(args.streams)]
+    # генерации идут одновременно — чанки в партиции перемешаны
+    records = []
+    for i in range(args.chunks):
+        chunk = LlmStreamChunk(
+            request_id=request_ids[i % args.streams],
+            chat_session_id=1,
+            index=i // args.streams,
+            delta=" токен",
+        )
+        value, headers = encode(chunk, WireFormat.JSON)
+        records.append(SimpleNamespace(topic="llm.chat.token", partition=0, value=value, headers=headers))
+    batches = [records[i:i + args.batch] for i in range(0, len(records), args.batch)]
+
+    hub, queues = await setup_hub(request_ids)
+    consumer = KafkaLlmStreamConsumer(
+        bootstrap_servers="localhost:9092",
+        topic="llm.chat.token",
+        group_id="bench",
+        logger=logging.getLogger("bench"),
+        hub=hub,
+        database=None,
+    )
+
+    for name, run in (
+        ("per-record", lambda batch: per_record(hub, batch)),
+        ("batched", consumer.process_records),
+    ):
+        started = time.perf_counter()
+        for batch in batches:
+            await run(batch)
+            drain(queues)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<11} {len(records) / elapsed:>12,.0f} chunks/s")
+
+    # consumer не запускался (start()), закрываем только клиент
+    await AIOKafkaConsumer.stop(consumer)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""
+Пропускная способность декодирования LlmStreamChunk (чанков/с на одно ядро) и размер записи
+для форматов core.wire_format:
+
+  * json-legacy — прежний путь ConsumerBase: bytes.decode('utf-8') -> model_validate_json
+  * json / msgpack / struct — core.wire_format.decode по заголовку content-type (полная модель)
+  * *-view — core.wire_format.decode_chunk_view: лёгкий путь consumer'а для не-финальных чанков
+
+Kafka не нужна: записи кодируются заранее, меряется только декодирование.
+Запуск из корня проекта: python tools/bench_wire_format.py --chunks 200000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.llm_schemas import LlmStreamChunk  # noqa: E402
+from core.wire_format import WireFormat, decode, decode_chunk_view, encode  # noqa: E402
+
+
+def make_chunks(n: int):
+    request_id = uuid.uuid4()
+    return [
+        LlmStreamChunk(request_id=request_id, chat_session_id=42, index=i, delta=" токен")
+        for i in range(n)
+    ]
+
+
+def bench(name, records, fn):
+    started = time.perf_counter()
+    for value, headers in records:
+        fn(value, headers)
+    elapsed = time.perf_counter() - started
+    size = sum(len(value) for value, _ in records) / len(records)
+    print(f"{name:<18} {len(records) / elapsed:>12,.0f} chunks/s   {size:>6.1f} B/chunk")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200_000)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+
+    for wire_format in WireFormat:
+        records = [encode(c, wire_format) for c in chunks]
+        # контроль: декодирование возвращает исходные чанки
+        assert decode(LlmStreamChunk, *records[-1]) == chunks[-1]
+        assert decode_chunk_view(*records[-1]).request_id == str(chunks[-1].request_id)
+
+        if wire_format is WireFormat.JSON:
+            bench("json-legacy", records, lambda v, h: LlmStreamChunk.model_validate_json(v.decode("utf-8")))
+        bench(wire_format.name.lower(), records, lambda v, h: decode(LlmStreamChunk, v, h))
+        bench(f"{wire_format.name.lower()}-view", records, decode_chunk_view)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Возврат записей из DLQ (dlq_tasks) в исходные топики.
+
+Запись публикуется в dlq-original-topic с исходными key/value/заголовками и увеличенным
+dlq-retry-count. Записи, которые уже возвращались KAFKA_DLQ_MAX_RETRIES раз, пропускаются
+(--force — вернуть всё равно). Прочитанное коммитится группой --group, поэтому повторный запуск
+продолжит с места остановки; --dry-run ничего не публикует и не коммитит.
+Отфильтрованные (--topic/--error-type) записи тоже считаются прочитанными этой группой —
+для другого среза DLQ запускайте с другим --group (новая группа читает DLQ с начала).
+
+Нужен config/.env (KAFKA_SERVERS). Запуск из корня проекта:
+    python tools/dlq_replay.py --dry-run
+    python tools/dlq_replay.py --topic llm.chat.token --error-type DecodeError --limit 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiokafka import AIOKafkaConsumer  # noqa: E402
+
+from config.settings import Settings  # noqa: E402
+from core.dlq import (  # noqa: E402
+    DLQ_ERROR,
+    DLQ_ERROR_TYPE,
+    DLQ_ORIGINAL_TOPIC,
+    DLQ_RETRY_COUNT,
+    DLQ_TOPIC,
+    header_value,
+    retry_count,
+)
+from core.producer import ProducerBase  # noqa: E402
+
+
+def replay_headers(headers, retries: int):
+    # служебные dlq-* заголовки снимаем, исходные (content-type и т.п.) оставляем
+    kept = [(k, v) for k, v in headers or () if not k.startswith("dlq-")]
+    return kept + [(DLQ_RETRY_COUNT, str(retries + 1).encode("ascii"))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topic", help="вернуть только записи из этого исходного топика")
+    parser.add_argument("--error-type", help="вернуть только записи с этим dlq-error-type")
+    parser.add_argument("--limit", type=int, default=0, help="максимум возвращаемых записей (0 — все)")
+    parser.add_argument("--group", default="dlq-replay")
+    parser.add_argument("--force", action="store_true", help="игнорировать KAFKA_DLQ_MAX_RETRIES")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    max_retries = Settings.KAFKA_DLQ_MAX_RETRIES()
+    consumer = AIOKafkaConsumer(
+        DLQ_TOPIC,
+        bootstrap_servers=Settings.KAFKA_SERVERS(),
+        group_id=args.group,
+        enable_auto_commit=False,
+        auto_offset_reset="earliest",
+    )
+    producer = ProducerBase()
+    await consumer.start()
+    if not args.dry_run:
+        await producer.start()
+
+    stats = Counter()
+    try:
+        done = False
+        while not done:
+            # пустой ответ — DLQ дочитан до конца
+            batch = await consumer.getmany(timeout_ms=2000, max_records=500)
+            if not batch:
+                break
+            # коммитим только разобранные записи: остаток пачки после --limit достанется следующему запуску
+            processed = {}
+            for tp, records in batch.items():
+                for record in records:
+                    if args.limit and stats["replayed"] >= args.limit:
+                        done = True
+                        break
+                    processed[tp] = record.offset + 1
+                    topic = header_value(record.headers, DLQ_ORIGINAL_TOPIC)
+                    error_type = header_value(record.headers, DLQ_ERROR_TYPE)
+                    if topic is None or (args.topic and topic != args.topic) \
+                            or (args.error_type and error_type != args.error_type):
+                        stats["filtered"] += 1
+                        continue
+
+                    retries = retry_count(record.headers)
+                    if retries >= max_retries and not args.force:
+                        stats["exhausted"] += 1
+                        continue
+
+                    print(f"{topic} <- {record.partition}@{record.offset} retry={retries + 1} "
+                          f"{error_type}: {header_value(record.headers, DLQ_ERROR)}")
+                    if not args.dry_run:
+                        await producer.send_raw(
+                            topic,
+                            value=record.value or b"",
+                            key=record.key,
+                            headers=replay_headers(record.headers, retries),
+                        )
+                    stats["replayed"] += 1
+
+            if processed and not args.dry_run:
+                await consumer.commit(processed)
+    finally:
+        await consumer.stop()
+        await producer.stop()
+
+    print(f"replayed={stats['replayed']} filtered={stats['filtered']} "
+          f"exhausted={stats['exhausted']}{' (dry run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())